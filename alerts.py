@@ -0,0 +1,205 @@
+"""
+Budget alerts of a BudgetBits user.
+
+An alert is raised when an expense entry makes the spending of the current
+budget period cross a threshold:
+    budget: a percentage of the monthly budget (50, 80 and 100 by default)
+    category: the same percentages of the limit set for a category
+    pace: the spending of a day over `pace` times the daily pace (the
+        monthly budget spread over the days of the month)
+An entry refused because it would exceed the budget raises a "refused" alert.
+
+Every check compares the running totals before and after the entry, so it
+costs O(1) per threshold and never rescans the expenses; a threshold alerts
+once, when it is crossed. The alerts are delivered to sinks, which are any
+callable taking the alert (a dict), e.g. TerminalSink, LogSink or WebhookSink;
+a sink that fails is reported to stderr and skipped.
+"""
+from datetime import datetime
+import calendar
+import json
+import sys
+import os
+
+THRESHOLDS = (50, 80, 100)
+
+
+class BudgetAlerts:
+    def __init__(self, thresholds=THRESHOLDS, category_limits: dict = None, pace: float = None,
+                 sinks: list = None) -> None:
+        """
+        BudgetAlerts: the alert thresholds of a user, and where alerts go.
+
+        Args:
+            thresholds (iterable): the percentages of the budget (and of the
+                category limits) to alert at
+            category_limits (dict): the monthly limit of some categories
+            pace (float, optional): alert when a day's spending is over this
+                many times the daily pace
+            sinks (list, optional): the callables the alerts are delivered to
+
+        Raises:
+            ValueError: If a threshold, limit or pace is not valid.
+        """
+        self.thresholds = sorted(set(thresholds))
+        if not all(isinstance(threshold, int) and threshold > 0 for threshold in self.thresholds):
+            raise ValueError("A threshold must be a positive percentage.")
+        self.category_limits = dict(category_limits or {})
+        if not all(isinstance(limit, int) and limit > 0 for limit in self.category_limits.values()):
+            raise ValueError("A category limit must be a positive amount.")
+        if pace is not None and pace <= 0:
+            raise ValueError(f"{pace} is not a valid pace.")
+        self.pace = pace
+        self.sinks = list(sinks or [])
+
+    @staticmethod
+    def daily_pace(user) -> float:
+        """Return the monthly budget spread over the days of the current period."""
+        year, month = int(user.last_updated[:4]), int(user.last_updated[5:7])
+        return user.monthly_budget / calendar.monthrange(year, month)[1]
+
+    def crossed(self, before: int, after: int, limit: int) -> list:
+        """Return the thresholds (percentages of a limit) crossed between two totals."""
+        return [threshold for threshold in self.thresholds
+                if before * 100 < threshold * limit <= after * 100]
+
+    def check(self, user, category: str, date: str, amount: int) -> list:
+        """
+        Check the thresholds after an expense entry was recorded.
+
+        Args:
+            user (BudgetBits): The user, with the entry in its running totals.
+            category (str): The category of the expense.
+            date (str): The ISO date of the expense.
+            amount (int): The amount of the expense.
+
+        Returns:
+            list: The alerts raised (and delivered).
+        """
+        period = user.last_updated
+        if not date.startswith(period):
+            return []
+
+        alerts = []
+        spent = user.total_expenses(month=period)
+        for threshold in self.crossed(spent - amount, spent, user.monthly_budget):
+            alerts.append(self.alert(
+                "budget", user, date, category, threshold, spent, user.monthly_budget,
+                f"You've spent {threshold}% of your ₱{user.monthly_budget:,} budget for {period} (₱{spent:,})."))
+
+        if (limit := self.category_limits.get(category)) is not None:
+            spent = user.total_expenses(category, month=period)
+            for threshold in self.crossed(spent - amount, spent, limit):
+                alerts.append(self.alert(
+                    "category", user, date, category, threshold, spent, limit,
+                    f"You've spent {threshold}% of your ₱{limit:,} {category} limit for {period} (₱{spent:,})."))
+
+        if self.pace is not None:
+            daily = self.daily_pace(user)
+            spent = user.total_expenses(date=date)
+            if spent - amount <= self.pace * daily < spent:
+                alerts.append(self.alert(
+                    "pace", user, date, category, self.pace, spent, round(self.pace * daily),
+                    f"You've spent ₱{spent:,} on {date}, over {self.pace:g}x your daily pace of ₱{daily:,.0f}."))
+
+        self.deliver(alerts)
+        return alerts
+
+    def refused(self, user, category: str, date: str, amount: int) -> list:
+        """Raise the alert of an expense entry refused for exceeding the budget."""
+        spent = user.total_expenses(month=user.last_updated)
+        alerts = [self.alert(
+            "refused", user, date, category, 100, spent + amount, user.monthly_budget,
+            f"An expense of ₱{amount:,} was refused: it exceeds your ₱{user.monthly_budget:,} budget"
+            f" for {user.last_updated} (₱{user.remaining_balance:,} left).")]
+        self.deliver(alerts)
+        return alerts
+
+    @staticmethod
+    def alert(kind: str, user, date: str, category: str, threshold, spent: int, limit: int, message: str) -> dict:
+        """Return an alert."""
+        return {"kind": kind, "username": user.username, "period": user.last_updated, "date": date,
+                "category": category, "threshold": threshold, "spent": spent, "limit": limit,
+                "message": message}
+
+    def deliver(self, alerts: list) -> None:
+        """
+        Deliver alerts to every sink.
+
+        A failing sink never fails the expense entry (which is already
+        recorded) nor keeps the other sinks from the alert: the error is
+        reported to stderr.
+        """
+        for alert in alerts:
+            for sink in self.sinks:
+                try:
+                    sink(alert)
+                except Exception as error:
+                    name = getattr(sink, "__name__", type(sink).__name__)
+                    print(f"Alert sink {name} failed: {error!r}", file=sys.stderr)
+
+    def to_dict(self) -> dict:
+        """Return the thresholds in their saved (json) shape."""
+        return {"thresholds": self.thresholds, "category_limits": self.category_limits, "pace": self.pace}
+
+    @classmethod
+    def from_dict(cls, data: dict = None):
+        """Rebuild saved thresholds (the default ones if there are none)."""
+        data = data or {}
+        return cls(data.get("thresholds", THRESHOLDS), data.get("category_limits"), data.get("pace"))
+
+
+class TerminalSink:
+    def __init__(self, file=None) -> None:
+        """TerminalSink: print the alerts (to stdout by default)."""
+        self.file = file
+
+    def __call__(self, alert: dict) -> None:
+        print(f"\n[!] {alert['message']}", file=self.file or sys.stdout)
+
+
+class LogSink:
+    def __init__(self, path: str) -> None:
+        """LogSink: append the alerts to a json lines file, with the time they were raised."""
+        self.path = path
+
+    def __call__(self, alert: dict) -> None:
+        with open(self.path, 'a', encoding='utf-8') as file:
+            file.write(json.dumps(dict(alert, time=datetime.now().isoformat(timespec="seconds"))) + "\n")
+
+
+class WebhookSink:
+    def __init__(self, url: str, timeout: float = 2.0) -> None:
+        """
+        WebhookSink: POST the alerts as json to a URL.
+
+        A webhook that cannot be reached never fails the expense entry:
+        the error is reported to stderr.
+        """
+        self.url = url
+        self.timeout = timeout
+
+    def __call__(self, alert: dict) -> None:
+        # urllib.request (http.client, ssl, email) is only imported by a webhook
+        from urllib.request import Request, urlopen
+
+        request = Request(self.url, data=json.dumps(alert).encode(), method="POST",
+                          headers={"Content-Type": "application/json"})
+        try:
+            with urlopen(request, timeout=self.timeout):
+                pass
+        except OSError as error:
+            print(f"Alert webhook {self.url} failed: {error}", file=sys.stderr)
+
+
+def environment_sinks() -> list:
+    """
+    Return the sinks set by the environment: BUDGETBITS_ALERT_LOG (a json
+    lines file) and BUDGETBITS_ALERT_WEBHOOK (a URL).
+    """
+    sinks = []
+    if path := os.environ.get("BUDGETBITS_ALERT_LOG"):
+        sinks.append(LogSink(path))
+    if url := os.environ.get("BUDGETBITS_ALERT_WEBHOOK"):
+        sinks.append(WebhookSink(url))
+    return sinks
@@ -0,0 +1,215 @@
+"""
+Spending analytics of a BudgetBits user: monthly trends, category shares,
+moving averages and an end-of-month forecast.
+
+The expenses are turned into arrays once, then every figure is computed over
+the arrays, with NumPy when it is installed and in pure Python otherwise.
+"""
+from expenses import to_iso
+from datetime import date
+import calendar
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def month_code(ordinal: int) -> int:
+    """Return year * 12 + (month - 1) of a date ordinal."""
+    day = date.fromordinal(ordinal)
+    return day.year * 12 + day.month - 1
+
+
+def month_name(code: int) -> str:
+    """Return the YYYY-MM of a month code."""
+    return f"{code // 12}-{code % 12 + 1:02d}"
+
+
+class Analytics:
+    def __init__(self, user, use_numpy: bool = True) -> None:
+        """
+        Analytics: the spending figures of a user.
+
+        Args:
+            user (BudgetBits): The BudgetBits instance of the user.
+            use_numpy (bool): Use NumPy if it is installed.
+        """
+        store = user.store
+        self.user = user
+        self.category_names = list(store.category_names)
+        self.numpy = bool(use_numpy and np is not None)
+
+        # the month of every distinct date is only computed once
+        months = {ordinal: month_code(ordinal) for ordinal in set(store.dates)}
+
+        # copies: a view of the store's arrays would keep them from growing
+        if self.numpy:
+            self.amounts = np.array(store.amounts, dtype=np.int64)
+            self.dates = np.array(store.dates, dtype=np.int64)
+            self.categories = np.array(store.categories, dtype=np.int64)
+            self.months = np.array([months[ordinal] for ordinal in store.dates], dtype=np.int64)
+        else:
+            self.amounts = store.amounts[:]
+            self.dates = store.dates[:]
+            self.categories = store.categories[:]
+            self.months = [months[ordinal] for ordinal in store.dates]
+
+    def __len__(self) -> int:
+        return len(self.amounts)
+
+    @staticmethod
+    def _sum_by(keys, amounts, mask=None) -> dict:
+        """Return the sum of the amounts by key."""
+        if np is not None and isinstance(keys, np.ndarray):
+            if mask is not None:
+                keys, amounts = keys[mask], amounts[mask]
+            if not len(keys):
+                return {}
+            unique, inverse = np.unique(keys, return_inverse=True)
+            sums = np.bincount(inverse, weights=amounts)
+            return {int(key): int(total) for key, total in zip(unique, sums)}
+
+        totals = {}
+        for i, key in enumerate(keys):
+            if mask is None or mask[i]:
+                totals[key] = totals.get(key, 0) + amounts[i]
+        return totals
+
+    def monthly_trend(self, months: int = 12) -> list:
+        """
+        Return the total of each of the last months that have expenses.
+
+        Returns:
+            list: (YYYY-MM, total) tuples, oldest first.
+        """
+        totals = self._sum_by(self.months, self.amounts)
+        return [(month_name(code), totals[code]) for code in sorted(totals)[-months:]]
+
+    def category_shares(self, month: str = None) -> list:
+        """
+        Return the total and share of every category, largest first.
+
+        Args:
+            month (str): only this month (YYYY-MM), all of them if not given.
+
+        Returns:
+            list: (category, total, share) tuples, where share is between 0 and 1.
+        """
+        mask = None
+        if month is not None:
+            code = int(month[:4]) * 12 + int(month[5:7]) - 1
+            if self.numpy:
+                mask = self.months == code
+            else:
+                mask = [value == code for value in self.months]
+
+        totals = self._sum_by(self.categories, self.amounts, mask)
+        overall = sum(totals.values()) or 1
+        shares = [(self.category_names[category], total, total / overall)
+                  for category, total in totals.items()]
+        return sorted(shares, key=lambda share: -share[1])
+
+    def daily_totals(self, start: int, end: int) -> list:
+        """Return the total of every day between two ordinals (inclusive)."""
+        days = end - start + 1
+        if self.numpy:
+            mask = (self.dates >= start) & (self.dates <= end)
+            totals = np.bincount(self.dates[mask] - start, weights=self.amounts[mask], minlength=days)
+            return [int(total) for total in totals]
+
+        totals = [0] * days
+        for ordinal, amount in zip(self.dates, self.amounts):
+            if start <= ordinal <= end:
+                totals[ordinal - start] += amount
+        return totals
+
+    def moving_average(self, window: int = 7, days: int = 30, today: str = None) -> list:
+        """
+        Return the daily totals of the last days and their moving average.
+
+        Args:
+            window (int): The number of days of the average.
+            days (int): The number of days to return.
+            today (str): The last ISO date, the user's date if not given.
+
+        Returns:
+            list: (date, total, average) tuples, oldest first.
+        """
+        end = date.fromisoformat(today or self.user.date).toordinal()
+        start = end - days - window + 2
+        totals = self.daily_totals(start, end)
+
+        if self.numpy:
+            sums = np.convolve(totals, np.ones(window), mode="valid")
+        else:
+            sums, running = [], sum(totals[:window - 1])
+            for i in range(window - 1, len(totals)):
+                running += totals[i]
+                sums.append(running)
+                running -= totals[i - window + 1]
+
+        return [(to_iso(start + window - 1 + i), totals[window - 1 + i], float(sums[i]) / window)
+                for i in range(days)]
+
+    def forecast(self, today: str = None) -> dict:
+        """
+        Forecast the expenses of the whole month from its daily pace so far.
+
+        Args:
+            today (str): The ISO date, the user's date if not given.
+
+        Returns:
+            dict: The month, days elapsed, spent so far, forecast total,
+                budget and forecast remaining balance.
+        """
+        day = date.fromisoformat(today or self.user.date)
+        first = day.replace(day=1).toordinal()
+        spent = sum(self.daily_totals(first, day.toordinal()))
+        days_in_month = calendar.monthrange(day.year, day.month)[1]
+        projected = round(spent / day.day * days_in_month)
+
+        summary = self.user.period_summary(day.isoformat()[:7])
+        return {
+            "month": day.isoformat()[:7],
+            "days_elapsed": day.day,
+            "days_in_month": days_in_month,
+            "spent": spent,
+            "forecast": projected,
+            "budget": summary["budget"],
+            "forecast_remaining": summary["budget"] - projected,
+        }
+
+    def report(self, months: int = 6, window: int = 7, days: int = 14) -> str:
+        """
+        Render every figure in formatted tables.
+
+        Returns:
+            str: The formatted report.
+        """
+        from tabulate import tabulate
+
+        if not len(self):
+            return "\nYou currently have no recorded expenses to report on."
+
+        trend = tabulate([[month, f"₱{total:,}"] for month, total in self.monthly_trend(months)],
+                         headers=["Month", "Total"], tablefmt="outline")
+
+        month = self.user.date[:7]
+        shares = tabulate([[category, f"₱{total:,}", f"{share:.1%}"]
+                           for category, total, share in self.category_shares(month)],
+                          headers=["Category", f"Total ({month})", "Share"], tablefmt="outline")
+
+        average = tabulate([[day, f"₱{total:,}", f"₱{mean:,.2f}"]
+                            for day, total, mean in self.moving_average(window, days)],
+                           headers=["Date", "Total", f"{window}-day average"], tablefmt="outline")
+
+        forecast = self.forecast()
+        outlook = tabulate([
+            ["SPENT SO FAR:", f"₱{forecast['spent']:,} ({forecast['days_elapsed']}/{forecast['days_in_month']} days)"],
+            ["FORECAST TOTAL:", f"₱{forecast['forecast']:,}"],
+            ["BUDGET:", f"₱{forecast['budget']:,}"],
+            ["FORECAST REMAINING:", f"₱{forecast['forecast_remaining']:,}"],
+        ], headers=["END OF MONTH FORECAST", forecast["month"]], tablefmt="outline")
+
+        return "\n".join([trend, shares, average, outlook])
@@ -0,0 +1,51 @@
+"""
+Opening the account store and looking an account up with many registered accounts.
+
+Usage (from the project directory):
+    python -m benchmarks.bench_accounts [--accounts 1000000] [--lookups 1000]
+"""
+import tempfile
+import argparse
+import random
+import time
+import os
+
+from data import AccountStore
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--accounts", type=int, default=1_000_000)
+    parser.add_argument("--lookups", type=int, default=1000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        file_name = os.path.join(directory, "accounts.db")
+        store = AccountStore(file_name)
+        start = time.perf_counter()
+        store.connection.execute("BEGIN")
+        store.connection.executemany(
+            "INSERT INTO accounts (username, password) VALUES (?, ?)",
+            ((f"user{i}", "pbkdf2_sha256$600000$00$00") for i in range(args.accounts)))
+        store.connection.execute("COMMIT")
+        print(f"{args.accounts} accounts inserted in {time.perf_counter() - start:.1f} s")
+        store.close()
+
+        start = time.perf_counter()
+        store = AccountStore(file_name)
+        print(f"open:     {(time.perf_counter() - start) * 1000:>8.3f} ms")
+
+        start = time.perf_counter()
+        assert store.add("new user", "pbkdf2_sha256$600000$00$00")
+        print(f"register: {(time.perf_counter() - start) * 1000:>8.3f} ms")
+
+        usernames = [f"user{random.randrange(args.accounts)}" for _ in range(args.lookups)]
+        start = time.perf_counter()
+        for username in usernames:
+            assert store.get(username) is not None
+        print(f"lookup:   {(time.perf_counter() - start) * 1000 / args.lookups:>8.3f} ms")
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+"""
+Time of the analytics report of a large expense history, with and without NumPy.
+
+Usage (from the project directory):
+    python -m benchmarks.bench_analytics [--transactions 100000]
+"""
+import argparse
+import time
+
+from analytics import Analytics, np
+from project import existing_user
+from benchmarks.common import synthetic_user
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--transactions", type=int, default=100_000)
+    args = parser.parse_args()
+
+    user = existing_user(synthetic_user("user", args.transactions))
+
+    print(f"{args.transactions} transactions")
+    for use_numpy in ([True, False] if np is not None else [False]):
+        start = time.perf_counter()
+        analytics = Analytics(user, use_numpy)
+        converted = time.perf_counter()
+        analytics.report()
+        done = time.perf_counter()
+        print(f"{'numpy' if use_numpy else 'python':>6} | arrays in {(converted - start) * 1000:8.2f} ms"
+              f" | report in {(done - converted) * 1000:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""
+Save time, load time and file size of the data in every on-disk format.
+
+Usage (from the project directory):
+    python -m benchmarks.bench_codecs [--users 1000] [--transactions 200]
+"""
+import tempfile
+import argparse
+import time
+import os
+
+from data import InformationManager
+from serializers import Codec
+from benchmarks.common import synthetic_user
+
+FORMATS = ["json", "json-compact", "json-compact+zlib", "json-compact+gzip",
+           "orjson", "orjson+zlib", "msgpack", "msgpack+zlib"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--transactions", type=int, default=200)
+    args = parser.parse_args()
+
+    data = {f"user{i}": synthetic_user(f"user{i}", args.transactions, seed=i)
+            for i in range(args.users)}
+
+    print(f"{args.users} users x {args.transactions} transactions")
+    print(f"{'format':<20} | {'used':<20} | {'save':>10} | {'load':>10} | {'size':>10}")
+    with tempfile.TemporaryDirectory() as directory:
+        for format in FORMATS:
+            codec = Codec(format)
+            manager = InformationManager(os.path.join(directory, format), codec)
+
+            start = time.perf_counter()
+            manager.save(data)
+            saved = time.perf_counter() - start
+
+            start = time.perf_counter()
+            assert manager.retrieve() == data
+            loaded = time.perf_counter() - start
+
+            size = os.path.getsize(manager.file_name)
+            print(f"{format:<20} | {codec.format:<20} | {saved * 1000:>7.0f} ms"
+                  f" | {loaded * 1000:>7.0f} ms | {size / 2 ** 20:>6.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Cold start (import time) of the BudgetBits modules, as reported by python -X importtime.
+
+Usage (from the project directory):
+    python -m benchmarks.bench_import [--module cli] [--runs 5] [--top 10] [--output FILE.json]
+
+The exit status is 1 if the module imports one of the DEFERRED modules.
+"""
+import subprocess
+import statistics
+import argparse
+import json
+import sys
+
+# only imported by the features that use them, never at start
+DEFERRED = ("pyfiglet", "tabulate", "sqlite3", "urllib.request")
+
+
+def import_times(module: str) -> dict:
+    """
+    Import a module in a fresh interpreter.
+
+    Returns:
+        dict: The cumulative import time (in microseconds) of every imported module.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, check=True)
+
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def eager_imports(module: str) -> list:
+    """Return the DEFERRED modules that importing a module (in a fresh interpreter) imports."""
+    result = subprocess.run(
+        [sys.executable, "-c", f"import sys, {module}; print(*sys.modules)"],
+        capture_output=True, text=True, check=True)
+    imported = set(result.stdout.split())
+    return [name for name in DEFERRED if name in imported]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--module", default="cli")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--output", help="save the results to a json file")
+    args = parser.parse_args()
+
+    runs = [import_times(args.module) for _ in range(args.runs)]
+    medians = {name: statistics.median(run.get(name, 0) for run in runs) for name in runs[0]}
+
+    print(f"import {args.module}: {medians[args.module] / 1000:.1f} ms (median of {args.runs})")
+    for name, cumulative in sorted(medians.items(), key=lambda item: -item[1])[1:args.top + 1]:
+        print(f"  {name:<30} {cumulative / 1000:>8.1f} ms")
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({"module": args.module, "runs": args.runs, "import_us": medians}, file, indent=4)
+
+    if eager := eager_imports(args.module):
+        print(f"import {args.module} imports {', '.join(eager)}, which should be deferred")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
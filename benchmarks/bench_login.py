@@ -0,0 +1,35 @@
+"""
+Login latency at several password hashing work factors, against a latency budget.
+
+Usage (from the project directory):
+    python -m benchmarks.bench_login [--iterations 100000 300000 600000] [--budget-ms 500] [--runs 5]
+"""
+import statistics
+import argparse
+import time
+
+from budgetbits import hash_password, verify_password
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, nargs="+", default=[100_000, 300_000, 600_000])
+    parser.add_argument("--budget-ms", type=float, default=500)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    for iterations in args.iterations:
+        stored = hash_password("correct horse battery staple", iterations)
+        times = []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            assert verify_password("correct horse battery staple", stored)
+            times.append((time.perf_counter() - start) * 1000)
+
+        median = statistics.median(times)
+        verdict = "ok" if median <= args.budget_ms else "OVER BUDGET"
+        print(f"{iterations:>10} iterations | {median:>8.1f} ms per login | {verdict}")
+
+
+if __name__ == "__main__":
+    main()
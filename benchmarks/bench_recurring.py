@@ -0,0 +1,40 @@
+"""
+Catching up the recurring expenses of a user idle for a long time.
+
+Usage (from the project directory):
+    python -m benchmarks.bench_recurring [--rules 1000] [--days 365]
+"""
+import argparse
+import random
+import time
+
+from budgetbits import BudgetBits
+from recurring import RecurringRule
+from datetime import date, timedelta
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rules", type=int, default=1000)
+    parser.add_argument("--days", type=int, default=365)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    start = date(2023, 1, 1)
+    schedules = ["daily", "weekly", "monthly", "cron 1,15 * *", "cron * * 1-5"]
+    rules = [RecurringRule("Bills", rng.randint(1, 50), f"rule {i}", rng.choice(schedules),
+                           (start + timedelta(days=rng.randrange(28))).isoformat()).to_dict()
+             for i in range(args.rules)]
+
+    user = BudgetBits("user", "John", "Doe", 10 ** 12, {}, 10 ** 12, None, recurring=rules)
+    today = (start + timedelta(days=args.days)).isoformat()
+
+    began = time.perf_counter()
+    recorded = user.materialize_recurring(today)
+    seconds = time.perf_counter() - began
+    print(f"{args.rules} rules, {args.days} idle days | {len(recorded)} occurrences recorded"
+          f" in {seconds * 1000:.1f} ms ({seconds / max(len(recorded), 1) * 1e6:.2f} µs each)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Throughput of the fleet rollover job with more and more worker processes.
+
+Usage (from the project directory):
+    python -m benchmarks.bench_rollover [--users 2000] [--transactions 200] [--workers 1 2 4]
+                                        [--storage sharded]
+"""
+import tempfile
+import argparse
+import time
+import os
+
+from data import open_storage
+from rollover import run_rollover
+from benchmarks.common import synthetic_user
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--transactions", type=int, default=200)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--storage", choices=["journal", "sharded", "sqlite"], default="sharded")
+    args = parser.parse_args()
+
+    data = {f"user{i}": synthetic_user(f"user{i}", args.transactions, seed=i) for i in range(args.users)}
+    previous = os.getcwd()
+    baseline = None
+    try:
+        for workers in args.workers:
+            with tempfile.TemporaryDirectory() as directory:
+                os.chdir(directory)
+                os.makedirs("data")
+                info = open_storage(args.storage)
+                info.save(data)
+                if hasattr(info, "close"):
+                    info.close()
+
+                start = time.perf_counter()
+                result = run_rollover("2024-01", storage=args.storage, workers=workers)
+                seconds = time.perf_counter() - start
+                assert result["rolled"] == args.users
+                os.chdir(previous)
+
+            # the speedup is against the first run
+            baseline = baseline or seconds
+            print(f"{workers:>3} workers | {args.users / seconds:>10.0f} users/s"
+                  f" | speedup {baseline / seconds:.2f}x")
+    finally:
+        os.chdir(previous)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+Search latency of the inverted index against a scan of every note.
+
+Usage (from the project directory):
+    python -m benchmarks.bench_search [--transactions 300000] [--runs 20]
+"""
+import statistics
+import tempfile
+import argparse
+import time
+
+from project import existing_user
+from search import IndexStore
+from benchmarks.common import synthetic_user
+
+QUERIES = ["note", "note 42", "note 4*", "leisure note 99*", "bills"]
+
+
+def median_ms(function, runs: int) -> float:
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        function()
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--transactions", type=int, default=300_000)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    user = existing_user(synthetic_user("user", args.transactions))
+    start = time.perf_counter()
+    index = user.index
+    print(f"{args.transactions} transactions | index built in {(time.perf_counter() - start) * 1000:.0f} ms,"
+          f" {len(index)} terms")
+
+    with tempfile.TemporaryDirectory() as directory:
+        indexes = IndexStore(directory)
+        indexes.save("user", index, user.store)
+        start = time.perf_counter()
+        indexes.load("user", user.store)
+        print(f"saved index loaded in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    for query in QUERIES:
+        indexed = median_ms(lambda: index.search(query), args.runs)
+        print(f"{query!r:<20} | {len(index.search(query)):>7} rows | index {indexed:>8.3f} ms")
+
+    scan = median_ms(lambda: list(user.query(notes="note 42")), max(1, args.runs // 5))
+    print(f"{'scan of the notes':<20} | {'':>7}      | query(notes=...) {scan:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
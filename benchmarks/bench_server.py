@@ -0,0 +1,127 @@
+"""
+Load test of the BudgetBits HTTP API: requests per second and latency percentiles.
+
+A server is started on a temporary copy of the data, then every client logs
+in as its own user and sends a mix of expense adds, lists and summaries over
+a keep-alive connection.
+
+Usage (from the project directory):
+    python -m benchmarks.bench_server [--clients 50] [--requests 200] [--storage journal]
+"""
+import subprocess
+import statistics
+import tempfile
+import argparse
+import asyncio
+import socket
+import json
+import time
+import sys
+import os
+
+from benchmarks.common import synthetic_user
+
+PROJECT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+async def request(reader, writer, method: str, target: str, body: dict = None, token: str = None):
+    """Send a request on a keep-alive connection and return (status, payload)."""
+    content = json.dumps(body).encode() if body is not None else b""
+    headers = f"{method} {target} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(content)}\r\n"
+    if token:
+        headers += f"Authorization: Bearer {token}\r\n"
+    writer.write(headers.encode() + b"\r\n" + content)
+    await writer.drain()
+
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while (line := await reader.readline()) != b"\r\n":
+        name, _, value = line.decode().partition(":")
+        if name.lower() == "content-length":
+            length = int(value)
+    return status, json.loads(await reader.readexactly(length))
+
+
+async def client(port: int, username: str, requests: int, latencies: list) -> None:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    _, payload = await request(reader, writer, "POST", "/login",
+                               {"username": username, "password": "password"})
+    token = payload["token"]
+
+    for i in range(requests):
+        start = time.perf_counter()
+        if i % 3 == 0:
+            status, _ = await request(reader, writer, "POST", "/expenses",
+                                      {"category": "Food", "amount": 1, "notes": "load test"}, token)
+        elif i % 3 == 1:
+            status, _ = await request(reader, writer, "GET", "/expenses?limit=20", token=token)
+        else:
+            status, _ = await request(reader, writer, "GET", "/summary", token=token)
+        latencies.append(time.perf_counter() - start)
+        assert status in (200, 201), status
+    writer.close()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def run(args, port: int) -> None:
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*(client(port, f"user{i}", args.requests, latencies)
+                           for i in range(args.clients)))
+    seconds = time.perf_counter() - start
+
+    latencies.sort()
+    percentile = lambda p: latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+    print(f"{len(latencies)} requests from {args.clients} clients in {seconds:.2f} s")
+    print(f"throughput: {len(latencies) / seconds:,.0f} requests/s")
+    print(f"latency:    p50 {percentile(0.50):.2f} ms | p99 {percentile(0.99):.2f} ms"
+          f" | mean {statistics.mean(latencies) * 1000:.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--storage", default="journal", choices=["journal", "sharded", "sqlite"])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.mkdir(os.path.join(directory, "data"))
+        environment = dict(os.environ, PYTHONPATH=PROJECT, BUDGETBITS_PASSWORD_ITERATIONS="1000",
+                           BUDGETBITS_STORAGE=args.storage)
+
+        # the users and their accounts
+        setup = (
+            "from data import open_storage, AccountStore\n"
+            "from budgetbits import hash_password\n"
+            "from benchmarks.common import synthetic_user\n"
+            "import os\n"
+            "info = open_storage()\n"
+            "accounts = AccountStore(os.path.join('data', 'accounts.db'))\n"
+            f"for i in range({args.clients}):\n"
+            "    user = synthetic_user(f'user{i}', 100, seed=i)\n"
+            "    user['_remaining_balance'] += 10 ** 9\n"
+            "    info.save_user(f'user{i}', user)\n"
+            "    accounts.add(f'user{i}', hash_password('password'))\n"
+        )
+        subprocess.run([sys.executable, "-c", setup], cwd=directory, env=environment, check=True)
+
+        port = free_port()
+        server = subprocess.Popen(
+            [sys.executable, os.path.join(PROJECT, "server.py"), "--port", str(port)],
+            cwd=directory, env=environment, stdout=subprocess.PIPE)
+        try:
+            server.stdout.readline()
+            asyncio.run(run(args, port))
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
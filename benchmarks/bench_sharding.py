@@ -0,0 +1,50 @@
+"""
+Startup and login cost of the monolithic data.json against sharded storage.
+
+Usage (from the project directory):
+    python -m benchmarks.bench_sharding [--users 10000 100000]
+"""
+import tempfile
+import argparse
+import os
+
+from data import InformationManager, ShardedManager
+from benchmarks.common import synthetic_user, measure
+
+
+def login(manager, username: str):
+    """What main() does to log a user in."""
+    return manager.load_user(username)
+
+
+def run(users: int, transactions: int) -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        monolithic = InformationManager(os.path.join(directory, "data.json"))
+        sharded = ShardedManager(os.path.join(directory, "users"))
+
+        data = {f"user{i}": synthetic_user(f"user{i}", transactions, seed=i)
+                for i in range(users)}
+        monolithic.save(data)
+        sharded.save(data)
+        del data
+
+        target = f"user{users // 2}"
+        for name, manager in (("monolithic", monolithic), ("sharded", sharded)):
+            record, seconds, peak = measure(login, manager, target)
+            assert record["_username"] == target
+            print(f"{users:>8} users | {name:<10} | {seconds * 1000:>10.2f} ms"
+                  f" | {peak / 1024:>10.1f} KiB peak")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--transactions", type=int, default=20)
+    args = parser.parse_args()
+
+    for users in args.users:
+        run(users, args.transactions)
+
+
+if __name__ == "__main__":
+    main()
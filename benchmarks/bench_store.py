@@ -0,0 +1,43 @@
+"""
+Memory per transaction and total time of the nested expenses against ExpenseStore.
+
+Usage (from the project directory):
+    python -m benchmarks.bench_store [--transactions 100000]
+"""
+import argparse
+import copy
+import time
+
+from expenses import ExpenseStore
+from benchmarks.common import synthetic_user, measure
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--transactions", type=int, default=100_000)
+    args = parser.parse_args()
+
+    expenses = synthetic_user("user", args.transactions)["_expenses"]
+
+    nested, _, nested_peak = measure(copy.deepcopy, expenses)
+    store, _, store_peak = measure(ExpenseStore.from_nested, expenses)
+
+    start = time.perf_counter()
+    nested_total = sum(entry["amount"] for dates in nested.values()
+                       for entries in dates.values() for entry in entries)
+    nested_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    store_total = store.total()
+    store_seconds = time.perf_counter() - start
+    assert nested_total == store_total
+
+    print(f"{args.transactions} transactions")
+    print(f"nested dicts | {nested_peak / args.transactions:>8.1f} bytes/transaction"
+          f" | total in {nested_seconds * 1000:.2f} ms")
+    print(f"ExpenseStore | {store_peak / args.transactions:>8.1f} bytes/transaction"
+          f" | total in {store_seconds * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
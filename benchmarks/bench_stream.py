@@ -0,0 +1,49 @@
+"""
+Peak memory of loading a whole data.json against streaming it.
+
+Usage (from the project directory):
+    python -m benchmarks.bench_stream [--users 2000] [--transactions 200]
+"""
+import tempfile
+import argparse
+import json
+import os
+
+import jsonstream
+from data import InformationManager
+from benchmarks.common import synthetic_user, measure
+
+
+def load_whole(path: str, username: str):
+    with open(path, 'r') as file:
+        return json.load(file).get(username)
+
+
+def count_users(path: str) -> int:
+    return sum(1 for _ in jsonstream.iter_users(path))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=2_000)
+    parser.add_argument("--transactions", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "data.json")
+        InformationManager(path).save({f"user{i}": synthetic_user(f"user{i}", args.transactions, seed=i)
+                                       for i in range(args.users)})
+        size = os.path.getsize(path)
+        target = f"user{args.users - 1}"
+        print(f"{args.users} users, {args.transactions} transactions each | {size / 2 ** 20:.1f} MiB file")
+
+        for name, function, *rest in (("json.load", load_whole, target),
+                                      ("stream one user", jsonstream.load_user, target),
+                                      ("stream every user", count_users)):
+            _, seconds, peak = measure(function, path, *rest)
+            print(f"{name:<18} | {seconds * 1000:>10.1f} ms | {peak / 2 ** 20:>8.2f} MiB peak"
+                  f" ({peak / size:.2f}x the file)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Shared helpers of the BudgetBits benchmarks."""
+import tracemalloc
+import calendar
+import random
+import time
+
+
+CATEGORIES = ["Food", "Transportation", "University expenses", "Bills", "Leisure"]
+
+
+def synthetic_user(username: str, transactions: int = 20, seed: int = 0,
+                   categories: int = 5, months: int = 12) -> dict:
+    """
+    Generate a user record in the same shape as a saved BudgetBits user.
+
+    Args:
+        username (str): the username of the user
+        transactions (int): the number of expense entries
+        seed (int): the seed of the random generator
+        categories (int): the number of distinct categories
+        months (int): the number of months the dates are spread over, from 2023-01
+    """
+    rng = random.Random(seed)
+    names = (CATEGORIES + [f"Category {i}" for i in range(len(CATEGORIES) + 1, categories + 1)])[:categories]
+    expenses = {}
+    spent = 0
+    for _ in range(transactions):
+        amount = rng.randint(20, 500)
+        month = rng.randint(0, months - 1)
+        date = f"{2023 + month // 12}-{month % 12 + 1:02d}-{rng.randint(1, 28):02d}"
+        category = rng.choice(names)
+        expenses.setdefault(category, {}).setdefault(date, []).append(
+            {"amount": amount, "notes": f"note {rng.randint(0, 999)}"})
+        spent += amount
+
+    budget = spent + 5000
+    last_year, last_month = 2023 + (months - 1) // 12, (months - 1) % 12 + 1
+    return {
+        "_username": username,
+        "_first": "John",
+        "_last": "Doe",
+        "_monthly_budget": budget,
+        "_expenses": expenses,
+        "_remaining_balance": budget - spent,
+        "date": f"{last_year}-{last_month:02d}-{calendar.monthrange(last_year, last_month)[1]}",
+        "last_updated": f"{last_year}-{last_month:02d}",
+    }
+
+
+def measure(function, *args):
+    """
+    Run a function once and measure it.
+
+    Returns:
+        tuple: (result, seconds, peak traced memory in bytes)
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = function(*args)
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, seconds, peak
@@ -0,0 +1,69 @@
+"""
+Generate a synthetic data.json and accounts.json at a configurable scale.
+
+Usage (from the project directory):
+    python -m benchmarks.generate [--directory data] [--users 100] [--transactions 1000]
+                                  [--categories 5] [--months 12] [--seed 0] [--iterations 1000]
+
+Every generated account has the password PASSWORD. The password hash is computed
+once and shared by every account, so a large scale is generated quickly.
+"""
+import argparse
+import time
+import os
+
+from budgetbits import hash_password
+from data import InformationManager
+from benchmarks.common import synthetic_user
+
+PASSWORD = "budgetbits"
+
+
+def generate(directory: str, users: int = 100, transactions: int = 1000, categories: int = 5,
+             months: int = 12, seed: int = 0, iterations: int = 1000) -> dict:
+    """
+    Write a data.json and an accounts.json of synthetic users into a directory.
+
+    Args:
+        directory (str): the directory of the files
+        users (int): the number of users
+        transactions (int): the number of expense entries per user
+        categories (int): the number of distinct categories
+        months (int): the number of months the dates are spread over
+        seed (int): the seed of the first user (the next users have the next seeds)
+        iterations (int): the work factor of the password hash
+
+    Returns:
+        dict: the generated users, by username
+    """
+    os.makedirs(directory, exist_ok=True)
+    data = {f"user{i}": synthetic_user(f"user{i}", transactions, seed + i, categories, months)
+            for i in range(users)}
+    InformationManager(os.path.join(directory, "data.json")).save(data)
+
+    stored = hash_password(PASSWORD, iterations)
+    InformationManager(os.path.join(directory, "accounts.json")).save(
+        {username: stored for username in data})
+    return data
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--directory", default="data")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--transactions", type=int, default=1000, help="per user")
+    parser.add_argument("--categories", type=int, default=5)
+    parser.add_argument("--months", type=int, default=12, help="the date spread, from 2023-01")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--iterations", type=int, default=1000, help="the password hash work factor")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    generate(args.directory, args.users, args.transactions, args.categories,
+             args.months, args.seed, args.iterations)
+    print(f"{args.users} users of {args.transactions} transactions written to {args.directory}"
+          f" in {time.perf_counter() - start:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
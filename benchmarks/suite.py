@@ -0,0 +1,178 @@
+"""
+Benchmark suite of the main BudgetBits operations, with results exported to json.
+
+Usage (from the project directory):
+    python -m benchmarks.suite [--users 100] [--transactions 1000] [--rounds 5]
+                               [--output results.json] [--compare baseline.json] [--threshold 1.2]
+
+The suite runs on a synthetic data set (see benchmarks.generate) in a temporary
+directory. Each benchmark is run for a number of rounds and its min, max, mean,
+median and standard deviation are reported, in seconds per call. With --compare,
+every benchmark whose median is slower than the baseline's by more than the
+threshold (a ratio) is reported as a regression, and the exit status is 1.
+"""
+import statistics
+import platform
+import tempfile
+import argparse
+import json
+import time
+import sys
+import os
+
+from benchmarks.generate import generate, PASSWORD
+
+
+def bench(function, rounds: int = 5, number: int = 1, setup=None) -> dict:
+    """
+    Time a function over several rounds.
+
+    Args:
+        function (callable): the function to time, called without arguments
+        rounds (int): the number of rounds
+        number (int): the number of calls of a round
+        setup (callable, optional): called before each round, outside of the timing
+
+    Returns:
+        dict: the min, max, mean, median and stddev of a call, in seconds
+    """
+    times = []
+    for _ in range(rounds):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        times.append((time.perf_counter() - start) / number)
+
+    return {
+        "rounds": rounds,
+        "number": number,
+        "min": min(times),
+        "max": max(times),
+        "mean": statistics.mean(times),
+        "median": statistics.median(times),
+        "stddev": statistics.stdev(times) if rounds > 1 else 0.0,
+    }
+
+
+def run_suite(users: int = 100, transactions: int = 1000, rounds: int = 5,
+              iterations: int = 1000) -> dict:
+    """
+    Run every benchmark on a fresh synthetic data set.
+
+    Args:
+        users (int): the number of users of the data set
+        transactions (int): the number of expense entries per user
+        rounds (int): the number of rounds of each benchmark
+        iterations (int): the work factor of the password hash
+
+    Returns:
+        dict: the machine, the parameters and the result of every benchmark
+    """
+    previous = os.getcwd(), os.environ.get("BUDGETBITS_PASSWORD_ITERATIONS")
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        os.environ["BUDGETBITS_PASSWORD_ITERATIONS"] = str(iterations)
+        try:
+            generate("data", users, transactions, iterations=iterations)
+            results = _run_benchmarks(rounds)
+        finally:
+            os.chdir(previous[0])
+            if previous[1] is None:
+                os.environ.pop("BUDGETBITS_PASSWORD_ITERATIONS", None)
+            else:
+                os.environ["BUDGETBITS_PASSWORD_ITERATIONS"] = previous[1]
+
+    return {
+        "machine": {"python": platform.python_version(), "platform": platform.platform()},
+        "params": {"users": users, "transactions": transactions, "rounds": rounds,
+                   "iterations": iterations},
+        "benchmarks": results,
+    }
+
+
+def _run_benchmarks(rounds: int) -> dict:
+    # imported here, so the benchmarks are not timing their import
+    from budgetbits import Accounts
+    from project import existing_user
+    from data import InformationManager
+
+    info = InformationManager(os.path.join("data", "data.json"))
+    data = info.retrieve()
+    record = data["user0"]
+    user = existing_user(record)
+    # the repeated entries must not exceed the budget
+    user.remaining_balance = 10 ** 12
+    accounts = Accounts()
+
+    results = {
+        "retrieve": bench(info.retrieve, rounds),
+        "save": bench(lambda: info.save(data), rounds),
+        "existing_user": bench(lambda: existing_user(record), rounds),
+        "display_expenses": bench(user.display_expenses, rounds),
+        "display_information": bench(user.display_information, rounds, number=100),
+        # a fresh login each round, not one of this process' cached logins
+        "login": bench(lambda: accounts.login_account("user0", PASSWORD), rounds,
+                       setup=Accounts._verified.clear),
+        # last, as it adds expenses to the user
+        "expense_entry": bench(lambda: user.expense_entry("Food", 100, "lunch"), rounds, number=1000),
+    }
+    accounts.accounts.close()
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float = 1.2) -> list:
+    """
+    Compare the results of a run with a baseline run.
+
+    Args:
+        results (dict): the results of run_suite
+        baseline (dict): the results of an earlier run_suite
+        threshold (float): the slowdown ratio of the medians that is a regression
+
+    Returns:
+        list: the (name, baseline median, median, ratio) of every regression
+    """
+    regressions = []
+    for name, result in results["benchmarks"].items():
+        if (before := baseline["benchmarks"].get(name)) is None or not before["median"]:
+            continue
+        ratio = result["median"] / before["median"]
+        if ratio > threshold:
+            regressions.append((name, before["median"], result["median"], ratio))
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--transactions", type=int, default=1000, help="per user")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--iterations", type=int, default=1000, help="the password hash work factor")
+    parser.add_argument("--output", help="the json file to export the results to")
+    parser.add_argument("--compare", help="the json file of a baseline run")
+    parser.add_argument("--threshold", type=float, default=1.2)
+    args = parser.parse_args(argv)
+
+    results = run_suite(args.users, args.transactions, args.rounds, args.iterations)
+    for name, result in results["benchmarks"].items():
+        print(f"{name:<20} | median {result['median'] * 1000:>10.3f} ms"
+              f" | min {result['min'] * 1000:>10.3f} ms | stddev {result['stddev'] * 1000:>8.3f} ms")
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=4)
+
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(results, json.load(file), args.threshold)
+        for name, before, after, ratio in regressions:
+            print(f"REGRESSION {name}: {before * 1000:.3f} ms -> {after * 1000:.3f} ms ({ratio:.2f}x)")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,19 +1,99 @@
-from data import InformationManager
-from pyfiglet import figlet_format
+from data import AccountStore
+from instrument import timed
+from expenses import ExpenseStore, ExpenseAggregates, to_period, to_ordinal, to_iso
+from search import ExpenseIndex
+from recurring import RecurringRule, due
+from alerts import BudgetAlerts
+from functools import lru_cache
 from datetime import datetime
-from tabulate import tabulate
+from itertools import islice
 import calendar
+import hashlib
+import secrets
+import hmac
 import sys
 import os
 
+# pre-rendered title, so pyfiglet is only imported if it is missing
+BANNER_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "banner.txt")
 
+
+@lru_cache(maxsize=None)
+@timed()
 def budgetbits_title() -> str:
     """Generate a stylized title for the BudgetBits application using ASCII art."""
+    try:
+        with open(BANNER_FILE, 'r', encoding='utf-8') as file:
+            return file.read()
+    except OSError:
+        pass
+
+    from pyfiglet import figlet_format
     title = figlet_format("BudgetBits", font="slant",
                           justify="center", width=80)
+    try:
+        with open(BANNER_FILE, 'w', encoding='utf-8') as file:
+            file.write(title)
+    except OSError:
+        pass
     return title
 
 
+def today() -> str:
+    """Return today's ISO date."""
+    return str(datetime.now().date())
+
+
+def password_iterations() -> int:
+    """
+    Return the PBKDF2 work factor of new password hashes.
+
+    It can be tuned with the BUDGETBITS_PASSWORD_ITERATIONS environment variable.
+    """
+    return int(os.environ.get("BUDGETBITS_PASSWORD_ITERATIONS", 600_000))
+
+
+def hash_password(password: str, iterations: int = None, salt: bytes = None) -> str:
+    """
+    Hash a password with a random salt using PBKDF2-HMAC-SHA256.
+
+    Returns:
+        str: "pbkdf2_sha256$<iterations>$<salt>$<hash>"
+    """
+    iterations = iterations or password_iterations()
+    salt = salt or secrets.token_bytes(16)
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode(), salt, iterations)
+    return f"pbkdf2_sha256${iterations}${salt.hex()}${digest.hex()}"
+
+
+def hash_legacy(stored: str) -> str:
+    """Hash a password of the former accounts file, unless it is hashed already."""
+    return stored if stored.startswith("pbkdf2_sha256$") else hash_password(stored)
+
+
+def verify_password(password: str, stored: str) -> bool:
+    """
+    Check a password against its stored hash.
+
+    Passwords saved in plain text (before hashing) are still accepted, so they
+    can be rehashed on login.
+    """
+    if not stored.startswith("pbkdf2_sha256$"):
+        return hmac.compare_digest(password.encode(), stored.encode())
+
+    _, iterations, salt, digest = stored.split("$")
+    expected = hashlib.pbkdf2_hmac(
+        "sha256", password.encode(), bytes.fromhex(salt), int(iterations))
+    return hmac.compare_digest(expected.hex(), digest)
+
+
+def needs_rehash(stored: str, iterations: int = None) -> bool:
+    """Check whether a stored password is in plain text or uses another work factor."""
+    if not stored.startswith("pbkdf2_sha256$"):
+        return True
+    return int(stored.split("$")[1]) != (iterations or password_iterations())
+
+
 def clear():
     """
     Clear the terminal screen.
@@ -30,23 +110,28 @@ def clear():
 
 
 class Accounts:
-    user_accounts = {}
+    # the successful logins of this process, so a repeated login skips the
+    # slow hash: username -> (stored hash, keyed digest of the password)
+    _verified = {}
+    _verified_key = secrets.token_bytes(32)
 
     def __init__(self) -> None:
         """
         Accounts: a class to handle user accounts.
         A login and register system.
         """
-        file_path = os.path.join("data", "accounts.json")
-        self.data_manager = InformationManager(file_path)
-        Accounts.user_accounts.update(self.data_manager.retrieve())
+        # accounts.json (the former storage) is imported once, hashed
+        self.accounts = AccountStore(
+            os.path.join("data", "accounts.db"),
+            os.path.join("data", "accounts.json"),
+            hash_legacy)
 
     def __str__(self) -> str:
         """
         This method simply returns the number
         of users.
         """
-        return f"Current users: {len(Accounts.user_accounts)}"
+        return f"Current users: {len(self.accounts)}"
 
     def register_account(self, username: str, password: str) -> None:
         """
@@ -55,7 +140,7 @@ class Accounts:
         # username
         if not username or username.isspace():
             raise ValueError("Username cannot be empty. Please try again.")
-        elif username in Accounts.user_accounts:
+        elif username in self.accounts:
             raise ValueError(
                 f"The username '{username}' is already taken. Please try a different one."
             )
@@ -63,29 +148,45 @@ class Accounts:
         # password
         if not password or password.isspace():
             raise ValueError("Password cannot be empty. Try a strong one.")
-        Accounts.user_accounts[username] = password
-        self.data_manager.save(Accounts.user_accounts)
+        if not self.accounts.add(username, hash_password(password)):
+            raise ValueError(
+                f"The username '{username}' is already taken. Please try a different one."
+            )
 
+    @timed()
     def login_account(self, username: str, password: str) -> bool:
         """
         This method simply handle the login process.
         """
-        if len(Accounts.user_accounts) <= 0:
-            raise ValueError(
-                "There isn't currently any account registered. Create an account first."
-            )
-        elif not username or username.isspace():
+        if not username or username.isspace():
             raise ValueError("Username cannot be empty. Please try again.")
-        elif username not in Accounts.user_accounts:
+        elif (stored := self.accounts.get(username)) is None:
+            if self.accounts.is_empty():
+                raise ValueError(
+                    "There isn't currently any account registered. Create an account first."
+                )
             raise ValueError(
                 f"Username '{username}' is not currently registered. Create an account first."
             )
-        elif (
-            username in Accounts.user_accounts
-            and Accounts.user_accounts[username] == password
-        ):
-            return True
-        return False
+        return self.verify(username, password, stored)
+
+    def verify(self, username: str, password: str, stored: str) -> bool:
+        """
+        This method checks the password of a registered user, and rehashes
+        it when the work factor of the stored hash is not the current one.
+        """
+        digest = hmac.new(Accounts._verified_key, password.encode(), "sha256").digest()
+        if (cached := Accounts._verified.get(username)) and cached[0] == stored:
+            return hmac.compare_digest(cached[1], digest)
+
+        if not verify_password(password, stored):
+            return False
+
+        if needs_rehash(stored):
+            stored = hash_password(password)
+            self.accounts.update(username, stored)
+        Accounts._verified[username] = (stored, digest)
+        return True
 
 
 class AccountValidator(Accounts):
@@ -196,7 +297,10 @@ class BudgetBits:
         monthly_budget: int,
         expenses: dict,
         remaining_balance: int,
-        last_updated: int
+        last_updated: str,
+        periods: dict = None,
+        recurring: list = None,
+        alerts: dict = None
     ) -> None:
         """
         BudgetBits is a user-friendly and intuitive expense tracker designed to simplify personal finance
@@ -211,6 +315,10 @@ class BudgetBits:
         expenses (dict): A dictionary containing user's expenses categorized by type.
         remaining_balance (int): The remaining balance after deducting expenses from the budget.
         date (str): The current date when the BudgetBits instance is created.
+        last_updated (str): The current budget period (YYYY-MM).
+        periods (dict): The budget of every past period, by period (YYYY-MM).
+        recurring (list): The saved recurring expense rules (see recurring.py).
+        alerts (dict): The saved budget alert thresholds (see alerts.py).
         """
         # user's personal information
         self.username = username
@@ -220,14 +328,26 @@ class BudgetBits:
 
         # user's expenses
         self.expenses = expenses
-        self.remaining_balance = remaining_balance
+        if not isinstance(remaining_balance, int):
+            raise ValueError(f"{remaining_balance} should be an integer.")
+        # a saved balance may be used up already (see roll_period)
+        self._remaining_balance = remaining_balance
 
         # others
-        self.date = str(datetime.now().date())
+        self.date = today()
 
         # if user updated the monthly budget
         self.last_updated = last_updated
 
+        # the budgets of the past periods
+        self.periods = dict(periods or {})
+
+        # the recurring expenses
+        self.recurring = [RecurringRule.from_dict(rule) for rule in recurring or []]
+
+        # the budget alerts (delivered to the sinks set by the caller)
+        self.alerts = BudgetAlerts.from_dict(alerts)
+
     def __str__(self) -> str:
         """Returns a stylized title for the BudgetBits application using ASCII art."""
         return budgetbits_title()
@@ -289,10 +409,20 @@ class BudgetBits:
                 f"{monthly_budget} is not a viable monthly budget. It seems insufficient for your financial needs.")
         self._monthly_budget = monthly_budget
 
+    @property
+    def last_updated(self):
+        """Get the current budget period (YYYY-MM)."""
+        return self._last_updated
+
+    @last_updated.setter
+    def last_updated(self, last_updated):
+        """Set the current budget period (a month number from older records is converted)."""
+        self._last_updated = to_period(last_updated, self.date)
+
     @property
     def expenses(self):
-        """Get the expenses."""
-        return self._expenses
+        """Get the expenses (in their saved shape)."""
+        return self._store.to_nested()
 
     @expenses.setter
     def expenses(self, expenses: dict):
@@ -300,7 +430,29 @@ class BudgetBits:
         if not isinstance(expenses, dict):
             raise ValueError(
                 "Invalid expenses: Expenses must be a dictionary.")
-        self._expenses = expenses
+        # the expenses are kept in a compact, columnar store
+        # along with their running totals
+        self._store = ExpenseStore.from_nested(expenses)
+        self._totals = ExpenseAggregates.from_store(self._store)
+        # the search index is built when first searched
+        self._index = None
+
+    @property
+    def store(self) -> ExpenseStore:
+        """Get the columnar ExpenseStore of the expenses (read it, record entries with expense_entry)."""
+        return self._store
+
+    @property
+    def index(self):
+        """Get the search index of the expenses (built if needed)."""
+        if self._index is None:
+            self._index = ExpenseIndex.build(self._store)
+        return self._index
+
+    @index.setter
+    def index(self, index: ExpenseIndex):
+        """Set the search index, e.g. one loaded by an IndexStore."""
+        self._index = index
 
     @property
     def remaining_balance(self):
@@ -336,10 +488,13 @@ class BudgetBits:
             f"REMAINING BALANCE ({month})": f"₱{self.remaining_balance:,}",
         }
 
+        from tabulate import tabulate
+
         data = [[key, value] for key, value in personal_information.items()]
         return tabulate(data, headers=headers, tablefmt="outline")
 
-    def expense_entry(self, category: str, amount: int, notes: str):
+    @timed()
+    def expense_entry(self, category: str, amount: int, notes: str, date: str = None):
         """
         Record an expense entry with category, amount, and notes.
 
@@ -347,60 +502,320 @@ class BudgetBits:
             category (str): The category of the expense.
             amount (int): The amount of the expense.
             notes (str): Additional notes for the expense.
+            date (str, optional): The ISO date of the expense. Defaults to today.
+
+        Returns:
+            tuple: The (category, date, entry) of the recorded expense.
+        """
+        # the date is checked before anything is changed
+        try:
+            date = to_iso(to_ordinal(date or self.date))
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid date '{date}'. Use YYYY-MM-DD.")
+
+        # subtracting the entry from the remaining balance (of this period)
+        if date.startswith(self.last_updated):
+            try:
+                self.remaining_balance -= amount
+            except ValueError:
+                self.alerts.refused(self, category, date, amount)
+                raise
+
+        row_id = self._store.append(category, date, amount, notes)
+        self._totals.add(category, date, amount)
+        if self._index is not None:
+            self._index.add(row_id, category, notes)
+        # the thresholds crossed by the entry, from the running totals
+        self.alerts.check(self, category, date, amount)
+        return category, date, {"amount": amount, "notes": notes}
+
+    def total_expenses(self, category: str = None, month: str = None, date: str = None) -> int:
         """
-        if category not in self.expenses:
-            self.expenses[category] = dict()
+        Return the sum of the recorded expenses from the running totals.
 
-        # subtracting the entry from the remaining balance
-        self.remaining_balance -= amount
+        Args:
+            category (str): only this category, if given.
+            month (str): only this month (YYYY-MM), if given.
+            date (str): only this ISO date, if given.
 
-        if self.date not in self.expenses[category]:
-            self.expenses[category][self.date] = [
-                {"amount": amount, "notes": notes}]
-        else:
-            self.expenses[category][self.date].append(
-                {"amount": amount, "notes": notes})
+        Returns:
+            int: The sum of the expenses.
+        """
+        return self._totals.total(category, month, date)
 
-        return self.__dict__
+    def category_totals(self, month: str = None) -> dict:
+        """
+        Return the sum of the recorded expenses of every category.
 
-    def display_expenses(self):
+        Args:
+            month (str): only this month (YYYY-MM), if given.
+
+        Returns:
+            dict: The sum of the expenses by category.
         """
-        Display recorded expenses in a formatted table.
+        return self._totals.categories(month)
+
+    def iter_expenses(self, category: str = None, start: str = None, end: str = None):
+        """
+        Yield the recorded expenses in date order, one row at a time.
+
+        Args:
+            category (str): only this category, if given.
+            start (str): the first ISO date (inclusive), if given.
+            end (str): the last ISO date (inclusive), if given.
+
+        Yields:
+            list: [category, date, amount, notes] rows.
+        """
+        return self.query(start, end, None if category is None else [category])
+
+    def query(self, start: str = None, end: str = None, categories=None,
+              min_amount: int = None, max_amount: int = None, notes: str = None):
+        """
+        Yield the recorded expenses matching every given filter, in date order.
+
+        The date range is found with a binary search on the sorted dates, so
+        only the expenses within it are looked at.
+
+        Args:
+            start (str): the first ISO date (inclusive), if given.
+            end (str): the last ISO date (inclusive), if given.
+            categories (iterable): only these categories, if given.
+            min_amount (int): the smallest amount (inclusive), if given.
+            max_amount (int): the largest amount (inclusive), if given.
+            notes (str): only notes containing this text (case-insensitive), if given.
+
+        Yields:
+            list: [category, date, amount, notes] rows.
+        """
+        store = self._store
+        positions = store.date_range(start, end)
+        order = store.ordered()
+
+        category_ids = None
+        if categories is not None:
+            category_ids = {store.find_category(category) for category in categories}
+        note_ids = None
+        if notes is not None:
+            text = notes.lower()
+            note_ids = {note_id for note_id, note in enumerate(store.note_pool) if text in note.lower()}
+
+        for position in positions:
+            row_id = order[position]
+            if category_ids is not None and store.categories[row_id] not in category_ids:
+                continue
+            amount = store.amounts[row_id]
+            if (min_amount is not None and amount < min_amount) or (max_amount is not None and amount > max_amount):
+                continue
+            if note_ids is not None and store.notes[row_id] not in note_ids:
+                continue
+            yield list(store.row(row_id))
+
+    def search(self, query: str) -> list:
+        """
+        Find the recorded expenses whose notes and category match every word of a query.
+
+        Args:
+            query (str): The words, where a word ending with "*" matches
+                every word starting with it (e.g. "grab ri*").
 
         Returns:
-            str: A formatted table displaying recorded expenses.
+            list: [category, date, amount, notes] rows, in date order.
         """
-        if len(self.expenses) <= 0:
-            return "\nYou currently have no recorded expenses. To start tracking your spending, use the [A]dd option in the 'Home' section."
+        rows = sorted(self.index.search(query), key=self._store._date_key)
+        return [list(self._store.row(row_id)) for row_id in rows]
+
+    def expense_pages(self, page_size: int = 20, offset: int = 0, **filters):
+        """
+        Render the recorded expenses in formatted tables, one page at a time.
+
+        Args:
+            page_size (int): The number of rows of a page.
+            offset (int): The number of rows to skip first.
+            **filters: The category, start and end of iter_expenses.
 
-        flattened_data = []
-        for category, data_date in self.expenses.items():
-            for date, transactions in data_date.items():
-                for transaction in transactions:
-                    flattened_data.append(
-                        [category, date, transaction["amount"], transaction["notes"]])
+        Yields:
+            str: A formatted table of each page.
+        """
+        from tabulate import tabulate
 
         headers = ["Category", "Date", "Amount", "Notes"]
+        rows = islice(self.iter_expenses(**filters), offset, None)
+        while page := list(islice(rows, page_size)):
+            yield tabulate(page, headers=headers, tablefmt="grid")
+
+    @timed()
+    def display_expenses(self, page_size: int = None, offset: int = 0, **filters):
+        """
+        Display recorded expenses in a formatted table.
+
+        Args:
+            page_size (int): The number of rows to display, all of them if not given.
+            offset (int): The number of rows to skip first.
+            **filters: The category, start and end of iter_expenses.
 
-        return tabulate(flattened_data, headers=headers, tablefmt="grid")
+        Returns:
+            str: A formatted table displaying recorded expenses.
+        """
+        if len(self._store) <= 0:
+            return "\nYou currently have no recorded expenses. To start tracking your spending, use the [A]dd option in the 'Home' section."
+
+        page_size = page_size or len(self._store)
+        return next(self.expense_pages(page_size, offset, **filters), "\nNo recorded expenses found.")
 
     def monthly_budget_update(self, validation_function):
         """
-        Update the monthly budget if the current day is the first day of the month.
+        Update the monthly budget if a new month (budget period) has started.
 
         Returns:
             dict: Updated dictionary of the BudgetBits instance.
         """
-        current_month = datetime.strptime(self.date, "%Y-%m-%d").month
+        current_period = self.date[:7]
+
+        if current_period != self.last_updated:
+            self.roll_period(current_period, validation_function())
+
+        return self.to_dict()
+
+    def start_current_period(self, budget: int = None) -> bool:
+        """
+        Start the budget period of today if the calendar month has moved on
+        since the last one, as the app does at login (without asking).
 
-        if not self.last_updated:
-            self.last_updated = current_month
+        Args:
+            budget (int, optional): The budget of the new period, the current one if not given.
 
-        if current_month != self.last_updated:
-            new_budget = validation_function()
-            self.monthly_budget = new_budget
-            self.remaining_balance = new_budget
+        Returns:
+            bool: Whether a new period was started.
+        """
+        period = self.date[:7]
+        if period == self.last_updated:
+            return False
+        self.roll_period(period, budget or self.monthly_budget)
+        return True
 
-            self.last_updated = current_month
+    def roll_period(self, period: str, budget: int) -> None:
+        """
+        Close the current budget period and start a new one.
 
-        return self.__dict__
+        The closed period's budget is kept in the history, and what was already
+        recorded in the new period is taken from its running total. That may
+        use up the whole budget (recurring expenses due, entries dated ahead),
+        in which case the period starts with nothing left and further
+        entries are refused, rather than the period not starting at all.
+
+        Args:
+            period (str): The new period (YYYY-MM).
+            budget (int): The budget of the new period.
+        """
+        self._remaining_balance = budget - self._totals.total(month=period)
+        self.periods[self.last_updated] = self.monthly_budget
+        self.monthly_budget = budget
+        self.last_updated = period
+        self.materialize_recurring()
+
+    def add_recurring(self, category: str, amount: int, notes: str, schedule: str,
+                      start: str = None, end: str = None) -> list:
+        """
+        Add a recurring expense, and record its occurrences up to today.
+
+        Args:
+            category (str): The category of the expense.
+            amount (int): The amount of the expense.
+            notes (str): Additional notes for the expense.
+            schedule (str): daily, weekly, monthly or "cron DOM MON DOW".
+            start (str, optional): The ISO date of the first occurrence. Defaults to today.
+            end (str, optional): The ISO date of the last day it may occur.
+
+        Returns:
+            list: The (category, date, entry) of the recorded occurrences.
+        """
+        self.recurring.append(RecurringRule(category, amount, notes, schedule, start or self.date, end))
+        return self.materialize_recurring()
+
+    def materialize_recurring(self, today: str = None) -> list:
+        """
+        Record the occurrences of the recurring expenses that are due.
+
+        They are recorded with expense_entry, in date order, so the remaining
+        balance is updated as for any other expense. An occurrence that
+        would exceed the budget of the period stops the recording: it stays
+        due, and is recorded once the balance allows it (e.g. the next period).
+
+        Args:
+            today (str, optional): The last ISO date to record. Defaults to today.
+
+        Returns:
+            list: The (category, date, entry) of the recorded occurrences.
+        """
+        recorded = []
+        for rule, date in due(self.recurring, today or self.date):
+            try:
+                recorded.append(self.expense_entry(rule.category, rule.amount, rule.notes, date))
+            except ValueError:
+                break
+        return recorded
+
+    def period_summary(self, period: str = None) -> dict:
+        """
+        Return the budget, spent and remaining amounts of a budget period.
+
+        Args:
+            period (str): The period (YYYY-MM), the current one if not given.
+
+        Returns:
+            dict: The period, budget, spent and remaining amounts.
+        """
+        period = period or self.last_updated
+        spent = self._totals.total(month=period)
+        if period == self.last_updated:
+            budget, remaining = self.monthly_budget, self.remaining_balance
+        else:
+            budget = self.periods.get(period, 0)
+            remaining = budget - spent
+        return {"period": period, "budget": budget, "spent": spent, "remaining": remaining}
+
+    def period_history(self) -> list:
+        """
+        Return the summary of every budget period, latest first.
+
+        Returns:
+            list: The period_summary of every period.
+        """
+        periods = sorted({*self.periods, self.last_updated}, reverse=True)
+        return [self.period_summary(period) for period in periods]
+
+    def display_periods(self):
+        """
+        Display the budget periods in a formatted table.
+
+        Returns:
+            str: A formatted table displaying every budget period.
+        """
+        from tabulate import tabulate
+
+        headers = ["Period", "Budget", "Spent", "Remaining"]
+        data = [[summary["period"], f"₱{summary['budget']:,}", f"₱{summary['spent']:,}",
+                 f"₱{summary['remaining']:,}"] for summary in self.period_history()]
+        return tabulate(data, headers=headers, tablefmt="outline")
+
+    def to_dict(self) -> dict:
+        """
+        Return the user's data in its saved (json) shape.
+
+        Returns:
+            dict: The user's data.
+        """
+        return {
+            "_username": self.username,
+            "_first": self.first,
+            "_last": self.last,
+            "_monthly_budget": self.monthly_budget,
+            "_expenses": self.expenses,
+            "_remaining_balance": self.remaining_balance,
+            "date": self.date,
+            "last_updated": self.last_updated,
+            "periods": self.periods,
+            "recurring": [rule.to_dict() for rule in self.recurring],
+            "alerts": self.alerts.to_dict(),
+        }
@@ -0,0 +1,314 @@
+"""
+BudgetBits batch mode: run BudgetBits operations without any prompt.
+
+Usage:
+    python cli.py add <username> <category> <amount> [--notes NOTES] [--date YYYY-MM-DD]
+    python cli.py show <username> [--category C] [--start D] [--end D] [--page-size N] [--offset N]
+    python cli.py search <username> <query>
+    python cli.py summary <username> [--month YYYY-MM]
+    python cli.py history <username>
+    python cli.py report <username> [--months N] [--window N] [--days N]
+    python cli.py import <username> <file.csv|file.jsonl> [--batch-size N]
+    python cli.py export <username> <file.csv|file.jsonl> [--category C] [--start D] [--end D]
+    python cli.py set-budget <username> <amount> [--first FIRST --last LAST]
+    python cli.py add-recurring <username> <category> <amount> <schedule> [--notes N] [--start D] [--end D]
+    python cli.py recurring <username>
+    python cli.py alerts <username> [--thresholds P [P ...]] [--limit CATEGORY AMOUNT] [--pace N]
+"""
+from project import existing_user, parse_amount, validate_name
+from transfer import import_expenses, export_expenses
+from budgetbits import BudgetBits
+from alerts import BudgetAlerts, TerminalSink, environment_sinks
+from data import open_storage
+import argparse
+import sys
+import os
+
+INDEX_DIRECTORY = os.path.join("data", "index")
+
+
+def load_user(info, username: str):
+    """
+    Load an existing user from the storage, in the budget period of today
+    (with the current budget), with the recurring expenses due since then
+    recorded.
+
+    Raises:
+        ValueError: If the user has no record yet.
+    """
+    if (record := info.load_user(username)) is None:
+        raise ValueError(f"Username '{username}' has no BudgetBits record yet. Use set-budget first.")
+    user = existing_user(record)
+    user.alerts.sinks = [TerminalSink(sys.stderr), *environment_sinks()]
+    if user.start_current_period() | bool(user.materialize_recurring()):
+        info.save_user(user.username, user.to_dict())
+    return user
+
+
+def index_store():
+    """Return the store of the users' search indexes, kept next to their data."""
+    from search import IndexStore
+
+    return IndexStore(INDEX_DIRECTORY)
+
+
+def command_add(info, args) -> str:
+    """Add an expense entry."""
+    user = load_user(info, args.username)
+    if not args.category or args.category.isspace():
+        raise ValueError("Category cannot be empty.")
+    expense = user.expense_entry(args.category, parse_amount(args.amount), args.notes, args.date)
+    info.save_expense(user.username, *expense)
+    # logged for the saved search index, so the next search does not rebuild it
+    index_store().log(user.username, [expense[:2]])
+    return f"Expense added. Remaining balance: ₱{user.remaining_balance:,}"
+
+
+def command_show(info, args) -> str:
+    """Show the expenses in a table."""
+    user = load_user(info, args.username)
+    return user.display_expenses(
+        args.page_size, args.offset, category=args.category, start=args.start, end=args.end)
+
+
+def command_search(info, args) -> str:
+    """Show the expenses whose notes and category match a query."""
+    from tabulate import tabulate
+
+    user = load_user(info, args.username)
+    # the index is kept next to the users' data, and rebuilt when stale
+    user.index = index_store().load(user.username, user.store)
+    if not (rows := user.search(args.query)):
+        return f"\nNo recorded expenses match '{args.query}'."
+    return tabulate(rows, headers=["Category", "Date", "Amount", "Notes"], tablefmt="grid")
+
+
+def command_summary(info, args) -> str:
+    """Show the personal information and the expenses of a month by category."""
+    from tabulate import tabulate
+
+    user = load_user(info, args.username)
+    month = args.month or user.date[:7]
+    totals = sorted(user.category_totals(month).items(), key=lambda total: -total[1])
+    table = tabulate([[category, f"₱{total:,}"] for category, total in totals],
+                     headers=["Category", f"Total ({month})"], tablefmt="outline")
+    return f"{user.display_information()}\n{table}"
+
+
+def command_history(info, args) -> str:
+    """Show the budget, spent and remaining amounts of every budget period."""
+    return load_user(info, args.username).display_periods()
+
+
+def command_report(info, args) -> str:
+    """Show the monthly trend, category shares, moving average and forecast."""
+    from analytics import Analytics
+
+    user = load_user(info, args.username)
+    return Analytics(user).report(args.months, args.window, args.days)
+
+
+def command_import(info, args) -> str:
+    """Import the expenses of a CSV or JSONL file."""
+    user = load_user(info, args.username)
+
+    def report(line_number, message):
+        print(f"line {line_number}: {message}", file=sys.stderr)
+
+    rows = len(user.store)
+    imported, failed = import_expenses(user, args.file, info, args.batch_size, report)
+    index_store().log(user.username, (user.store.row(row_id)[:2] for row_id in range(rows, len(user.store))))
+    return f"Imported {imported} expenses ({failed} failed)."
+
+
+def command_export(info, args) -> str:
+    """Export the expenses to a CSV or JSONL file."""
+    user = load_user(info, args.username)
+    exported = export_expenses(
+        user, args.file, category=args.category, start=args.start, end=args.end)
+    return f"Exported {exported} expenses to {args.file}."
+
+
+def command_set_budget(info, args) -> str:
+    """Set the monthly budget, registering the user if needed."""
+    budget = parse_amount(args.amount)
+    if (record := info.load_user(args.username)) is None:
+        if not (args.first and args.last):
+            raise ValueError("A new user needs --first and --last.")
+        first = validate_name(args.first, 'First')
+        last = validate_name(args.last, 'Last')
+        user = BudgetBits(args.username, first, last, budget, {}, budget, None)
+    else:
+        user = existing_user(record)
+        # a new month starts a new period with the new budget,
+        # otherwise what was already spent this month stays spent
+        if not user.start_current_period(budget):
+            user.remaining_balance += budget - user.monthly_budget
+            user.monthly_budget = budget
+
+    info.save_user(user.username, user.to_dict())
+    return f"Monthly budget of {user.username} set to ₱{budget:,}."
+
+
+def command_add_recurring(info, args) -> str:
+    """Add a recurring expense."""
+    user = load_user(info, args.username)
+    recorded = user.add_recurring(
+        args.category, parse_amount(args.amount), args.notes, args.schedule, args.start, args.end)
+    info.save_user(user.username, user.to_dict())
+    return (f"Recurring expense added ({len(recorded)} recorded so far)."
+            f" Remaining balance: ₱{user.remaining_balance:,}")
+
+
+def command_recurring(info, args) -> str:
+    """Show the recurring expenses."""
+    from tabulate import tabulate
+
+    user = load_user(info, args.username)
+    if not user.recurring:
+        return "\nYou currently have no recurring expenses."
+    return tabulate([[rule.category, f"₱{rule.amount:,}", rule.notes, rule.schedule, rule.next or "ended"]
+                     for rule in user.recurring],
+                    headers=["Category", "Amount", "Notes", "Schedule", "Next"], tablefmt="outline")
+
+
+def command_alerts(info, args) -> str:
+    """Set or show the budget alert thresholds."""
+    from tabulate import tabulate
+
+    user = load_user(info, args.username)
+    if args.thresholds or args.limit or args.pace is not None:
+        limits = dict(user.alerts.category_limits)
+        for category, amount in args.limit or []:
+            limits[category] = parse_amount(amount)
+        user.alerts = BudgetAlerts(args.thresholds or user.alerts.thresholds, limits,
+                                   args.pace if args.pace is not None else user.alerts.pace,
+                                   user.alerts.sinks)
+        info.save_user(user.username, user.to_dict())
+
+    alerts = user.alerts
+    rows = [["Budget", f"₱{user.monthly_budget:,}", ", ".join(f"{threshold}%" for threshold in alerts.thresholds)]]
+    rows += [[category, f"₱{limit:,}", ", ".join(f"{threshold}%" for threshold in alerts.thresholds)]
+             for category, limit in alerts.category_limits.items()]
+    if alerts.pace is not None:
+        rows.append(["Daily pace", f"₱{alerts.daily_pace(user):,.0f}/day", f"{alerts.pace:g}x"])
+    return tabulate(rows, headers=["Alert", "Limit", "At"], tablefmt="outline")
+
+
+def add_filters(parser) -> None:
+    """Add the expense filters to a subcommand."""
+    parser.add_argument("--category", help="only this category")
+    parser.add_argument("--start", help="the first date (YYYY-MM-DD)")
+    parser.add_argument("--end", help="the last date (YYYY-MM-DD)")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="budgetbits", description="BudgetBits batch mode.")
+    parser.add_argument("--storage", choices=["journal", "sharded", "sqlite"],
+                        help="the storage of the users' data (default: BUDGETBITS_STORAGE or journal)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    add = commands.add_parser("add", help="add an expense")
+    add.add_argument("username")
+    add.add_argument("category")
+    add.add_argument("amount")
+    add.add_argument("--notes", default="")
+    add.add_argument("--date", help="the date of the expense (YYYY-MM-DD), today by default")
+    add.set_defaults(function=command_add)
+
+    show = commands.add_parser("show", help="show the expenses")
+    show.add_argument("username")
+    add_filters(show)
+    show.add_argument("--page-size", type=int, help="the number of expenses to show")
+    show.add_argument("--offset", type=int, default=0, help="the number of expenses to skip")
+    show.set_defaults(function=command_show)
+
+    search = commands.add_parser("search", help="find expenses by the words of their notes and category")
+    search.add_argument("username")
+    search.add_argument("query", help='the words to match, "grab ri*" for a prefix')
+    search.set_defaults(function=command_search)
+
+    summary = commands.add_parser("summary", help="show the personal information and a month's totals")
+    summary.add_argument("username")
+    summary.add_argument("--month", help="the month (YYYY-MM), this month by default")
+    summary.set_defaults(function=command_summary)
+
+    history = commands.add_parser("history", help="show every budget period")
+    history.add_argument("username")
+    history.set_defaults(function=command_history)
+
+    report = commands.add_parser("report", help="show the spending trends and the end-of-month forecast")
+    report.add_argument("username")
+    report.add_argument("--months", type=int, default=6, help="the number of months of the trend")
+    report.add_argument("--window", type=int, default=7,
+                        help="the moving average: the days averaged into each day's figure")
+    report.add_argument("--days", type=int, default=14,
+                        help="the moving average: the number of days (rows) shown, up to today")
+    report.set_defaults(function=command_report)
+
+    importing = commands.add_parser("import", help="import expenses from a CSV or JSONL file")
+    importing.add_argument("username")
+    importing.add_argument("file")
+    importing.add_argument("--batch-size", type=int, default=1000)
+    importing.set_defaults(function=command_import)
+
+    export = commands.add_parser("export", help="export expenses to a CSV or JSONL file")
+    export.add_argument("username")
+    export.add_argument("file")
+    add_filters(export)
+    export.set_defaults(function=command_export)
+
+    set_budget = commands.add_parser("set-budget", help="set the monthly budget (and register a new user)")
+    set_budget.add_argument("username")
+    set_budget.add_argument("amount")
+    set_budget.add_argument("--first", help="the first name of a new user")
+    set_budget.add_argument("--last", help="the last name of a new user")
+    set_budget.set_defaults(function=command_set_budget)
+
+    add_recurring = commands.add_parser("add-recurring", help="add a recurring expense")
+    add_recurring.add_argument("username")
+    add_recurring.add_argument("category")
+    add_recurring.add_argument("amount")
+    add_recurring.add_argument("schedule", help="daily, weekly, monthly or 'cron DOM MON DOW'")
+    add_recurring.add_argument("--notes", default="")
+    add_recurring.add_argument("--start", help="the date of the first occurrence (YYYY-MM-DD), today by default")
+    add_recurring.add_argument("--end", help="the last date it may occur (YYYY-MM-DD)")
+    add_recurring.set_defaults(function=command_add_recurring)
+
+    recurring = commands.add_parser("recurring", help="show the recurring expenses")
+    recurring.add_argument("username")
+    recurring.set_defaults(function=command_recurring)
+
+    alerts = commands.add_parser("alerts", help="set or show the budget alert thresholds")
+    alerts.add_argument("username")
+    alerts.add_argument("--thresholds", type=int, nargs="+", help="the percentages to alert at (50 80 100 by default)")
+    alerts.add_argument("--limit", nargs=2, action="append", metavar=("CATEGORY", "AMOUNT"),
+                        help="the monthly limit of a category")
+    alerts.add_argument("--pace", type=float, help="alert when a day's spending is over this many times the daily pace")
+    alerts.set_defaults(function=command_alerts)
+
+    return parser
+
+
+def main(argv=None) -> int:
+    """
+    Run one BudgetBits command without any prompt.
+
+    Args:
+        argv (list, optional): The command line arguments. Defaults to sys.argv[1:].
+
+    Returns:
+        int: The exit status.
+    """
+    args = build_parser().parse_args(argv)
+    info = open_storage(args.storage)
+    try:
+        print(args.function(info, args))
+    except (ValueError, OSError) as message:
+        print(str(message).strip(), file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,31 +1,163 @@
+from contextlib import contextmanager
+from serializers import Codec
+from instrument import timed
+from expenses import to_period
+import jsonstream
+import threading
+import atexit
+import hashlib
 import json
+import sys
+import os
+
+try:
+    import fcntl
+except ImportError:
+    # windows
+    fcntl = None
+    import msvcrt
+
+
+@contextmanager
+def file_lock(path: str):
+    """
+    Hold an exclusive advisory lock on a lock file.
+
+    Other processes (and threads) taking the same lock wait until
+    it is released.
+
+    Args:
+        path (str): the path of the lock file
+    """
+    with open(path, 'a+') as file:
+        if fcntl:
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+        else:
+            file.seek(0)
+            msvcrt.locking(file.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+            else:
+                file.seek(0)
+                msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def atomic_write(path: str, content: bytes) -> None:
+    """
+    Write a file atomically.
+
+    The content is written to a temporary file next to it, synced to disk,
+    then renamed over the file, so readers never see a partial file.
+
+    Args:
+        path (str): the path of the file
+        content (bytes): the new content of the file
+    """
+    temp_name = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(temp_name, 'wb') as file:
+            file.write(content)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_name, path)
+    except BaseException:
+        if os.path.exists(temp_name):
+            os.remove(temp_name)
+        raise
+
+
+def apply_expense(record: dict, category: str, date: str, entry: dict) -> dict:
+    """
+    Apply a single expense entry onto a saved user record.
+
+    This mirrors what BudgetBits.expense_entry does to the object, so
+    a saved record can be brought up to date without rebuilding the object:
+    only an expense of the current budget period is taken from the balance.
+
+    Args:
+        record (dict): the saved user record (see BudgetBits.to_dict)
+        category (str): the category of the expense
+        date (str): the ISO date of the expense
+        entry (dict): the {"amount": ..., "notes": ...} entry
+    """
+    expenses = record.setdefault("_expenses", {})
+    expenses.setdefault(category, {}).setdefault(date, []).append(entry)
+    if in_current_period(record, date):
+        record["_remaining_balance"] -= entry["amount"]
+    return record
+
+
+def unknown_user(username: str) -> KeyError:
+    """Return the error of saving the expenses of a user that has no record."""
+    return KeyError(f"Username '{username}' has no saved record.")
+
+
+def in_current_period(record: dict, date: str) -> bool:
+    """
+    Check whether a date is in the current budget period of a saved user record.
+
+    The month number kept by records saved before budget periods is read
+    as BudgetBits reads it (see expenses.to_period).
+    """
+    return date[:7] == to_period(record.get("last_updated"), date)
+
+
+class CorruptDataError(ValueError):
+    """A data file exists but cannot be read (truncated, or in a format that cannot be decoded)."""
+
+
+def default_codec(format: str = "json") -> Codec:
+    """
+    Return the codec of the saved files, from the BUDGETBITS_FORMAT
+    environment variable (the given format by default).
+    """
+    return Codec(os.environ.get("BUDGETBITS_FORMAT", format))
 
 
 class InformationManager:
-    def __init__(self, file_name) -> None:
+    def __init__(self, file_name, codec: Codec = None) -> None:
         """
         InformationManager: a class that can a program to handle
         loading and saving data (with a dictionary) using json.
 
         Args:
             file_name (str): for the name of the file
+            codec (Codec): for the format of the file (see serializers.py),
+                any format is read but this one is written
         """
         self.file_name = file_name
+        self.lock_name = file_name + ".lock"
+        self.codec = codec or default_codec()
 
+    @timed()
     def retrieve(self) -> dict:
         """
         This method simply retrieve the data from the file
         and return back that data.
+
+        Raises:
+            CorruptDataError: If the file cannot be read, so that it is
+                never overwritten by a save of the users that could be.
         """
-        with open(self.file_name, 'a+') as file:
+        with open(self.file_name, 'ab+') as file:
             file.seek(0)
-            try:
-                data = json.load(file)
-            except json.JSONDecodeError:
-                return {}
-            else:
-                return data
+            content = file.read()
+        # a missing (just created) or empty file is an empty store
+        if not content:
+            return {}
+        try:
+            return self.codec.decode(content)
+        except ValueError as error:
+            raise CorruptDataError(f"{self.file_name} cannot be read: {error}")
+
+    def _write(self, data) -> None:
+        """Write the data atomically (the lock must be held)."""
+        atomic_write(self.file_name, self.codec.encode(data))
 
+    @timed()
     def save(self, data) -> None:
         """
         This method simply write and update data in the saving file.
@@ -34,5 +166,1063 @@ class InformationManager:
             data (any python data structure): any data types such as
             list, dictionary, etc.
         """
-        with open(self.file_name, 'w') as file:
-            json.dump(data, file, indent=4)
+        with file_lock(self.lock_name):
+            self._write(data)
+
+    @timed()
+    def load_user(self, username: str):
+        """
+        This method loads a single user's record, or None if
+        the user has no record yet.
+        """
+        return self.load_users([username]).get(username)
+
+    def usernames(self):
+        """
+        This method returns the username of every stored user.
+        """
+        if jsonstream.is_plain_json(self.file_name):
+            try:
+                return list(jsonstream.iter_usernames(self.file_name))
+            except ValueError as error:
+                raise CorruptDataError(f"{self.file_name} cannot be read: {error}")
+        return list(InformationManager.retrieve(self))
+
+    @timed()
+    def load_users(self, usernames) -> dict:
+        """
+        This method loads the records of several users at once.
+
+        A plain json file is streamed: only the given users are decoded,
+        so the memory used does not grow with the size of the file.
+
+        Args:
+            usernames (iterable): the users to load
+
+        Returns:
+            dict: the record of every given user that has one
+        """
+        if jsonstream.is_plain_json(self.file_name):
+            try:
+                return dict(jsonstream.iter_users(self.file_name, usernames))
+            except ValueError as error:
+                raise CorruptDataError(f"{self.file_name} cannot be read: {error}")
+        data = InformationManager.retrieve(self)
+        return {username: data[username] for username in usernames if username in data}
+
+    @timed()
+    def save_user(self, username: str, record: dict) -> None:
+        """
+        This method saves a single user's record.
+
+        Args:
+            username (str): the owner of the record
+            record (dict): the full user record
+        """
+        # read-modify-write, so the other users saved by
+        # other sessions in the meantime are kept
+        with file_lock(self.lock_name):
+            data = self.retrieve()
+            data[username] = record
+            self._write(data)
+
+    @timed()
+    def save_users(self, records: dict) -> None:
+        """
+        This method saves the records of several users at once.
+
+        Args:
+            records (dict): the full record of every user to save
+        """
+        with file_lock(self.lock_name):
+            data = self.retrieve()
+            data.update(records)
+            self._write(data)
+
+    @timed()
+    def save_expenses(self, username: str, entries) -> None:
+        """
+        This method saves a batch of expense entries of a single user.
+
+        Args:
+            username (str): the owner of the expenses
+            entries (iterable): (category, date, entry) tuples
+        """
+        with file_lock(self.lock_name):
+            data = self.retrieve()
+            if username not in data:
+                raise unknown_user(username)
+            for category, date, entry in entries:
+                apply_expense(data[username], category, date, entry)
+            self._write(data)
+
+    def save_expense(self, username: str, category: str, date: str, entry: dict) -> None:
+        """
+        This method saves a single expense entry of a user.
+        """
+        self.save_expenses(username, [(category, date, entry)])
+
+
+class JournalManager(InformationManager):
+    def __init__(self, file_name, compact_every: int = 500, codec: Codec = None) -> None:
+        """
+        JournalManager: an append-only (write-ahead) journal on top of
+        the json snapshot handled by InformationManager.
+
+        Every saved user record or expense entry is appended as one json
+        line to the journal, so a single insert only writes that record.
+        Once the journal grows past `compact_every` records it is compacted
+        into the snapshot on a background thread. Retrieving replays the
+        journal onto the last snapshot.
+
+        Args:
+            file_name (str): for the name of the snapshot file
+            compact_every (int): number of records before compaction
+            codec (Codec): for the format of the snapshot
+        """
+        super().__init__(file_name, codec)
+        base = os.path.splitext(file_name)[0]
+        self.journal_name = base + ".journal"
+        self.compacting_name = base + ".journal.old"
+        self.checkpoint_name = base + ".journal.checkpoint"
+        self.journal_lock_name = base + ".journal.lock"
+        self.compact_every = compact_every
+
+        self._append_lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        self._compactor = None
+        self._pending = self._count_records(self.journal_name)
+
+    @staticmethod
+    def _count_records(path: str) -> int:
+        """Count the records currently in a journal file."""
+        if not os.path.exists(path):
+            return 0
+        with open(path, 'rb') as file:
+            return sum(1 for _ in file)
+
+    @staticmethod
+    def replay(data: dict, path: str, users=None) -> dict:
+        """
+        Replay the records of a journal file onto the data.
+
+        A torn (partially written) last record is ignored.
+
+        Args:
+            data (dict): the snapshot data to bring up to date
+            path (str): the journal file to replay
+            users (set, optional): only replay the records of these users
+        """
+        if not os.path.exists(path):
+            return data
+        with open(path, 'r') as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    break
+                if users is not None and record["user"] not in users:
+                    continue
+                if record["op"] == "user":
+                    data[record["user"]] = record["data"]
+                elif record["op"] == "expense":
+                    apply_expense(
+                        data[record["user"]], record["category"],
+                        record["date"], record["entry"])
+        return data
+
+    def _snapshot_digest(self) -> str:
+        """Return the digest of the current snapshot file."""
+        if not os.path.exists(self.file_name):
+            return ""
+        digest = hashlib.sha1()
+        with open(self.file_name, 'rb') as file:
+            for chunk in iter(lambda: file.read(1 << 20), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def _compacted(self) -> bool:
+        """
+        Check whether the old journal segment is already in the snapshot.
+
+        This happens when a compaction was interrupted after the snapshot
+        was written but before the old segment was removed.
+        """
+        if not os.path.exists(self.checkpoint_name):
+            return False
+        with open(self.checkpoint_name, 'r') as file:
+            checkpoint = file.read().strip()
+        return checkpoint == self._snapshot_digest()
+
+    @timed()
+    def retrieve(self) -> dict:
+        """
+        This method retrieve the snapshot and replay the journal onto it.
+        """
+        with self._compact_lock, file_lock(self.lock_name):
+            return self._replay_journals(super().retrieve())
+
+    def _replay_journals(self, data: dict, users=None) -> dict:
+        """Replay the journal (and an unfinished compaction) onto snapshot data."""
+        if os.path.exists(self.compacting_name) and not self._compacted():
+            self.replay(data, self.compacting_name, users)
+        return self.replay(data, self.journal_name, users)
+
+    @timed()
+    def load_users(self, usernames) -> dict:
+        """
+        This method streams the given users out of the snapshot and
+        replays only their journal records onto them.
+        """
+        users = set(usernames)
+        with self._compact_lock, file_lock(self.lock_name):
+            data = self._replay_journals(super().load_users(users), users)
+        return {username: data[username] for username in users if username in data}
+
+    def usernames(self):
+        """
+        This method returns the username of every user of the snapshot
+        and of the journal.
+        """
+        with self._compact_lock, file_lock(self.lock_name):
+            usernames = dict.fromkeys(super().usernames())
+            for path in (self.compacting_name, self.journal_name):
+                if os.path.exists(path):
+                    with open(path, 'r') as file:
+                        for line in file:
+                            try:
+                                usernames[json.loads(line)["user"]] = None
+                            except json.JSONDecodeError:
+                                break
+        return list(usernames)
+
+    def _write_snapshot(self, data) -> None:
+        """Write the snapshot and a checkpoint of what it contains."""
+        content = self.codec.encode(data)
+        atomic_write(self.checkpoint_name, hashlib.sha1(content).hexdigest().encode())
+        atomic_write(self.file_name, content)
+
+    @timed()
+    def save(self, data) -> None:
+        """
+        This method write the whole data as the new snapshot
+        and discard the journal.
+
+        Args:
+            data (dict): the data of every user
+        """
+        self.close()
+        with self._compact_lock, file_lock(self.lock_name), \
+                self._append_lock, file_lock(self.journal_lock_name):
+            self._write_snapshot(data)
+            for path in (self.journal_name, self.compacting_name, self.checkpoint_name):
+                if os.path.exists(path):
+                    os.remove(path)
+            self._pending = 0
+
+    def append(self, records) -> None:
+        """
+        Append records to the journal and make them durable.
+
+        Args:
+            records (list): the journal records to append
+        """
+        lines = "".join(json.dumps(record) + "\n" for record in records)
+        with self._append_lock, file_lock(self.journal_lock_name):
+            with open(self.journal_name, 'a') as file:
+                file.write(lines)
+                file.flush()
+                os.fsync(file.fileno())
+            self._pending += len(records)
+            should_compact = self._pending >= self.compact_every
+
+        if should_compact and not (self._compactor and self._compactor.is_alive()):
+            self._compactor = threading.Thread(target=self.compact)
+            self._compactor.start()
+
+    def compact(self) -> None:
+        """
+        Fold the journal into the snapshot.
+
+        The current journal is moved aside first, so new records keep being
+        appended to a fresh journal while the compaction runs. Other
+        processes are kept out with the lock of the snapshot.
+        """
+        with self._compact_lock, file_lock(self.lock_name):
+            with self._append_lock, file_lock(self.journal_lock_name):
+                if os.path.exists(self.compacting_name) and self._compacted():
+                    os.remove(self.compacting_name)
+                    os.remove(self.checkpoint_name)
+                if not os.path.exists(self.compacting_name):
+                    if not os.path.exists(self.journal_name):
+                        return
+                    os.replace(self.journal_name, self.compacting_name)
+                    self._pending = 0
+
+            data = InformationManager.retrieve(self)
+            self.replay(data, self.compacting_name)
+            self._write_snapshot(data)
+            os.remove(self.compacting_name)
+            os.remove(self.checkpoint_name)
+
+    def close(self) -> None:
+        """Wait for a running compaction to finish."""
+        if self._compactor and self._compactor.is_alive():
+            self._compactor.join()
+
+    @timed()
+    def save_user(self, username: str, record: dict) -> None:
+        """
+        This method appends a single user's record to the journal.
+
+        Args:
+            username (str): the owner of the record
+            record (dict): the full user record
+        """
+        self.append([{"op": "user", "user": username, "data": record}])
+
+    @timed()
+    def save_users(self, records: dict) -> None:
+        """
+        This method appends the records of several users to the journal.
+
+        Args:
+            records (dict): the full record of every user to save
+        """
+        self.append([{"op": "user", "user": username, "data": record}
+                     for username, record in records.items()])
+
+    @timed()
+    def save_expenses(self, username: str, entries) -> None:
+        """
+        This method appends a batch of expense entries to the journal.
+
+        Args:
+            username (str): the owner of the expenses
+            entries (iterable): (category, date, entry) tuples
+        """
+        self.append([
+            {"op": "expense", "user": username, "category": category,
+             "date": date, "entry": entry}
+            for category, date, entry in entries
+        ])
+
+
+class ShardedManager(InformationManager):
+    def __init__(self, directory, codec: Codec = None) -> None:
+        """
+        ShardedManager: stores every user in its own json shard.
+
+        Shards are bucketed by the hash of the username, so loading a user
+        only parses that user's file no matter how many users there are.
+        The usernames are kept in a small append-only index that is only
+        read when every user is needed.
+
+        Args:
+            directory (str): for the directory of the shards
+            codec (Codec): for the format of the shards
+        """
+        self.directory = directory
+        self.codec = codec or default_codec("json-compact")
+        self.index_name = os.path.join(directory, "index.txt")
+        os.makedirs(directory, exist_ok=True)
+
+    def shard_path(self, username: str) -> str:
+        """Return the path of the shard of a user."""
+        digest = hashlib.sha1(username.encode()).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest + ".json")
+
+    def __contains__(self, username: str) -> bool:
+        return os.path.exists(self.shard_path(username))
+
+    def usernames(self):
+        """Yield the username of every stored user."""
+        if not os.path.exists(self.index_name):
+            return
+        with open(self.index_name, 'r') as file:
+            for line in file:
+                if username := line.rstrip("\n"):
+                    yield json.loads(username)
+
+    @timed()
+    def load_user(self, username: str):
+        """
+        This method loads a single user's record, or None if
+        the user has no record yet.
+        """
+        path = self.shard_path(username)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as file:
+            return self.codec.decode(file.read())
+
+    @timed()
+    def load_users(self, usernames) -> dict:
+        """
+        This method loads the records of several users, shard by shard.
+        """
+        records = {username: self.load_user(username) for username in usernames}
+        return {username: record for username, record in records.items() if record is not None}
+
+    @timed()
+    def retrieve(self) -> dict:
+        """
+        This method retrieve every user, shard by shard.
+        """
+        return {username: self.load_user(username) for username in self.usernames()}
+
+    @timed()
+    def save(self, data) -> None:
+        """
+        This method write every user of the data to their shard.
+
+        Args:
+            data (dict): the data of every user
+        """
+        for username, record in data.items():
+            self.save_user(username, record)
+
+    @timed()
+    def save_user(self, username: str, record: dict) -> None:
+        """
+        This method writes a single user's shard.
+
+        Args:
+            username (str): the owner of the record
+            record (dict): the full user record
+        """
+        path = self.shard_path(username)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with file_lock(self._bucket_lock(path)):
+            self._write_shard(username, path, record)
+
+    @timed()
+    def save_users(self, records: dict) -> None:
+        """
+        This method writes the shards of several users.
+        """
+        for username, record in records.items():
+            self.save_user(username, record)
+
+    def _bucket_lock(self, path: str) -> str:
+        """Return the lock file of the bucket of a shard."""
+        return os.path.join(os.path.dirname(path), ".lock")
+
+    def _write_shard(self, username: str, path: str, record: dict) -> None:
+        """Write a shard atomically (the bucket lock must be held)."""
+        is_new = not os.path.exists(path)
+        atomic_write(path, self.codec.encode(record))
+
+        if is_new:
+            with file_lock(self.index_name + ".lock"):
+                with open(self.index_name, 'a') as file:
+                    file.write(json.dumps(username) + "\n")
+
+    @timed()
+    def save_expenses(self, username: str, entries) -> None:
+        """
+        This method applies a batch of expense entries to a user's shard.
+
+        Args:
+            username (str): the owner of the expenses
+            entries (iterable): (category, date, entry) tuples
+        """
+        path = self.shard_path(username)
+        if not os.path.exists(path):
+            raise unknown_user(username)
+        with file_lock(self._bucket_lock(path)):
+            record = self.load_user(username)
+            for category, date, entry in entries:
+                apply_expense(record, category, date, entry)
+            self._write_shard(username, path, record)
+
+
+def connect_sqlite(file_name: str, schema: str):
+    """
+    Open an sqlite database (in WAL mode) and create its schema.
+
+    Args:
+        file_name (str): for the name of the database file
+        schema (str): the CREATE statements of the database
+    """
+    import sqlite3
+
+    connection = sqlite3.connect(
+        file_name, isolation_level=None, check_same_thread=False, timeout=30)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.executescript(schema)
+    return connection
+
+
+class SQLiteManager(InformationManager):
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS users (
+            username TEXT PRIMARY KEY,
+            remaining_balance INTEGER NOT NULL,
+            profile TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS expenses (
+            id INTEGER PRIMARY KEY,
+            username TEXT NOT NULL REFERENCES users (username),
+            category TEXT NOT NULL,
+            date TEXT NOT NULL,
+            amount INTEGER NOT NULL,
+            notes TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS expenses_by_date ON expenses (username, date);
+        CREATE INDEX IF NOT EXISTS expenses_by_category ON expenses (username, category, date);
+    """
+
+    def __init__(self, file_name) -> None:
+        """
+        SQLiteManager: stores the users and their expenses in sqlite.
+
+        Every expense is a row of an indexed table, so a single user or a
+        range of expenses is loaded with a query instead of parsing the
+        whole data, and an expense is saved as one insert in a transaction
+        (so concurrent sessions do not overwrite each other).
+
+        Args:
+            file_name (str): for the name of the database file
+        """
+        self.file_name = file_name
+        self._lock = threading.Lock()
+        self.connection = connect_sqlite(file_name, self.SCHEMA)
+
+        # username -> {(category, date, amount, notes): [id, ...]}, the rows,
+        # and username -> remaining balance, as this connection loaded or
+        # saved them, so a save only writes the changes
+        self._persisted = {}
+        self._balances = {}
+
+    def close(self) -> None:
+        """Close the database connection."""
+        self.connection.close()
+
+    def _transaction(self):
+        """Start a write transaction and return the connection."""
+        self.connection.execute("BEGIN IMMEDIATE")
+        return self.connection
+
+    def _write(self, function, *args):
+        """Run function(connection, *args) inside a write transaction."""
+        with self._lock:
+            connection = self._transaction()
+            try:
+                result = function(connection, *args)
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+            return result
+
+    @staticmethod
+    def _rows(connection, username: str) -> dict:
+        """Return the ids of a user's expense rows, by row."""
+        rows = {}
+        for row_id, *row in connection.execute(
+                "SELECT id, category, date, amount, notes FROM expenses"
+                " WHERE username = ? ORDER BY id", (username,)):
+            rows.setdefault(tuple(row), []).append(row_id)
+        return rows
+
+    def _load(self, username: str, remaining_balance: int, profile: str) -> dict:
+        """Build a user record (in the json shape) from its rows."""
+        record = json.loads(profile)
+        record["_remaining_balance"] = self._balances[username] = remaining_balance
+        expenses = record["_expenses"] = {}
+        rows = self._persisted[username] = {}
+        for row_id, category, date, amount, notes in self.connection.execute(
+                "SELECT id, category, date, amount, notes FROM expenses"
+                " WHERE username = ? ORDER BY id", (username,)):
+            rows.setdefault((category, date, amount, notes), []).append(row_id)
+            expenses.setdefault(category, {}).setdefault(date, []).append(
+                {"amount": amount, "notes": notes})
+        return record
+
+    def __contains__(self, username: str) -> bool:
+        row = self.connection.execute(
+            "SELECT 1 FROM users WHERE username = ?", (username,)).fetchone()
+        return row is not None
+
+    @timed()
+    def load_user(self, username: str):
+        """
+        This method loads a single user's record, or None if
+        the user has no record yet.
+        """
+        with self._lock:
+            row = self.connection.execute(
+                "SELECT remaining_balance, profile FROM users WHERE username = ?",
+                (username,)).fetchone()
+            if row is None:
+                return None
+            return self._load(username, *row)
+
+    def usernames(self):
+        """
+        This method returns the username of every stored user.
+        """
+        with self._lock:
+            return [row[0] for row in self.connection.execute("SELECT username FROM users")]
+
+    @timed()
+    def load_users(self, usernames) -> dict:
+        """
+        This method loads the records of several users, one query each.
+        """
+        records = {username: self.load_user(username) for username in usernames}
+        return {username: record for username, record in records.items() if record is not None}
+
+    @timed()
+    def retrieve(self) -> dict:
+        """
+        This method retrieve every user.
+        """
+        with self._lock:
+            rows = self.connection.execute(
+                "SELECT username, remaining_balance, profile FROM users").fetchall()
+            return {row[0]: self._load(*row) for row in rows}
+
+    def _save_user(self, connection, username: str, record: dict) -> tuple:
+        """
+        Save a user's row, and insert (or delete) only the expense rows that
+        changed since this connection last loaded or saved the user. Rows
+        inserted by other connections meanwhile are left as they are, and so
+        is what they took from the remaining balance: only the change of the
+        balance is applied.
+
+        Returns:
+            tuple: the username and the ids of its rows, once committed
+        """
+        profile = json.dumps({key: value for key, value in record.items()
+                              if key not in ("_expenses", "_remaining_balance")})
+        balance = record["_remaining_balance"]
+        updated = username in self._balances and connection.execute(
+            "UPDATE users SET remaining_balance = remaining_balance + ?, profile = ?"
+            " WHERE username = ?", (balance - self._balances[username], profile, username)).rowcount
+        if not updated:
+            connection.execute(
+                "INSERT OR REPLACE INTO users (username, remaining_balance, profile)"
+                " VALUES (?, ?, ?)", (username, balance, profile))
+
+        persisted = self._persisted.get(username)
+        if persisted is None:
+            persisted = self._rows(connection, username)
+        unmatched = {row: list(ids) for row, ids in persisted.items()}
+
+        rows = {}
+        for category, dates in record.get("_expenses", {}).items():
+            for date, entries in dates.items():
+                for entry in entries:
+                    row = (category, date, entry["amount"], entry["notes"])
+                    if ids := unmatched.get(row):
+                        row_id = ids.pop(0)
+                    else:
+                        row_id = connection.execute(
+                            "INSERT INTO expenses (username, category, date, amount, notes)"
+                            " VALUES (?, ?, ?, ?, ?)", (username, *row)).lastrowid
+                    rows.setdefault(row, []).append(row_id)
+
+        connection.executemany("DELETE FROM expenses WHERE id = ?",
+                               ((row_id,) for ids in unmatched.values() for row_id in ids))
+        return username, rows
+
+    @timed()
+    def save(self, data) -> None:
+        """
+        This method write every user of the data.
+
+        Args:
+            data (dict): the data of every user
+        """
+        self.save_users(data)
+
+    @timed()
+    def save_user(self, username: str, record: dict) -> None:
+        """
+        This method saves a single user's record.
+
+        Args:
+            username (str): the owner of the record
+            record (dict): the full user record
+        """
+        self.save_users({username: record})
+
+    @timed()
+    def save_users(self, records: dict) -> None:
+        """
+        This method saves the records of several users in one transaction.
+        """
+        def save_all(connection):
+            return dict(self._save_user(connection, username, record)
+                        for username, record in records.items())
+        self._persisted.update(self._write(save_all))
+        self._balances.update((username, record["_remaining_balance"]) for username, record in records.items())
+
+    @timed()
+    def save_expenses(self, username: str, entries) -> None:
+        """
+        This method inserts a batch of expense entries of a single user.
+
+        Args:
+            username (str): the owner of the expenses
+            entries (iterable): (category, date, entry) tuples
+        """
+        rows = [(username, category, date, entry["amount"], entry["notes"])
+                for category, date, entry in entries]
+
+        def insert(connection):
+            if (user := connection.execute(
+                    "SELECT profile FROM users WHERE username = ?", (username,)).fetchone()) is None:
+                raise unknown_user(username)
+            profile = json.loads(user[0])
+            ids = [connection.execute(
+                "INSERT INTO expenses (username, category, date, amount, notes)"
+                " VALUES (?, ?, ?, ?, ?)", row).lastrowid for row in rows]
+            spent = sum(row[3] for row in rows if in_current_period(profile, row[2]))
+            connection.execute(
+                "UPDATE users SET remaining_balance = remaining_balance - ?"
+                " WHERE username = ?", (spent, username))
+            return ids, spent
+        ids, spent = self._write(insert)
+
+        if (persisted := self._persisted.get(username)) is not None:
+            for row, row_id in zip(rows, ids):
+                persisted.setdefault(row[1:], []).append(row_id)
+        if username in self._balances:
+            self._balances[username] -= spent
+
+    def query_expenses(self, username: str, category: str = None,
+                       start: str = None, end: str = None) -> list:
+        """
+        This method returns a user's expenses in date order.
+
+        Args:
+            username (str): the owner of the expenses
+            category (str): only this category, if given
+            start (str): the first ISO date (inclusive), if given
+            end (str): the last ISO date (inclusive), if given
+
+        Returns:
+            list: (category, date, amount, notes) rows
+        """
+        query, params = self._where(username, category, start, end)
+        with self._lock:
+            return self.connection.execute(
+                "SELECT category, date, amount, notes FROM expenses"
+                f" WHERE {query} ORDER BY date, id", params).fetchall()
+
+    def total_expenses(self, username: str, category: str = None,
+                       start: str = None, end: str = None) -> int:
+        """
+        This method returns the sum of a user's expenses, e.g. of a month
+        with start="2023-08-01" and end="2023-08-31".
+        """
+        query, params = self._where(username, category, start, end)
+        with self._lock:
+            return self.connection.execute(
+                f"SELECT COALESCE(SUM(amount), 0) FROM expenses WHERE {query}",
+                params).fetchone()[0]
+
+    @staticmethod
+    def _where(username, category, start, end) -> tuple:
+        """Build the WHERE clause of an expense query."""
+        clauses, params = ["username = ?"], [username]
+        if category is not None:
+            clauses.append("category = ?")
+            params.append(category)
+        if start is not None:
+            clauses.append("date >= ?")
+            params.append(start)
+        if end is not None:
+            clauses.append("date <= ?")
+            params.append(end)
+        return " AND ".join(clauses), params
+
+
+class AccountStore:
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS accounts (
+            username TEXT PRIMARY KEY,
+            password TEXT NOT NULL
+        ) WITHOUT ROWID;
+    """
+
+    def __init__(self, file_name, legacy_file: str = None, hash_function=None) -> None:
+        """
+        AccountStore: the registered accounts, in an indexed sqlite table.
+
+        A login looks up a single account by its username, and a
+        registration inserts a single account, without loading the others.
+
+        Args:
+            file_name (str): for the name of the database file
+            legacy_file (str): a json file of accounts to import once (see
+                import_legacy)
+            hash_function (callable): applied to every password of the
+                legacy file before it is stored
+        """
+        self.file_name = file_name
+        self._lock = threading.Lock()
+        self.connection = connect_sqlite(file_name, self.SCHEMA)
+
+        if legacy_file and os.path.exists(legacy_file):
+            self.import_legacy(legacy_file, hash_function)
+
+    def import_legacy(self, legacy_file: str, hash_function=None) -> None:
+        """
+        This method imports the accounts of a json file (the former storage),
+        then deletes the file, which may hold plain text passwords.
+
+        The accounts already registered are kept. Several processes may
+        import the file at once: a file already gone was imported by another.
+
+        Args:
+            legacy_file (str): the path of the json file
+            hash_function (callable): applied to every password before it is stored
+        """
+        try:
+            with open(legacy_file, 'rb') as file:
+                content = file.read()
+        except FileNotFoundError:
+            return
+        accounts = Codec.decode(content) if content else {}
+        if hash_function:
+            accounts = {username: hash_function(password) for username, password in accounts.items()}
+
+        with self._lock:
+            # the write lock of the database is held until the file is deleted
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                if os.path.exists(legacy_file):
+                    self.connection.executemany(
+                        "INSERT OR IGNORE INTO accounts (username, password) VALUES (?, ?)",
+                        accounts.items())
+                    os.remove(legacy_file)
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+            self.connection.execute("COMMIT")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self.connection.execute("SELECT COUNT(*) FROM accounts").fetchone()[0]
+
+    def __contains__(self, username: str) -> bool:
+        return self.get(username) is not None
+
+    def is_empty(self) -> bool:
+        """This method checks whether no account is registered yet."""
+        with self._lock:
+            return self.connection.execute("SELECT 1 FROM accounts LIMIT 1").fetchone() is None
+
+    def get(self, username: str):
+        """
+        This method returns the stored password (hash) of an account,
+        or None if it is not registered.
+        """
+        with self._lock:
+            row = self.connection.execute(
+                "SELECT password FROM accounts WHERE username = ?", (username,)).fetchone()
+        return row[0] if row else None
+
+    def add(self, username: str, password: str) -> bool:
+        """
+        This method registers a single account.
+
+        Returns:
+            bool: False if the username is already taken.
+        """
+        with self._lock:
+            cursor = self.connection.execute(
+                "INSERT OR IGNORE INTO accounts (username, password) VALUES (?, ?)",
+                (username, password))
+        return cursor.rowcount == 1
+
+    def update(self, username: str, password: str) -> None:
+        """This method replaces the stored password (hash) of an account."""
+        with self._lock:
+            self.connection.execute(
+                "UPDATE accounts SET password = ? WHERE username = ?", (password, username))
+
+    def close(self) -> None:
+        """Close the database connection."""
+        self.connection.close()
+
+
+class WriteBehindManager(InformationManager):
+    def __init__(self, inner: InformationManager, interval: float = 0.5, max_pending: int = 100) -> None:
+        """
+        WriteBehindManager: saves to another storage in the background.
+
+        Saving only marks the user as dirty and returns. The dirty users are
+        written together (group commit) by a background thread, at the latest
+        `interval` seconds later or as soon as `max_pending` saves are waiting.
+        A user's saved record replaces its earlier pending saves, and what is
+        still pending is written when the program exits.
+
+        Args:
+            inner (InformationManager): the storage to write to
+            interval (float): the most seconds a save waits
+            max_pending (int): the number of saves that starts a write at once
+        """
+        self.inner = inner
+        self.interval = interval
+        self.max_pending = max_pending
+
+        # username -> [full record or None, (category, date, entry) saved after it]
+        self._pending = {}
+        self._count = 0
+        self._closed = False
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _run(self) -> None:
+        """Write the pending saves every interval, or once there are enough."""
+        while not self._closed:
+            with self._condition:
+                self._condition.wait_for(
+                    lambda: self._closed or self._count >= self.max_pending, self.interval)
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        This method writes every pending save now.
+
+        A save that fails (e.g. a full disk or a lock timeout) is reported
+        and stays pending, to be written again by the next flush.
+        """
+        with self._flush_lock:
+            with self._condition:
+                pending, self._pending, self._count = self._pending, {}, 0
+            failed = {}
+            for username, (record, entries) in pending.items():
+                try:
+                    if record is not None:
+                        self.inner.save_user(username, record)
+                        record = None
+                    if entries:
+                        self.inner.save_expenses(username, entries)
+                except Exception as error:
+                    print(f"Saving {username} failed, it will be retried: {error}", file=sys.stderr)
+                    failed[username] = [record, entries]
+            if failed:
+                self._requeue(failed)
+
+    def _requeue(self, failed: dict) -> None:
+        """Put failed saves back in front of the saves queued since."""
+        with self._condition:
+            for username, (record, entries) in failed.items():
+                newer = self._pending.get(username)
+                if newer is None:
+                    self._pending[username] = [record, entries]
+                elif newer[0] is None:
+                    # only entries were queued since: they go after the failed ones
+                    self._pending[username] = [record, entries + newer[1]]
+                # a full record queued since replaces what failed
+
+    def close(self) -> None:
+        """
+        This method stops the background thread and writes what is pending.
+        """
+        if not self._closed:
+            with self._condition:
+                self._closed = True
+                self._condition.notify()
+            self._thread.join()
+        self.flush()
+        if hasattr(self.inner, "close"):
+            self.inner.close()
+
+    def _mark(self, username: str, record: dict = None, entries=()) -> None:
+        """Queue a save of a user."""
+        with self._condition:
+            if record is not None:
+                self._pending[username] = [record, []]
+            else:
+                self._pending.setdefault(username, [None, []])[1].extend(entries)
+            self._count += 1
+            if self._count >= self.max_pending:
+                self._condition.notify()
+
+    def save_user(self, username: str, record: dict) -> None:
+        """
+        This method queues the save of a single user's record.
+        """
+        self._mark(username, record=record)
+
+    def save_users(self, records: dict) -> None:
+        """
+        This method queues the saves of several users' records.
+        """
+        for username, record in records.items():
+            self._mark(username, record=record)
+
+    def save_expenses(self, username: str, entries) -> None:
+        """
+        This method queues the save of a batch of expense entries.
+        """
+        self._mark(username, entries=list(entries))
+
+    def load_user(self, username: str):
+        """
+        This method loads a single user's record (pending saves included).
+        """
+        self.flush()
+        return self.inner.load_user(username)
+
+    def usernames(self):
+        """
+        This method returns the username of every stored user (pending saves included).
+        """
+        self.flush()
+        return self.inner.usernames()
+
+    def load_users(self, usernames) -> dict:
+        """
+        This method loads the records of several users (pending saves included).
+        """
+        self.flush()
+        return self.inner.load_users(usernames)
+
+    def retrieve(self) -> dict:
+        """
+        This method retrieve every user (pending saves included).
+        """
+        self.flush()
+        return self.inner.retrieve()
+
+    def save(self, data) -> None:
+        """
+        This method write the whole data, replacing the pending saves.
+        """
+        with self._flush_lock:
+            with self._condition:
+                self._pending, self._count = {}, 0
+            self.inner.save(data)
+
+
+def open_storage(kind: str = None) -> InformationManager:
+    """
+    Open the storage of the users' data.
+
+    Args:
+        kind (str): "journal" (data/data.json with a journal), "sharded"
+            (one shard per user in data/users) or "sqlite" (the
+            data/budgetbits.db database). Defaults to the
+            BUDGETBITS_STORAGE environment variable, then "journal".
+    """
+    kind = kind or os.environ.get("BUDGETBITS_STORAGE", "journal")
+    if kind == "journal":
+        return JournalManager(os.path.join("data", "data.json"))
+    elif kind == "sharded":
+        return ShardedManager(os.path.join("data", "users"))
+    elif kind == "sqlite":
+        return SQLiteManager(os.path.join("data", "budgetbits.db"))
+    raise ValueError(f"Unknown storage '{kind}'.")
@@ -0,0 +1,283 @@
+from functools import lru_cache
+from bisect import bisect_left, bisect_right
+from datetime import date
+from array import array
+
+
+@lru_cache(maxsize=4096)
+def to_ordinal(iso_date: str) -> int:
+    """Convert an ISO date (YYYY-MM-DD) to its ordinal."""
+    return date.fromisoformat(iso_date).toordinal()
+
+
+@lru_cache(maxsize=4096)
+def to_iso(ordinal: int) -> str:
+    """Convert a date ordinal back to its ISO date (YYYY-MM-DD)."""
+    return date.fromordinal(ordinal).isoformat()
+
+
+def to_period(last_updated, today: str) -> str:
+    """
+    Return a budget period as YYYY-MM.
+
+    Records saved before budget periods kept only the month number of the
+    last update (or None before the first one), so the year is taken as
+    the latest one that is not in the future.
+
+    Args:
+        last_updated (str | int | None): the period, or its month number
+        today (str): today's ISO date
+    """
+    if isinstance(last_updated, str):
+        return last_updated
+    elif not last_updated:
+        return today[:7]
+    year, month = int(today[:4]), int(today[5:7])
+    return f"{year if last_updated <= month else year - 1}-{last_updated:02d}"
+
+
+class ExpenseStore:
+    def __init__(self) -> None:
+        """
+        ExpenseStore: a compact, columnar store of expense entries.
+
+        Each column is an array indexed by the row (transaction) id:
+        the amounts, the date ordinals, the category ids and the note ids.
+        Category names and notes are interned, so a repeated category or
+        note is only stored once.
+        """
+        self.amounts = array('q')
+        self.dates = array('i')
+        self.categories = array('I')
+        self.notes = array('I')
+
+        # interned strings
+        self.category_names = []
+        self.note_pool = []
+        self._category_ids = {}
+        self._note_ids = {}
+
+        # the row ids sorted by date, and their dates (to bisect),
+        # built when first needed
+        self._order = None
+        self._order_dates = None
+
+    def __len__(self) -> int:
+        return len(self.amounts)
+
+    def __iter__(self):
+        """Yield every row as (category, date, amount, notes)."""
+        return (self.row(row_id) for row_id in range(len(self)))
+
+    @staticmethod
+    def _intern(value: str, pool: list, ids: dict) -> int:
+        """Return the id of a string, adding it to the pool if needed."""
+        if (value_id := ids.get(value)) is None:
+            value_id = ids[value] = len(pool)
+            pool.append(value)
+        return value_id
+
+    def category_id(self, category: str) -> int:
+        """Return the id of a category, interning it if needed."""
+        return self._intern(category, self.category_names, self._category_ids)
+
+    def find_category(self, category: str):
+        """Return the id of a category, or None if it has no expense."""
+        return self._category_ids.get(category)
+
+    def append(self, category: str, date: str, amount: int, notes: str) -> int:
+        """
+        Append an expense entry.
+
+        Args:
+            category (str): The category of the expense.
+            date (str): The ISO date of the expense.
+            amount (int): The amount of the expense.
+            notes (str): Additional notes for the expense.
+
+        Returns:
+            int: The row (transaction) id of the entry.
+        """
+        # everything that can fail comes first, so the columns stay the same length
+        ordinal = to_ordinal(date)
+        category_id = self.category_id(category)
+        note_id = self._intern(notes, self.note_pool, self._note_ids)
+        self.amounts.append(amount)
+        self.dates.append(ordinal)
+        self.categories.append(category_id)
+        self.notes.append(note_id)
+        row_id = len(self.amounts) - 1
+
+        if self._order is not None:
+            if not self._order_dates or self._order_dates[-1] <= ordinal:
+                # the usual case: an entry of today
+                self._order.append(row_id)
+                self._order_dates.append(ordinal)
+            else:
+                position = bisect_right(self._order_dates, ordinal)
+                self._order.insert(position, row_id)
+                self._order_dates.insert(position, ordinal)
+        return row_id
+
+    def row(self, row_id: int) -> tuple:
+        """Return a row as (category, date, amount, notes)."""
+        return (
+            self.category_names[self.categories[row_id]],
+            to_iso(self.dates[row_id]),
+            self.amounts[row_id],
+            self.note_pool[self.notes[row_id]],
+        )
+
+    def _date_key(self, row_id: int) -> tuple:
+        """Sort rows by date, then by the order they were added."""
+        return self.dates[row_id], row_id
+
+    def drop_order(self) -> None:
+        """
+        Drop the date order, to be rebuilt (with a single sort) when next needed,
+        e.g. before appending many entries that may be back-dated, each of which
+        would otherwise be inserted into it in O(n).
+        """
+        self._order = None
+        self._order_dates = None
+
+    def ordered(self) -> array:
+        """Return the row ids sorted by date."""
+        if self._order is None:
+            self._order = array('I', sorted(range(len(self)), key=self._date_key))
+            self._order_dates = array('i', (self.dates[row_id] for row_id in self._order))
+        return self._order
+
+    def date_range(self, start: str = None, end: str = None) -> range:
+        """
+        Find the expenses between two dates with a binary search.
+
+        Args:
+            start (str): the first ISO date (inclusive), if given
+            end (str): the last ISO date (inclusive), if given
+
+        Returns:
+            range: the positions in ordered() of the expenses in the range
+        """
+        self.ordered()
+        low = 0 if start is None else bisect_left(self._order_dates, to_ordinal(start))
+        high = len(self._order_dates) if end is None else bisect_right(self._order_dates, to_ordinal(end))
+        return range(low, max(low, high))
+
+    def total(self) -> int:
+        """Return the sum of every amount."""
+        return sum(self.amounts)
+
+    @classmethod
+    def from_nested(cls, expenses: dict):
+        """
+        Build a store from the saved shape of the expenses:
+        {category: {date: [{"amount": ..., "notes": ...}]}}
+        """
+        store = cls()
+        for category, dates in expenses.items():
+            for date, entries in dates.items():
+                for entry in entries:
+                    store.append(category, date, entry["amount"], entry["notes"])
+        return store
+
+    def to_nested(self) -> dict:
+        """
+        Return the expenses in their saved shape:
+        {category: {date: [{"amount": ..., "notes": ...}]}}
+        """
+        expenses = {}
+        for category, date, amount, notes in self:
+            expenses.setdefault(category, {}).setdefault(date, []).append(
+                {"amount": amount, "notes": notes})
+        return expenses
+
+
+class ExpenseAggregates:
+    def __init__(self) -> None:
+        """
+        ExpenseAggregates: running totals of the expenses.
+
+        The sum and count of the amounts are kept by category, by date,
+        by month and by (month, category), and are updated in O(1) for
+        every added entry, so a total never rescans the history.
+        """
+        self.overall = [0, 0]
+        self.by_category = {}
+        self.by_date = {}
+        self.by_month = {}
+        self.by_month_category = {}
+
+    @staticmethod
+    def _add(totals: dict, key, amount: int) -> None:
+        """Add an amount to the [sum, count] of a key."""
+        if (total := totals.get(key)) is None:
+            totals[key] = [amount, 1]
+        else:
+            total[0] += amount
+            total[1] += 1
+
+    def add(self, category: str, date: str, amount: int) -> None:
+        """
+        Add an expense entry to the running totals.
+
+        Args:
+            category (str): The category of the expense.
+            date (str): The ISO date of the expense.
+            amount (int): The amount of the expense.
+        """
+        month = date[:7]
+        self.overall[0] += amount
+        self.overall[1] += 1
+        self._add(self.by_category, category, amount)
+        self._add(self.by_date, date, amount)
+        self._add(self.by_month, month, amount)
+        self._add(self.by_month_category.setdefault(month, {}), category, amount)
+
+    @classmethod
+    def from_store(cls, store: ExpenseStore):
+        """Rebuild the running totals from an ExpenseStore."""
+        aggregates = cls()
+        for category, date, amount, _ in store:
+            aggregates.add(category, date, amount)
+        return aggregates
+
+    def total(self, category: str = None, month: str = None, date: str = None) -> int:
+        """
+        Return the sum of the expenses.
+
+        Args:
+            category (str): only this category, if given
+            month (str): only this month (YYYY-MM), if given
+            date (str): only this ISO date, if given (takes precedence)
+        """
+        return self._lookup(category, month, date)[0]
+
+    def count(self, category: str = None, month: str = None, date: str = None) -> int:
+        """Return the number of expenses (see total)."""
+        return self._lookup(category, month, date)[1]
+
+    def _lookup(self, category, month, date) -> list:
+        """Return the [sum, count] of a query."""
+        if date is not None:
+            return self.by_date.get(date, [0, 0])
+        elif month is not None and category is not None:
+            return self.by_month_category.get(month, {}).get(category, [0, 0])
+        elif month is not None:
+            return self.by_month.get(month, [0, 0])
+        elif category is not None:
+            return self.by_category.get(category, [0, 0])
+        return self.overall
+
+    def categories(self, month: str = None) -> dict:
+        """
+        Return the total of every category.
+
+        Args:
+            month (str): only this month (YYYY-MM), if given
+        """
+        if month is None:
+            totals = self.by_category
+        else:
+            totals = self.by_month_category.get(month, {})
+        return {category: total[0] for category, total in totals.items()}
@@ -0,0 +1,144 @@
+"""
+Opt-in timing of the BudgetBits hot operations.
+
+Set BUDGETBITS_PROFILE=1 to time every operation decorated with `timed` (the
+storage reads and writes, expense_entry, display_expenses, the login and the
+title rendering). A summary of their counts, times and latency histograms is
+printed to stderr at exit, or written as json to the file named by
+BUDGETBITS_PROFILE instead of 1. Set BUDGETBITS_CPROFILE=<file> to also dump
+the cProfile stats of the whole run (read them with `python -m pstats <file>`).
+
+Both variables are read once, at import: when profiling is off, `timed` returns
+the functions unchanged, so it costs nothing.
+"""
+from functools import wraps
+import threading
+import atexit
+import json
+import time
+import sys
+import os
+
+PROFILE = os.environ.get("BUDGETBITS_PROFILE", "").strip()
+CPROFILE = os.environ.get("BUDGETBITS_CPROFILE", "").strip()
+ENABLED = bool(PROFILE or CPROFILE)
+
+_stats = {}
+_lock = threading.Lock()
+
+
+def record(name: str, seconds: float) -> None:
+    """
+    Record a call of an operation.
+
+    The latency histogram has one bucket per power of two microseconds:
+    bucket b counts the calls of less than 2**b microseconds.
+
+    Args:
+        name (str): the name of the operation
+        seconds (float): the duration of the call
+    """
+    bucket = int(seconds * 1_000_000).bit_length()
+    with _lock:
+        stat = _stats.get(name)
+        if stat is None:
+            stat = _stats[name] = {"count": 0, "total": 0.0, "min": seconds, "max": seconds, "buckets": {}}
+        stat["count"] += 1
+        stat["total"] += seconds
+        stat["min"] = min(stat["min"], seconds)
+        stat["max"] = max(stat["max"], seconds)
+        stat["buckets"][bucket] = stat["buckets"].get(bucket, 0) + 1
+
+
+def timed(name: str = None):
+    """
+    Decorate a function to time its calls when profiling is on.
+
+    Args:
+        name (str, optional): the name of the operation, the qualified
+            name of the function by default
+    """
+    def decorator(function):
+        if not ENABLED:
+            return function
+        operation = name or function.__qualname__
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                record(operation, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def percentile(buckets: dict, fraction: float) -> float:
+    """Return the upper bound (in seconds) of the bucket of a percentile."""
+    target = fraction * sum(buckets.values())
+    seen = 0
+    for bucket in sorted(buckets):
+        seen += buckets[bucket]
+        if seen >= target:
+            return 2 ** bucket / 1_000_000
+    return 0.0
+
+
+def stats() -> dict:
+    """
+    Return the recorded operations.
+
+    Returns:
+        dict: the count, total, mean, min, max, p50, p99 (in seconds) and
+            histogram ({upper bound in microseconds: calls}) of every operation
+    """
+    with _lock:
+        recorded = {name: dict(stat, buckets=dict(stat["buckets"])) for name, stat in _stats.items()}
+
+    return {
+        name: {
+            "count": stat["count"],
+            "total": stat["total"],
+            "mean": stat["total"] / stat["count"],
+            "min": stat["min"],
+            "max": stat["max"],
+            "p50": percentile(stat["buckets"], 0.5),
+            "p99": percentile(stat["buckets"], 0.99),
+            "histogram": {2 ** bucket: calls for bucket, calls in sorted(stat["buckets"].items())},
+        }
+        for name, stat in recorded.items()
+    }
+
+
+def summary() -> str:
+    """Return the recorded operations in a table, slowest in total first."""
+    lines = [f"{'operation':<36} {'count':>8} {'total ms':>11} {'mean ms':>10} {'p99 ms <':>10} {'max ms':>10}"]
+    for name, stat in sorted(stats().items(), key=lambda item: -item[1]["total"]):
+        lines.append(f"{name:<36} {stat['count']:>8} {stat['total'] * 1000:>11.3f} {stat['mean'] * 1000:>10.3f}"
+                     f" {stat['p99'] * 1000:>10.3f} {stat['max'] * 1000:>10.3f}")
+    return "\n".join(lines)
+
+
+def _report(profiler=None) -> None:
+    """Write the summary, and the cProfile stats, at exit."""
+    if profiler is not None:
+        profiler.disable()
+        profiler.dump_stats(CPROFILE)
+
+    if not PROFILE:
+        return
+    if PROFILE.lower() in ("1", "true", "yes", "on"):
+        print("\nBudgetBits profile\n" + summary(), file=sys.stderr)
+    else:
+        with open(PROFILE, 'w') as file:
+            json.dump(stats(), file, indent=4)
+
+
+if ENABLED:
+    _profiler = None
+    if CPROFILE:
+        import cProfile
+        _profiler = cProfile.Profile()
+        _profiler.enable()
+    atexit.register(_report, _profiler)
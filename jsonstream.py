@@ -0,0 +1,222 @@
+"""
+Streaming reader of the (plain json) data files, with bounded memory.
+
+The top-level user map, each user record and its nested _expenses are walked
+event by event (a key, a value, the end of a map...), reading the file one
+chunk at a time, so a single user can be pulled out of a file, or the users
+iterated one at a time, without loading the whole file. The small leaves
+(e.g. the [{"amount": ..., "notes": ...}] entries of a day) are decoded by the
+json module.
+"""
+import json
+import re
+
+WHITESPACE = re.compile(r"\s*")
+NUMBER_CHARS = "0123456789.eE+-"
+
+CHUNK_SIZE = 1 << 16
+
+
+class JsonStream:
+    def __init__(self, file, chunk_size: int = CHUNK_SIZE) -> None:
+        """
+        JsonStream: an incremental json parser over a text file.
+
+        Only the unread part of the current chunk (and of a value spanning
+        chunks) is kept in memory.
+
+        Args:
+            file (file): the file, opened in text mode
+            chunk_size (int): the number of characters read at once
+        """
+        self.file = file
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self, size: int = None) -> bool:
+        """Read more of the file, dropping what was parsed; False at the end."""
+        if self.eof:
+            return False
+        chunk = self.file.read(size or self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """
+        Return the next character that is not whitespace, without consuming it.
+
+        Raises:
+            ValueError: At the end of the data.
+        """
+        while True:
+            self.pos = WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                raise ValueError("Invalid json data: unexpected end.")
+
+    def expect(self, char: str) -> None:
+        """Consume a structural character."""
+        if (found := self.peek()) != char:
+            raise ValueError(f"Invalid json data: expected '{char}', found '{found}'.")
+        self.pos += 1
+
+    def read_value(self):
+        """Decode the next value (a string, number, literal, or a whole map or array)."""
+        self.peek()
+        size = self.chunk_size
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                value, end = None, None
+            # a number at the end of the buffer ("12" of "12.5") may go on in the next chunk
+            if end is not None and (self.eof or (end < len(self.buffer) and not (
+                    isinstance(value, (int, float)) and self.buffer[end] in NUMBER_CHARS))):
+                self.pos = end
+                return value
+            if not self._fill(size) and end is None:
+                raise ValueError("Invalid json data.")
+            # a long value is read in growing chunks
+            size *= 2
+
+    def skip_value(self) -> None:
+        """
+        Skip the next value.
+
+        A map or array within the buffer is skipped by the json module; a
+        longer one is walked one level down, skipping its items in turn.
+        """
+        char = self.peek()
+        if char not in "{[":
+            self.read_value()
+            return
+        try:
+            self.pos = self.decoder.raw_decode(self.buffer, self.pos)[1]
+            return
+        except json.JSONDecodeError:
+            pass
+        for _ in self._items(char, "}" if char == "{" else "]", keyed=char == "{"):
+            self.skip_value()
+
+    def _items(self, opening: str, closing: str, keyed: bool):
+        self.expect(opening)
+        if self.peek() == closing:
+            self.pos += 1
+            return
+        while True:
+            if keyed:
+                key = self.read_value()
+                if not isinstance(key, str):
+                    raise ValueError("Invalid json data: a key must be a string.")
+                self.expect(":")
+                yield key
+            else:
+                yield None
+            # the caller has read (or skipped) the value by now
+            char = self.peek()
+            self.pos += 1
+            if char == closing:
+                return
+            if char != ",":
+                raise ValueError(f"Invalid json data: expected ',' or '{closing}', found '{char}'.")
+
+    def iter_map(self):
+        """
+        Yield the keys of the next map, one at a time.
+
+        The value of each key must be read (read_value, iter_map, iter_array)
+        or skipped (skip_value) before asking for the next key.
+        """
+        return self._items("{", "}", keyed=True)
+
+    def iter_array(self):
+        """Yield once for every item of the next array (see iter_map)."""
+        return self._items("[", "]", keyed=False)
+
+
+def read_expenses(stream: JsonStream) -> dict:
+    """Read the nested expenses {category: {date: [entry]}} of a user, one date at a time."""
+    expenses = {}
+    for category in stream.iter_map():
+        dates = expenses[category] = {}
+        for date in stream.iter_map():
+            dates[date] = stream.read_value()
+    return expenses
+
+
+def read_user(stream: JsonStream) -> dict:
+    """Read a user record, walking its expenses day by day."""
+    record = {}
+    for key in stream.iter_map():
+        if key == "_expenses" and stream.peek() == "{":
+            record[key] = read_expenses(stream)
+        else:
+            record[key] = stream.read_value()
+    return record
+
+
+def is_plain_json(path: str) -> bool:
+    """Check whether a data file is a plain (uncompressed) json map."""
+    try:
+        with open(path, 'rb') as file:
+            return file.read(4096).lstrip()[:1] == b"{"
+    except OSError:
+        return False
+
+
+def iter_users(path: str, usernames=None):
+    """
+    Yield the users of a plain json data file, one at a time.
+
+    Args:
+        path (str): the path of the data file
+        usernames (iterable, optional): only these users (the others are
+            skipped without being decoded, and the reading stops once they
+            were all found)
+
+    Yields:
+        tuple: the (username, record) of each user
+    """
+    wanted = None if usernames is None else set(usernames)
+    if wanted is not None and not wanted:
+        return
+    with open(path, 'r', encoding='utf-8') as file:
+        stream = JsonStream(file)
+        for username in stream.iter_map():
+            if wanted is not None and username not in wanted:
+                stream.skip_value()
+                continue
+            yield username, read_user(stream)
+            if wanted is not None:
+                wanted.discard(username)
+                if not wanted:
+                    return
+
+
+def iter_usernames(path: str):
+    """Yield the usernames of a plain json data file, skipping their records."""
+    with open(path, 'r', encoding='utf-8') as file:
+        stream = JsonStream(file)
+        for username in stream.iter_map():
+            stream.skip_value()
+            yield username
+
+
+def load_user(path: str, username: str):
+    """
+    Read a single user's record from a plain json data file.
+
+    Returns:
+        dict: the record of the user, or None if the user has none
+    """
+    for _, record in iter_users(path, [username]):
+        return record
+    return None
@@ -1,7 +1,7 @@
 from budgetbits import AccountValidator, BudgetBits, clear
-from data import InformationManager
+from data import open_storage, WriteBehindManager
+from alerts import TerminalSink, environment_sinks
 import sys
-import os
 
 
 def main():
@@ -12,42 +12,46 @@ def main():
     and manages the overall flow of the BudgetBits application.
     """
 
-    # check the registered users
-    info = InformationManager(os.path.join("data", "data.json"))
-    users = info.retrieve()
+    # the storage of the users' data, written in the background
+    info = WriteBehindManager(open_storage())
 
     # login process
     username = current_account()
     clear()
 
-    if username not in users:
+    # only the logged in user's data is loaded
+    if (record := info.load_user(username)) is None:
         user = register_user(username)
-        users[username] = user.__dict__
-        info.save(users)
+        user.alerts.sinks = [TerminalSink(), *environment_sinks()]
+        info.save_user(username, user.to_dict())
         print(f"\n{f'Welcome to BudgetBits, {username}!':^80}")
 
     else:
-        user = existing_user(users[username])
+        user = existing_user(record)
+        user.alerts.sinks = [TerminalSink(), *environment_sinks()]
+        # the recurring expenses due since the last session
+        if user.materialize_recurring():
+            info.save_user(username, user.to_dict())
 
         clear()
         print(f"\n{f'Welcome back to BudgetBits, {username}!':^80}")
 
         if update := user.monthly_budget_update(monthly_update):
-            users[username] = update
-            info.save(users)
+            info.save_user(username, update)
 
     while True:
         print(user)
-        print(f"\n{'[P]ersonal | [A]dd | [S]how | [E]xit':^80}\n")
+        print(f"\n{'[P]ersonal | [A]dd | [S]how | [H]istory | [E]xit':^80}\n")
         prompt = input(" >> ").upper()
         if prompt == "P":
             print(user.display_information())
         elif prompt == "A":
             if expense_added := adding_expense(user):
-                users[username] = expense_added
-                info.save(users)
+                info.save_expense(username, *expense_added)
         elif prompt == "S":
-            print(user.display_expenses())
+            showing_expenses(user)
+        elif prompt == "H":
+            print(user.display_periods())
         elif prompt == "E" or prompt == "EXIT":
             sys.exit()
         else:
@@ -129,7 +133,10 @@ def existing_user(data: dict):
         data["_monthly_budget"],
         data["_expenses"],
         data["_remaining_balance"],
-        data["last_updated"]
+        data["last_updated"],
+        data.get("periods"),
+        data.get("recurring"),
+        data.get("alerts")
     )
 
 
@@ -186,6 +193,9 @@ def adding_expense(user):
 
     Args:
         user (BudgetBits): The BudgetBits instance of the user.
+
+    Returns:
+        tuple: The (category, date, entry) of the added expense, or False if cancelled.
     """
 
     print(f"{'--- ADDING EXPENSE ---':^80}")
@@ -213,6 +223,28 @@ def adding_expense(user):
     return False
 
 
+def showing_expenses(user, page_size: int = 20):
+    """
+    Show the user's expenses in the BudgetBits application, one page at a time.
+
+    Args:
+        user (BudgetBits): The BudgetBits instance of the user.
+        page_size (int, optional): The number of expenses of a page. Defaults to 20.
+    """
+    pages = user.expense_pages(page_size)
+    if (page := next(pages, None)) is None:
+        print(user.display_expenses())
+        return
+
+    while True:
+        print(page)
+        if (page := next(pages, None)) is None:
+            break
+        prompt = input("(Press [N] for the next page or any key to stop.) >> ").upper()
+        if prompt != "N":
+            break
+
+
 def validate_name(name: str, message: str = 'Full'):
     """
     Validate the provided name for BudgetBits personal information.
@@ -230,6 +262,30 @@ def validate_name(name: str, message: str = 'Full'):
     return name
 
 
+def parse_amount(amount: str) -> int:
+    """
+    Parse the provided amount for BudgetBits expenses.
+
+    This function converts a provided amount to an integer and checks if it's positive.
+
+    Args:
+        amount (str): The amount to be parsed.
+
+    Returns:
+        int: The parsed amount.
+
+    Raises:
+        ValueError: If the amount is not a positive integer.
+    """
+    try:
+        amount = int(amount.replace(',', '_'))
+    except ValueError:
+        raise ValueError("Invalid input. Please enter a valid integer for the amount.")
+    if amount <= 0:
+        raise ValueError("Invalid input. Please enter a positive value for the amount.")
+    return amount
+
+
 def validate_amount(amount: str):
     """
     Validate the provided amount for BudgetBits expenses.
@@ -243,13 +299,9 @@ def validate_amount(amount: str):
         int: The validated amount.
     """
     try:
-        amount = int(amount.replace(',', '_'))
-        if amount <= 0:
-            print("Invalid input. Please enter a positive value for the amount.")
-        else:
-            return amount
-    except ValueError:
-        print("Invalid input. Please enter a valid integer for the monthly budget.")
+        return parse_amount(amount)
+    except ValueError as message:
+        print(message)
 
 
 if __name__ == "__main__":
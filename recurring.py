@@ -0,0 +1,205 @@
+"""
+Recurring expenses (rent, subscriptions, tuition...) of a BudgetBits user.
+
+A rule repeats an expense on a schedule:
+    daily, weekly (on the weekday of its start), monthly (on the day of its
+    start, or the last day of shorter months), or "cron DOM MON DOW" with the
+    day of the month, month and day of the week (0 or 7 is Sunday) fields of
+    cron, e.g. "cron 1,15 * *" or "cron * * 1-5". A full five fields cron
+    line ("0 9 1 * *") is accepted too, its minute and hour are ignored.
+
+The occurrences are only recorded (materialized) up to today, when the user
+is loaded or a budget period starts, in date order from a heap of the next
+due date of every rule.
+"""
+from expenses import to_ordinal
+from datetime import date, timedelta
+import calendar
+import heapq
+
+SCHEDULES = ("daily", "weekly", "monthly")
+
+# the longest gap between two matches of a valid cron schedule (29 February)
+CRON_HORIZON = 366 * 8
+
+
+def parse_field(field: str, low: int, high: int) -> set:
+    """
+    Parse a cron field: *, a number, a range a-b, a step */n or a-b/n, or a list of them.
+
+    Raises:
+        ValueError: If the field is not valid.
+    """
+    values = set()
+    for part in field.split(","):
+        part, _, step = part.partition("/")
+        if part == "*":
+            first, last = low, high
+        elif "-" in part:
+            first, last = (int(value) for value in part.split("-", 1))
+        else:
+            first = last = int(part)
+        if not (low <= first <= last <= high):
+            raise ValueError(f"Invalid cron field '{field}'.")
+        values.update(range(first, last + 1, int(step) if step else 1))
+    return values
+
+
+class CronSchedule:
+    def __init__(self, expression: str) -> None:
+        """
+        CronSchedule: the days matching the day of the month, month and day
+        of the week fields of a cron expression.
+
+        As in cron, when both the day of the month and the day of the week
+        are restricted, a day matching either of them matches.
+
+        Raises:
+            ValueError: If the expression is not valid.
+        """
+        fields = expression.split()
+        if len(fields) == 5:
+            fields = fields[2:]
+        if len(fields) != 3:
+            raise ValueError(f"Invalid cron schedule '{expression}'. Use 'cron DOM MON DOW'.")
+        try:
+            self.days = parse_field(fields[0], 1, 31)
+            self.months = parse_field(fields[1], 1, 12)
+            self.weekdays = {weekday % 7 for weekday in parse_field(fields[2], 0, 7)}
+        except ValueError:
+            raise ValueError(f"Invalid cron schedule '{expression}'.")
+        self.any_day = fields[0] == "*"
+        self.any_weekday = fields[2] == "*"
+
+    def matches(self, day: date) -> bool:
+        """Check whether a day matches the schedule."""
+        if day.month not in self.months:
+            return False
+        # cron counts the weekdays from Sunday, python from Monday
+        in_month, in_week = day.day in self.days, (day.weekday() + 1) % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return in_month and in_week
+        return in_month or in_week
+
+    def next(self, day: date, inclusive: bool = False):
+        """Return the first matching day after (or on) a day, or None if there is none."""
+        day = day if inclusive else day + timedelta(days=1)
+        for _ in range(CRON_HORIZON):
+            if self.matches(day):
+                return day
+            day += timedelta(days=1)
+        return None
+
+
+class RecurringRule:
+    def __init__(self, category: str, amount: int, notes: str, schedule: str,
+                 start: str, end: str = None) -> None:
+        """
+        RecurringRule: an expense repeated on a schedule.
+
+        Args:
+            category (str): The category of the expense.
+            amount (int): The amount of the expense.
+            notes (str): Additional notes for the expense.
+            schedule (str): daily, weekly, monthly or "cron DOM MON DOW".
+            start (str): The ISO date of the first occurrence (or, with cron,
+                the first day it may occur).
+            end (str, optional): The ISO date of the last day it may occur.
+
+        Raises:
+            ValueError: If the rule is not valid.
+        """
+        if not category or category.isspace():
+            raise ValueError("Category cannot be empty.")
+        if not isinstance(amount, int) or amount <= 0:
+            raise ValueError(f"{amount} is not a valid amount.")
+
+        self.category = category
+        self.amount = amount
+        self.notes = notes
+        self.schedule = schedule.strip().lower()
+        self._cron = None
+        if self.schedule not in SCHEDULES:
+            try:
+                self._cron = CronSchedule(self.schedule.removeprefix("cron"))
+            except ValueError:
+                raise ValueError(
+                    f"Invalid schedule '{schedule}'. Use daily, weekly, monthly or 'cron DOM MON DOW'.")
+
+        try:
+            self.start = date.fromisoformat(start).isoformat()
+            self.end = date.fromisoformat(end).isoformat() if end else None
+        except ValueError:
+            raise ValueError("Invalid date. Use YYYY-MM-DD.")
+
+        # the ISO date of the next occurrence to record, None once past the end
+        first = date.fromisoformat(self.start)
+        if self._cron:
+            first = self._cron.next(first, inclusive=True)
+            if first is None:
+                raise ValueError(f"The schedule '{schedule}' never occurs.")
+        self.next = self._until_end(first)
+
+    def _until_end(self, day):
+        """Return the ISO date of a day, or None if it is past the end."""
+        if day is None or (self.end and day.isoformat() > self.end):
+            return None
+        return day.isoformat()
+
+    def following(self, day: date):
+        """Return the occurrence after a given occurrence."""
+        if self.schedule == "daily":
+            return day + timedelta(days=1)
+        elif self.schedule == "weekly":
+            return day + timedelta(days=7)
+        elif self.schedule == "monthly":
+            year, month = (day.year + 1, 1) if day.month == 12 else (day.year, day.month + 1)
+            anchor = date.fromisoformat(self.start).day
+            return date(year, month, min(anchor, calendar.monthrange(year, month)[1]))
+        return self._cron.next(day)
+
+    def advance(self) -> None:
+        """Move to the next occurrence, once the current one is recorded."""
+        self.next = self._until_end(self.following(date.fromisoformat(self.next)))
+
+    def to_dict(self) -> dict:
+        """Return the rule in its saved (json) shape."""
+        return {"category": self.category, "amount": self.amount, "notes": self.notes,
+                "schedule": self.schedule, "start": self.start, "end": self.end, "next": self.next}
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        """Rebuild a saved rule."""
+        rule = cls(data["category"], data["amount"], data["notes"], data["schedule"],
+                   data["start"], data.get("end"))
+        rule.next = data.get("next", rule.next)
+        return rule
+
+
+def due(rules: list, today: str):
+    """
+    Yield the occurrences of the rules up to today, in date order.
+
+    The next due date of every rule is kept in a heap, so k occurrences of
+    r rules take O(k log r), however long the user was away. A rule only
+    moves to its next occurrence once the consumer asks for the next one:
+    an occurrence that was not recorded stays due.
+
+    Args:
+        rules (list): The RecurringRule of the user.
+        today (str): The ISO date of today (inclusive).
+
+    Yields:
+        tuple: The (rule, ISO date) of each occurrence.
+    """
+    today = to_ordinal(today)
+    heap = [(to_ordinal(rule.next), i) for i, rule in enumerate(rules) if rule.next]
+    heapq.heapify(heap)
+    while heap and heap[0][0] <= today:
+        rule = rules[heap[0][1]]
+        yield rule, rule.next
+        rule.advance()
+        if rule.next:
+            heapq.heapreplace(heap, (to_ordinal(rule.next), heap[0][1]))
+        else:
+            heapq.heappop(heap)
@@ -0,0 +1,215 @@
+"""
+BudgetBits fleet rollover: start the new budget period of every user at once,
+and write the statement of every user's closed period.
+
+Usage:
+    python rollover.py [--period YYYY-MM] [--budget N] [--carry-over] [--storage journal|sharded|sqlite]
+                       [--workers N] [--shard-size N] [--statements FILE] [--checkpoint FILE]
+
+The users are split in shards that are rolled over in parallel by a pool of
+processes. The new budget is --budget, or each user's current budget, plus
+what is left of the closed period with --carry-over. Each finished shard is
+recorded in the checkpoint, so an interrupted job run again with the same
+checkpoint goes on with the shards that were left (a user already in the new
+period is never rolled over twice).
+"""
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from project import parse_amount, existing_user
+from data import open_storage
+from datetime import date
+import argparse
+import json
+import sys
+import os
+
+
+def closed_period(user, period: str):
+    """Return the budget period that the new period closes, or None for a new user."""
+    if user.last_updated < period:
+        return user.last_updated
+    return max((earlier for earlier in user.periods if earlier < period), default=None)
+
+
+def roll_user(record: dict, period: str, budget: int = None, carry_over: bool = False) -> tuple:
+    """
+    Roll a user over to a new budget period.
+
+    Args:
+        record (dict): the saved user record
+        period (str): the new period (YYYY-MM)
+        budget (int, optional): the new budget, the current one if not given
+        carry_over (bool): add what is left of the closed period to the budget
+
+    Returns:
+        tuple: the (new record, or None if the user was already in the period
+            and had no recurring expense due, statement of the closed period)
+    """
+    user = existing_user(record)
+    rows = len(user.store)
+    user.materialize_recurring()
+    closed = closed_period(user, period)
+
+    rolled = user.last_updated < period
+    if rolled:
+        new_budget = budget or user.monthly_budget
+        if carry_over:
+            new_budget += user.remaining_balance
+        user.roll_period(period, new_budget)
+
+    statement = {"username": user.username, "period": closed, "new_period": period,
+                 "new_budget": user.monthly_budget, "rolled": rolled}
+    if closed is not None:
+        summary = user.period_summary(closed)
+        statement.update(budget=summary["budget"], spent=summary["spent"],
+                         remaining=summary["remaining"], categories=user.category_totals(closed))
+    if len(user.store) != rows:
+        # recurring expenses were recorded
+        return user.to_dict(), statement
+    if not rolled:
+        return None, statement
+
+    # a rollover leaves the expenses as they are, so they are not rebuilt
+    new_record = dict(record, _monthly_budget=user.monthly_budget, _remaining_balance=user.remaining_balance,
+                      date=user.date, last_updated=user.last_updated, periods=user.periods)
+    return new_record, statement
+
+
+def roll_shard(storage: str, usernames: list, period: str, budget: int = None,
+               carry_over: bool = False) -> list:
+    """
+    Roll a shard of users over to a new budget period (run by a worker process).
+
+    The shard is loaded and saved with one batch each.
+
+    Returns:
+        list: the statement of every user of the shard
+    """
+    info = open_storage(storage)
+    try:
+        updated, statements = {}, []
+        for username, record in info.load_users(usernames).items():
+            try:
+                new_record, statement = roll_user(record, period, budget, carry_over)
+            except (ValueError, KeyError) as error:
+                statements.append({"username": username, "error": str(error).strip()})
+                continue
+            if new_record is not None:
+                updated[username] = new_record
+            statements.append(statement)
+
+        if updated:
+            info.save_users(updated)
+        return statements
+    finally:
+        if hasattr(info, "close"):
+            info.close()
+
+
+def read_checkpoint(path: str) -> set:
+    """Return the usernames that a checkpoint records as done."""
+    if not os.path.exists(path):
+        return set()
+    with open(path, 'r', encoding='utf-8') as file:
+        return {json.loads(line) for line in file if line.strip()}
+
+
+def append_lines(path: str, values) -> None:
+    """Append values as json lines, synced to disk."""
+    with open(path, 'a', encoding='utf-8') as file:
+        file.writelines(json.dumps(value) + "\n" for value in values)
+        file.flush()
+        os.fsync(file.fileno())
+
+
+def run_rollover(period: str, budget: int = None, carry_over: bool = False, storage: str = None,
+                 workers: int = None, shard_size: int = None, statements_path: str = None,
+                 checkpoint_path: str = None) -> dict:
+    """
+    Roll every user over to a new budget period.
+
+    Args:
+        period (str): the new period (YYYY-MM)
+        budget (int, optional): the new budget of every user, their current one if not given
+        carry_over (bool): add what is left of the closed period to the budget
+        storage (str, optional): the storage (see data.open_storage)
+        workers (int, optional): the worker processes, one per cpu by default
+            (1 runs in this process)
+        shard_size (int, optional): the users of a shard, four shards per worker by default
+        statements_path (str, optional): the json lines file of the statements,
+            data/statements-<period>.jsonl by default
+        checkpoint_path (str, optional): the checkpoint file,
+            data/rollover-<period>.checkpoint by default
+
+    Returns:
+        dict: the number of users, of users skipped (done by an earlier run),
+            rolled over and failed
+    """
+    try:
+        date.fromisoformat(f"{period}-01")
+    except ValueError:
+        raise ValueError(f"Invalid period '{period}'. Use YYYY-MM.")
+
+    statements_path = statements_path or os.path.join("data", f"statements-{period}.jsonl")
+    checkpoint_path = checkpoint_path or os.path.join("data", f"rollover-{period}.checkpoint")
+    workers = workers or os.cpu_count() or 1
+
+    info = open_storage(storage)
+    usernames = sorted(info.usernames())
+    if hasattr(info, "close"):
+        info.close()
+
+    done = read_checkpoint(checkpoint_path)
+    todo = [username for username in usernames if username not in done]
+    shard_size = shard_size or max(1, -(-len(todo) // (workers * 4)))
+    shards = [todo[i:i + shard_size] for i in range(0, len(todo), shard_size)]
+
+    result = {"users": len(usernames), "skipped": len(usernames) - len(todo), "rolled": 0, "failed": 0}
+
+    def finish(shard, statements):
+        # the statements come first: a crash in between repeats them, but never loses them
+        append_lines(statements_path, statements)
+        append_lines(checkpoint_path, shard)
+        result["rolled"] += sum(1 for statement in statements if statement.get("rolled"))
+        result["failed"] += sum(1 for statement in statements if "error" in statement)
+
+    if workers == 1:
+        for shard in shards:
+            finish(shard, roll_shard(storage, shard, period, budget, carry_over))
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            futures = {pool.submit(roll_shard, storage, shard, period, budget, carry_over): shard
+                       for shard in shards}
+            for future in as_completed(futures):
+                finish(futures[future], future.result())
+    return result
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="BudgetBits fleet rollover.")
+    parser.add_argument("--period", default=date.today().isoformat()[:7],
+                        help="the new period (YYYY-MM), this month by default")
+    parser.add_argument("--budget", help="the new budget of every user, their current one by default")
+    parser.add_argument("--carry-over", action="store_true",
+                        help="add what is left of the closed period to the new budget")
+    parser.add_argument("--storage", choices=["journal", "sharded", "sqlite"])
+    parser.add_argument("--workers", type=int, help="the worker processes, one per cpu by default")
+    parser.add_argument("--shard-size", type=int)
+    parser.add_argument("--statements", help="the json lines file of the statements")
+    parser.add_argument("--checkpoint", help="the checkpoint file of an interrupted job to resume")
+    args = parser.parse_args(argv)
+
+    try:
+        budget = parse_amount(args.budget) if args.budget else None
+        result = run_rollover(args.period, budget, args.carry_over, args.storage, args.workers,
+                              args.shard_size, args.statements, args.checkpoint)
+    except (ValueError, OSError) as message:
+        print(str(message).strip(), file=sys.stderr)
+        return 1
+
+    print(f"{result['rolled']} of {result['users']} users rolled over to {args.period}"
+          f" ({result['skipped']} done earlier, {result['failed']} failed).")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
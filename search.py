@@ -0,0 +1,318 @@
+"""
+Full-text search of the expenses: an inverted index from the terms of the
+notes and categories to the row (transaction) ids of the expenses.
+
+A query is one or more words, all of which must match (AND); a word ending
+with "*" matches every term starting with it, e.g. "grab ri*".
+"""
+from data import atomic_write, default_codec
+from expenses import to_ordinal
+from collections import Counter
+from bisect import bisect_left
+from array import array
+import hashlib
+import json
+import re
+import os
+
+TOKEN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> list:
+    """Return the lowercase terms of a text."""
+    return TOKEN.findall(text.lower())
+
+
+def contains(postings: array, row_id: int) -> bool:
+    """Check whether a sorted posting list has a row id (binary search)."""
+    position = bisect_left(postings, row_id)
+    return position < len(postings) and postings[position] == row_id
+
+
+class ExpenseIndex:
+    def __init__(self) -> None:
+        """
+        ExpenseIndex: term -> posting list of the row ids of an ExpenseStore.
+
+        Row ids only grow, so a posting list stays sorted by appending to it.
+        The sorted terms (for the prefix queries) are rebuilt only when a new
+        term was added since the last prefix query.
+        """
+        self.postings = {}
+        self.rows = 0
+        self._terms = None
+
+    def __len__(self) -> int:
+        return len(self.postings)
+
+    def add(self, row_id: int, category: str, notes: str) -> None:
+        """
+        Index an expense entry.
+
+        Args:
+            row_id (int): The row id of the entry in the ExpenseStore.
+            category (str): The category of the expense.
+            notes (str): The notes of the expense.
+        """
+        self._add_terms(row_id, set(tokenize(category)) | set(tokenize(notes)))
+
+    def _add_terms(self, row_id: int, terms) -> None:
+        self.rows = max(self.rows, row_id + 1)
+        for term in terms:
+            if (postings := self.postings.get(term)) is None:
+                postings = self.postings[term] = array('I')
+                self._terms = None
+            postings.append(row_id)
+
+    def add_rows(self, store, row_ids) -> None:
+        """
+        Index entries of an ExpenseStore whose row ids may fall between the
+        indexed ones: the posting lists they extend are sorted again once.
+        """
+        extended = set()
+        for row_id in row_ids:
+            category, _, _, notes = store.row(row_id)
+            terms = set(tokenize(category)) | set(tokenize(notes))
+            self._add_terms(row_id, terms)
+            extended |= terms
+        for term in extended:
+            self.postings[term] = array('I', sorted(self.postings[term]))
+
+    @classmethod
+    def build(cls, store):
+        """Index every entry of an ExpenseStore (each distinct note is tokenized once)."""
+        index = cls()
+        category_terms = [set(tokenize(category)) for category in store.category_names]
+        note_terms = [set(tokenize(note)) for note in store.note_pool]
+        for row_id in range(len(store)):
+            index._add_terms(row_id, category_terms[store.categories[row_id]] | note_terms[store.notes[row_id]])
+        return index
+
+    def terms(self, prefix: str = "") -> list:
+        """Return the indexed terms starting with a prefix, in order."""
+        if self._terms is None:
+            self._terms = sorted(self.postings)
+        start = bisect_left(self._terms, prefix)
+        end = bisect_left(self._terms, prefix + "\U0010ffff") if prefix else len(self._terms)
+        return self._terms[start:end]
+
+    def lookup(self, term: str, prefix: bool = False):
+        """Return the row ids of a term, or of every term starting with it."""
+        if not prefix:
+            return self.postings.get(term, ())
+        matches = self.terms(term)
+        if len(matches) == 1:
+            return self.postings[matches[0]]
+        return set().union(*(self.postings[match] for match in matches))
+
+    def search(self, query: str) -> list:
+        """
+        Find the entries matching every word of a query.
+
+        Args:
+            query (str): the words, where a word ending with "*" is a prefix
+
+        Returns:
+            list: the matching row ids, in order
+        """
+        candidates = []
+        for word in query.split():
+            terms = tokenize(word)
+            for i, term in enumerate(terms):
+                candidates.append(self.lookup(term, word.endswith("*") and i == len(terms) - 1))
+        if not candidates:
+            return []
+
+        # intersect from the shortest posting list, looking each of its rows
+        # up in the longer ones (a term of every row matches them all)
+        candidates.sort(key=len)
+        rows = sorted(candidates[0]) if isinstance(candidates[0], set) else list(candidates[0])
+        for postings in candidates[1:]:
+            if not rows:
+                break
+            if len(postings) == self.rows:
+                continue
+            if isinstance(postings, set):
+                rows = [row_id for row_id in rows if row_id in postings]
+            else:
+                rows = [row_id for row_id in rows if contains(postings, row_id)]
+        return rows
+
+    def to_dict(self, order=None) -> dict:
+        """
+        Return the postings in their saved shape.
+
+        Args:
+            order (list, optional): the row ids in their saved order (see
+                nested_order), so the saved ids are positions in that order
+        """
+        if order is None:
+            return {term: list(postings) for term, postings in self.postings.items()}
+        position = array('I', [0]) * len(order)
+        for new_id, row_id in enumerate(order):
+            position[row_id] = new_id
+        return {term: sorted(position[row_id] for row_id in postings)
+                for term, postings in self.postings.items()}
+
+    @classmethod
+    def from_dict(cls, postings: dict):
+        """Rebuild an index from its saved postings."""
+        index = cls()
+        index.postings = {term: array('I', row_ids) for term, row_ids in postings.items()}
+        index.rows = max((row_ids[-1] + 1 for row_ids in postings.values() if row_ids), default=0)
+        return index
+
+
+def nested_order(store) -> list:
+    """
+    Return the row ids of a store in the order of its saved (nested) shape,
+    i.e. the row ids of the same entries once the saved record is loaded again.
+    """
+    # categories are interned in the order they first appear, like the nested dict
+    first_seen = {}
+    for row_id in range(len(store)):
+        first_seen.setdefault((store.categories[row_id], store.dates[row_id]), row_id)
+    return sorted(range(len(store)), key=lambda row_id: (
+        store.categories[row_id], first_seen[store.categories[row_id], store.dates[row_id]], row_id))
+
+
+def fingerprint(store, order=None) -> str:
+    """Return a digest of the amounts, dates and categories of a store (in an order)."""
+    if order is None:
+        columns = (store.amounts, store.dates, store.categories)
+    else:
+        columns = (array(column.typecode, (column[row_id] for row_id in order))
+                   for column in (store.amounts, store.dates, store.categories))
+    digest = hashlib.sha1()
+    for column in columns:
+        digest.update(column.tobytes())
+    return digest.hexdigest()
+
+
+class IndexStore:
+    def __init__(self, directory, codec=None, compact_every: int = 1000) -> None:
+        """
+        IndexStore: the search indexes of the users, one file per user.
+
+        The entries added since an index was saved are appended to its log
+        (one json line each), so adding an expense does not rewrite the
+        index; they are indexed when it is next loaded, and the index is
+        saved again once its log has `compact_every` entries.
+
+        A saved index is only used if the user's expenses are still the ones
+        it was saved for (and logged since); it is rebuilt (and saved again)
+        otherwise.
+
+        Args:
+            directory (str): for the directory of the index files
+            codec (Codec): for the format of the files
+            compact_every (int): number of logged entries before the index is saved again
+        """
+        self.directory = directory
+        self.codec = codec or default_codec("json-compact")
+        self.compact_every = compact_every
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, username: str) -> str:
+        """Return the path of the index of a user."""
+        return os.path.join(self.directory, hashlib.sha1(username.encode()).hexdigest() + ".idx")
+
+    def log_path(self, username: str) -> str:
+        """Return the path of the log of the entries added since the index of a user was saved."""
+        return self.path(username) + ".log"
+
+    def log(self, username: str, added) -> None:
+        """
+        Log entries added to a user's expenses, if the user has a saved index.
+
+        Args:
+            username (str): the owner of the expenses
+            added (iterable): the (category, date) of every added entry
+        """
+        if not os.path.exists(self.path(username)):
+            return
+        lines = "".join(json.dumps([category, date]) + "\n" for category, date in added)
+        with open(self.log_path(username), 'a', encoding='utf-8') as file:
+            file.write(lines)
+
+    def load(self, username: str, store) -> ExpenseIndex:
+        """
+        Load the index of a user's ExpenseStore, rebuilding it if it is stale.
+
+        Args:
+            username (str): the owner of the expenses
+            store (ExpenseStore): the user's expenses, as loaded from the saved record
+        """
+        try:
+            with open(self.path(username), 'rb') as file:
+                saved = self.codec.decode(file.read())
+            added = []
+            if os.path.exists(self.log_path(username)):
+                with open(self.log_path(username), 'r', encoding='utf-8') as file:
+                    added = [json.loads(line) for line in file]
+            if (index := self.restore(saved, store, added)) is not None:
+                if len(added) >= self.compact_every:
+                    self.save(username, index, store)
+                return index
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+        index = ExpenseIndex.build(store)
+        self.save(username, index, store)
+        return index
+
+    @staticmethod
+    def restore(saved: dict, store, added: list):
+        """
+        Rebuild a saved index, with the logged entries added since, for a store.
+
+        A logged entry is the last one of its category and date in the store
+        (as loaded from the saved record), so the other rows are the ones the
+        index was saved for, in the same order.
+
+        Returns:
+            ExpenseIndex: the index, or None if the store is not the one
+                it was saved for plus the logged entries
+        """
+        if saved["rows"] + len(added) != len(store):
+            return None
+        if not added:
+            if saved["fingerprint"] != fingerprint(store):
+                return None
+            return ExpenseIndex.from_dict(saved["postings"])
+
+        pending = Counter()
+        for category, date in added:
+            if (category_id := store.find_category(category)) is None:
+                return None
+            pending[category_id, to_ordinal(date)] += 1
+        saved_rows, added_rows = array('I'), []
+        for row_id in range(len(store) - 1, -1, -1):
+            key = (store.categories[row_id], store.dates[row_id])
+            if pending[key]:
+                pending[key] -= 1
+                added_rows.append(row_id)
+            else:
+                saved_rows.append(row_id)
+        saved_rows.reverse()
+        if saved["fingerprint"] != fingerprint(store, saved_rows):
+            return None
+
+        # the saved row ids are positions in saved_rows (which is sorted)
+        index = ExpenseIndex.from_dict({term: [saved_rows[position] for position in positions]
+                                        for term, positions in saved["postings"].items()})
+        index.add_rows(store, reversed(added_rows))
+        return index
+
+    def save(self, username: str, index: ExpenseIndex, store) -> None:
+        """
+        Save the index of a user, with its row ids as they will be once
+        the user's saved record is loaded again.
+        """
+        order = nested_order(store)
+        saved = {"rows": len(store), "fingerprint": fingerprint(store, order),
+                 "postings": index.to_dict(order)}
+        atomic_write(self.path(username), self.codec.encode(saved))
+        # an entry logged meanwhile is not in the index: it is then rebuilt
+        if os.path.exists(self.log_path(username)):
+            os.remove(self.log_path(username))
@@ -0,0 +1,109 @@
+"""
+The on-disk formats of the BudgetBits data.
+
+A format is written as "<serializer>[+<compression>]", e.g. "json",
+"json-compact+gzip" or "msgpack+zlib". orjson and msgpack are only used when
+they are installed (compact json is used instead otherwise). Reading detects
+the format on its own, so a file can be read whatever format it was saved in.
+
+orjson, msgpack and gzip are only imported by the codecs that use them, so
+importing this module (on every start) stays cheap.
+"""
+from functools import lru_cache
+import importlib
+import zlib
+import json
+
+SERIALIZERS = ("json", "json-compact", "orjson", "msgpack")
+COMPRESSIONS = ("zlib", "gzip")
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZLIB_MAGIC = (b"\x78\x01", b"\x78\x5e", b"\x78\x9c", b"\x78\xda")
+
+
+@lru_cache(maxsize=None)
+def optional(module: str):
+    """Import an optional library, or return None if it is not installed."""
+    try:
+        return importlib.import_module(module)
+    except ImportError:
+        return None
+
+
+class Codec:
+    def __init__(self, format: str = "json") -> None:
+        """
+        Codec: encode and decode the data in a format.
+
+        Args:
+            format (str): "<serializer>[+<compression>]", where the serializer is
+                json (indented), json-compact, orjson or msgpack, and the
+                compression is zlib or gzip.
+        """
+        serializer, _, compression = format.partition("+")
+        if serializer not in SERIALIZERS:
+            raise ValueError(f"Unknown serializer '{serializer}'. Use one of {', '.join(SERIALIZERS)}.")
+        if compression and compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown compression '{compression}'. Use one of {', '.join(COMPRESSIONS)}.")
+
+        # the optional libraries fall back to compact json
+        if serializer in ("orjson", "msgpack") and optional(serializer) is None:
+            serializer = "json-compact"
+
+        self.serializer = serializer
+        self.compression = compression or None
+
+    @property
+    def format(self) -> str:
+        """The format actually used."""
+        return self.serializer + (f"+{self.compression}" if self.compression else "")
+
+    def encode(self, data) -> bytes:
+        """
+        Encode the data in the format.
+
+        Args:
+            data (any python data structure): the data to encode
+        """
+        if self.serializer == "json":
+            content = json.dumps(data, indent=4).encode()
+        elif self.serializer == "json-compact":
+            content = json.dumps(data, separators=(",", ":")).encode()
+        elif self.serializer == "orjson":
+            content = optional("orjson").dumps(data)
+        else:
+            content = optional("msgpack").packb(data)
+
+        if self.compression == "zlib":
+            return zlib.compress(content)
+        elif self.compression == "gzip":
+            import gzip
+            return gzip.compress(content, mtime=0)
+        return content
+
+    @staticmethod
+    def decode(content: bytes):
+        """
+        Decode data saved in any format.
+
+        Raises:
+            ValueError: If the content is not valid in any format.
+        """
+        try:
+            if content.startswith(GZIP_MAGIC):
+                import gzip
+                content = gzip.decompress(content)
+            elif content[:2] in ZLIB_MAGIC:
+                content = zlib.decompress(content)
+        except (OSError, EOFError, zlib.error) as error:
+            raise ValueError(f"Invalid compressed data: {error}")
+
+        if content.lstrip()[:1] in (b"{", b"["):
+            orjson = optional("orjson")
+            return orjson.loads(content) if orjson else json.loads(content)
+        elif (msgpack := optional("msgpack")) is not None:
+            try:
+                return msgpack.unpackb(content, strict_map_key=False)
+            except Exception as error:
+                raise ValueError(f"Invalid data: {error}")
+        raise ValueError("Invalid data: not json (and msgpack is not installed).")
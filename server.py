@@ -0,0 +1,330 @@
+"""
+BudgetBits local HTTP/JSON API, on asyncio (standard library only).
+
+Usage:
+    python server.py [--host 127.0.0.1] [--port 8080] [--storage journal|sharded|sqlite]
+
+Endpoints:
+    POST /login       {"username": ..., "password": ...} -> {"token": ...}
+    POST /logout
+    POST /expenses    {"category": ..., "amount": ..., "notes": ..., "date": ...}
+    GET  /expenses    ?category=&start=&end=&offset=&limit=
+    GET  /search      ?q=
+    GET  /summary     ?month=YYYY-MM
+
+Every endpoint but /login needs an "Authorization: Bearer <token>" header.
+A session lasts 12 hours (or until its logout).
+"""
+from urllib.parse import urlsplit, parse_qs
+from budgetbits import AccountValidator, today
+from project import existing_user
+from transfer import validate_row
+from data import open_storage, WriteBehindManager
+from alerts import environment_sinks
+from itertools import islice
+import argparse
+import secrets
+import asyncio
+import json
+import time
+
+REASONS = {200: "OK", 201: "Created", 400: "Bad Request", 401: "Unauthorized",
+           404: "Not Found", 405: "Method Not Allowed", 500: "Internal Server Error"}
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str) -> None:
+        """An error answered to the client with its status code."""
+        super().__init__(message)
+        self.status = status
+
+
+class BudgetBitsServer:
+    def __init__(self, info, accounts=None, flush_interval: float = 0.05,
+                 session_ttl: float = 12 * 3600, max_sessions: int = 10_000) -> None:
+        """
+        BudgetBitsServer: serves many users at once over HTTP.
+
+        The users of open sessions are kept in memory. Their new expenses
+        are saved by a WriteBehindManager, together every `flush_interval`
+        seconds (one save per user per flush), off the event loop.
+
+        Args:
+            info (InformationManager): the storage of the users' data
+            accounts (Accounts): the accounts, AccountValidator() by default
+            flush_interval (float): the seconds between two saves
+            session_ttl (float): the seconds a session lasts after its login
+            max_sessions (int): the most sessions open at once (the oldest
+                one is closed to open another)
+        """
+        self.info = WriteBehindManager(info, flush_interval)
+        self.accounts = accounts or AccountValidator()
+        self.session_ttl = session_ttl
+        self.max_sessions = max_sessions
+
+        # token -> (username, expiry), in the order they were opened,
+        # username -> BudgetBits, and username -> number of open sessions
+        self.sessions = {}
+        self.users = {}
+        self._session_counts = {}
+        self._user_locks = {}
+        self._server = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8080):
+        """Start listening."""
+        self._server = await asyncio.start_server(self.handle, host, port)
+        return self._server
+
+    async def stop(self) -> None:
+        """Stop listening and save what is pending."""
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+        await asyncio.get_running_loop().run_in_executor(None, self.info.close)
+
+    # requests
+    async def handle(self, reader, writer) -> None:
+        """Answer the requests of a (keep-alive) connection."""
+        try:
+            while True:
+                try:
+                    if not (request := await self._read_request(reader)):
+                        break
+                except HTTPError as error:
+                    # the end of the request is unknown, so is any next one
+                    self._write_response(writer, error.status, {"error": str(error)}, False)
+                    await writer.drain()
+                    break
+                method, target, headers, body = request
+                try:
+                    status, payload = 200, await self.route(method, target, headers, body)
+                    if method == "POST" and target.startswith("/expenses"):
+                        status = 201
+                except HTTPError as error:
+                    status, payload = error.status, {"error": str(error)}
+                except ValueError as error:
+                    status, payload = 400, {"error": str(error).strip()}
+                except Exception as error:
+                    status, payload = 500, {"error": repr(error)}
+
+                keep_alive = headers.get("connection", "").lower() != "close"
+                self._write_response(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _read_request(reader):
+        """
+        Read a request: (method, target, headers, body), or None at the end.
+
+        Raises:
+            HTTPError: If the Content-Length header is not valid.
+        """
+        line = await reader.readline()
+        if not line:
+            return None
+        try:
+            method, target, _ = line.decode("latin-1").split(" ", 2)
+        except ValueError:
+            return None
+
+        headers = {}
+        while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        length = headers.get("content-length", "0")
+        if not length.isdigit():
+            raise HTTPError(400, f"Invalid Content-Length '{length}'.")
+        body = await reader.readexactly(int(length)) if int(length) else b""
+        return method.upper(), target, headers, body
+
+    @staticmethod
+    def _write_response(writer, status: int, payload: dict, keep_alive: bool) -> None:
+        body = json.dumps(payload).encode()
+        writer.write(
+            f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + body)
+
+    async def route(self, method: str, target: str, headers: dict, body: bytes) -> dict:
+        """Dispatch a request to its endpoint."""
+        url = urlsplit(target)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        try:
+            data = json.loads(body) if body else {}
+        except json.JSONDecodeError:
+            raise HTTPError(400, "The body must be json.")
+        if not isinstance(data, dict):
+            raise HTTPError(400, "The body must be a json object.")
+
+        if url.path in ("/login", "/logout"):
+            if method != "POST":
+                raise HTTPError(405, "Use POST.")
+            return await self.login(data) if url.path == "/login" else self.logout(headers)
+
+        routes = {
+            ("POST", "/expenses"): self.add_expense,
+            ("GET", "/expenses"): self.list_expenses,
+            ("GET", "/search"): self.search,
+            ("GET", "/summary"): self.summary,
+        }
+        if (endpoint := routes.get((method, url.path))) is None:
+            raise HTTPError(404, f"No endpoint {method} {url.path}.")
+        return endpoint(await self.session_user(headers), data, query)
+
+    # endpoints
+    async def login(self, data: dict) -> dict:
+        username = str(data.get("username", "")).strip()
+        password = str(data.get("password", "")).strip()
+        loop = asyncio.get_running_loop()
+
+        # the password hash is slow on purpose, so it is run off the event loop
+        if not await loop.run_in_executor(None, self.accounts.login_account, username, password):
+            raise HTTPError(401, "Login failed. Incorrect username or password")
+
+        if username not in self.users:
+            await self.load_user(username)
+        return {"token": self.open_session(username)}
+
+    def logout(self, headers: dict) -> dict:
+        self.close_session(self.session_token(headers))
+        return {}
+
+    # sessions
+    def open_session(self, username: str) -> str:
+        """Open a session of a (loaded) user, and return its token."""
+        token = secrets.token_urlsafe(24)
+        self.sessions[token] = (username, time.monotonic() + self.session_ttl)
+        self._session_counts[username] = self._session_counts.get(username, 0) + 1
+
+        # every session lasts as long, so the first ones are the first to expire
+        now = time.monotonic()
+        while (oldest := next(iter(self.sessions))) != token and (
+                len(self.sessions) > self.max_sessions or self.sessions[oldest][1] <= now):
+            self.close_session(oldest)
+        return token
+
+    def close_session(self, token: str) -> None:
+        """Close a session, and drop its user from memory if it was the last one."""
+        username, _ = self.sessions.pop(token)
+        self._session_counts[username] -= 1
+        if not self._session_counts[username]:
+            del self._session_counts[username]
+            self.users.pop(username, None)
+
+    def session_token(self, headers: dict) -> str:
+        """Return the token of the session of a request (401 if it is not open)."""
+        scheme, _, token = headers.get("authorization", "").partition(" ")
+        if scheme.lower() != "bearer" or (session := self.sessions.get(token)) is None:
+            raise HTTPError(401, "Log in first.")
+        if session[1] <= time.monotonic():
+            self.close_session(token)
+            raise HTTPError(401, "The session has expired. Log in again.")
+        return token
+
+    async def session_user(self, headers: dict):
+        """Return the BudgetBits user of the session of a request."""
+        username = self.sessions[self.session_token(headers)][0]
+        user = self.users[username]
+        # a user loaded on an earlier day is loaded again, to move on with the calendar
+        if user.date != today():
+            user = await self.load_user(username)
+        return user
+
+    async def load_user(self, username: str):
+        """
+        Load a user (off the event loop) into memory, moved on to today:
+        the budget period of today is started (with the current budget)
+        and the recurring expenses due are recorded.
+
+        The record is loaded again every time, so saving the moved on user
+        keeps what other processes saved since it was last loaded.
+        """
+        async with self._user_locks.setdefault(username, asyncio.Lock()):
+            if (user := self.users.get(username)) is not None and user.date == today():
+                # loaded by another request meanwhile
+                return user
+            loop = asyncio.get_running_loop()
+            record = await loop.run_in_executor(None, self.info.load_user, username)
+            if record is None:
+                raise HTTPError(404, f"Username '{username}' has no BudgetBits record yet.")
+            user = existing_user(record)
+            user.alerts.sinks = environment_sinks()
+            if user.start_current_period() | bool(user.materialize_recurring()):
+                self.info.save_user(user.username, user.to_dict())
+            self.users[username] = user
+            return user
+
+    def add_expense(self, user, data: dict, query: dict) -> dict:
+        # validated as an imported row (400 on an invalid one), before the user is touched
+        category, amount, notes, date = validate_row(data)
+        expense = user.expense_entry(category, amount, notes, date)
+        self.info.save_expense(user.username, *expense)
+        return {"remaining_balance": user.remaining_balance}
+
+    @staticmethod
+    def query_count(query: dict, name: str, default: int) -> int:
+        """Return a count (e.g. an offset) of a query string (400 if it is not one)."""
+        value = query.get(name, str(default))
+        if not value.isdigit():
+            raise HTTPError(400, f"'{name}' must be a whole number, not '{value}'.")
+        return int(value)
+
+    def list_expenses(self, user, data: dict, query: dict) -> dict:
+        offset = self.query_count(query, "offset", 0)
+        limit = self.query_count(query, "limit", 50)
+        rows = user.iter_expenses(query.get("category"), query.get("start"), query.get("end"))
+        return {"expenses": [
+            dict(zip(("category", "date", "amount", "notes"), row))
+            for row in islice(rows, offset, offset + limit)
+        ]}
+
+    def search(self, user, data: dict, query: dict) -> dict:
+        return {"expenses": [
+            dict(zip(("category", "date", "amount", "notes"), row))
+            for row in user.search(query.get("q", ""))
+        ]}
+
+    def summary(self, user, data: dict, query: dict) -> dict:
+        month = query.get("month", user.date[:7])
+        return {
+            "username": user.username,
+            "monthly_budget": user.monthly_budget,
+            "remaining_balance": user.remaining_balance,
+            "month": month,
+            "total_expenses": user.total_expenses(month=month),
+            "categories": user.category_totals(month),
+        }
+
+
+async def serve(host: str, port: int, storage: str = None) -> None:
+    server = BudgetBitsServer(open_storage(storage))
+    await server.start(host, port)
+    print(f"BudgetBits is listening on http://{host}:{port}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="BudgetBits local HTTP/JSON API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--storage", choices=["journal", "sharded", "sqlite"])
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, args.storage))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,42 @@
+import threading
+import asyncio
+import time
 import pytest
+import json
+import os
+from datetime import datetime
 from project import validate_name, validate_amount, existing_user
+from budgetbits import BudgetBits, Accounts
+from data import InformationManager, JournalManager, ShardedManager, SQLiteManager, open_storage, \
+    WriteBehindManager, CorruptDataError, apply_expense
+from expenses import ExpenseStore
+from serializers import Codec
+from transfer import import_expenses, export_expenses
+from analytics import Analytics
+from search import IndexStore, ExpenseIndex
+from recurring import RecurringRule
+from jsonstream import JsonStream, read_user
+from alerts import LogSink, WebhookSink
+from server import BudgetBitsServer
+import budgetbits
+import cli
+import instrument
+import rollover
+from benchmarks.generate import generate
+from benchmarks.suite import run_suite, compare
+from benchmarks.bench_import import eager_imports
+
+
+@pytest.fixture
+def freeze_today(monkeypatch):
+    """Return a function that freezes the today of BudgetBits to an ISO date."""
+    def freeze(day: str) -> None:
+        class FrozenDatetime(datetime):
+            @classmethod
+            def now(cls, tz=None):
+                return cls.fromisoformat(day)
+        monkeypatch.setattr(budgetbits, "datetime", FrozenDatetime)
+    return freeze
 
 
 def test_validate_name():
@@ -49,3 +86,757 @@ def test_existing_user():
     assert user.monthly_budget == 3500
     assert user.remaining_balance == 3150
     assert user.expenses == {}
+
+
+def test_journal_manager(tmp_path):
+    file_name = str(tmp_path / "data.json")
+    info = JournalManager(file_name, compact_every=3)
+    info.save_user("lone", {"_expenses": {}, "_remaining_balance": 3500})
+    info.save_expense("lone", "Food", "2023-08-16", {"amount": 150, "notes": "lunch"})
+
+    # Replaying the journal onto an empty snapshot
+    user = JournalManager(file_name).retrieve()["lone"]
+    assert user["_remaining_balance"] == 3350
+    assert user["_expenses"] == {"Food": {"2023-08-16": [{"amount": 150, "notes": "lunch"}]}}
+
+    # Compacting the journal into the snapshot
+    info.save_expense("lone", "Food", "2023-08-16", {"amount": 50, "notes": "snack"})
+    info.close()
+    assert InformationManager(file_name).retrieve()["lone"]["_remaining_balance"] == 3300
+    assert JournalManager(file_name).retrieve()["lone"]["_remaining_balance"] == 3300
+
+
+def test_sharded_manager(tmp_path):
+    info = ShardedManager(str(tmp_path / "users"))
+    info.save_user("lone", {"_expenses": {}, "_remaining_balance": 3500})
+    info.save_expense("lone", "Food", "2023-08-16", {"amount": 150, "notes": "lunch"})
+
+    assert "lone" in info and "robert" not in info
+    assert info.load_user("robert") is None
+    assert info.load_user("lone")["_remaining_balance"] == 3350
+    with pytest.raises(KeyError):
+        info.save_expense("robert", "Food", "2023-08-16", {"amount": 150, "notes": "lunch"})
+    assert list(info.retrieve()) == ["lone"]
+
+
+def test_sqlite_manager(tmp_path):
+    info = SQLiteManager(str(tmp_path / "budgetbits.db"))
+    info.save_user("lone", {"_username": "lone", "_expenses": {}, "_remaining_balance": 3500})
+    info.save_expense("lone", "Food", "2023-08-16", {"amount": 150, "notes": "lunch"})
+    info.save_expense("lone", "Bills", "2023-09-01", {"amount": 300, "notes": "internet"})
+
+    user = info.load_user("lone")
+    assert user["_username"] == "lone"
+    assert user["_remaining_balance"] == 3050
+    assert user["_expenses"]["Food"] == {"2023-08-16": [{"amount": 150, "notes": "lunch"}]}
+    assert info.load_user("robert") is None
+
+    assert info.total_expenses("lone", start="2023-08-01", end="2023-08-31") == 150
+    assert info.query_expenses("lone", category="Bills") == [("Bills", "2023-09-01", 300, "internet")]
+
+    with pytest.raises(KeyError):
+        info.save_expense("robert", "Food", "2023-08-16", {"amount": 150, "notes": "lunch"})
+
+    # a save only inserts the new rows, and keeps the rows (and what they took
+    # from the balance) of other connections
+    ids = [row[0] for row in info.connection.execute("SELECT id FROM expenses ORDER BY id")]
+    other = SQLiteManager(str(tmp_path / "budgetbits.db"))
+    other.save_expense("lone", "Food", "2023-08-17", {"amount": 80, "notes": "dinner"})
+    user["_expenses"]["Food"]["2023-08-16"].append({"amount": 40, "notes": "snack"})
+    user["_remaining_balance"] -= 40
+    info.save_user("lone", user)
+    rows = info.connection.execute("SELECT id, notes FROM expenses ORDER BY id").fetchall()
+    assert [row[0] for row in rows[:2]] == ids
+    assert sorted(notes for _, notes in rows) == ["dinner", "internet", "lunch", "snack"]
+    assert other.load_user("lone")["_remaining_balance"] == 3050 - 80 - 40
+
+    # an expense removed from the record is deleted
+    del user["_expenses"]["Bills"]
+    info.save_user("lone", user)
+    assert info.query_expenses("lone", category="Bills") == []
+    assert len(info.query_expenses("lone")) == 3
+    other.close()
+
+
+def test_concurrent_saves(tmp_path):
+    file_name = str(tmp_path / "data.json")
+    InformationManager(file_name).save({"lone": {"_expenses": {}, "_remaining_balance": 3500}})
+
+    # Each session only merges its own changes into the file
+    sessions = [InformationManager(file_name) for _ in range(4)]
+    threads = [
+        threading.Thread(target=session.save_expense,
+                         args=("lone", "Food", "2023-08-16", {"amount": 10, "notes": str(i)}))
+        for i, session in enumerate(sessions)
+    ]
+    threads.append(threading.Thread(
+        target=sessions[0].save_user, args=("robert", {"_expenses": {}, "_remaining_balance": 100})))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    data = InformationManager(file_name).retrieve()
+    assert data["lone"]["_remaining_balance"] == 3460
+    assert len(data["lone"]["_expenses"]["Food"]["2023-08-16"]) == 4
+    assert "robert" in data
+
+
+def test_expense_store(freeze_today):
+    expenses = {
+        "Food": {"2023-08-16": [{"amount": 150, "notes": "lunch"}, {"amount": 50, "notes": "snack"}]},
+        "Bills": {"2023-08-01": [{"amount": 300, "notes": "internet"}]},
+    }
+    store = ExpenseStore.from_nested(expenses)
+
+    assert len(store) == 3
+    assert store.total() == 500
+    assert store.row(2) == ("Bills", "2023-08-01", 300, "internet")
+    assert store.to_nested() == expenses
+    with pytest.raises(ValueError):
+        store.append("Food", "2023-08-99", 100, "dinner")
+    assert (len(store), len(store.dates), len(store.categories), len(store.notes)) == (3, 3, 3, 3)
+
+    # a dropped date order is sorted again when next needed
+    assert [store.dates[row_id] for row_id in store.ordered()] == sorted(store.dates)
+    store.drop_order()
+    store.append("Food", "2023-07-31", 20, "candy")
+    assert store.row(store.ordered()[0]) == ("Food", "2023-07-31", 20, "candy")
+    assert list(store.date_range("2023-08-01", "2023-08-16")) == [1, 2, 3]
+
+    freeze_today("2023-08-16")
+    user = existing_user({
+        "_username": "lone", "_first": "John", "_last": "Garan", "_monthly_budget": 3500,
+        "_expenses": expenses, "_remaining_balance": 3000, "date": "2023-08-16", "last_updated": 8
+    })
+    assert user.expense_entry("Food", 100, "dinner") == ("Food", user.date, {"amount": 100, "notes": "dinner"})
+    assert user.remaining_balance == 2900
+    assert user.to_dict()["_expenses"]["Food"][user.date][-1] == {"amount": 100, "notes": "dinner"}
+
+
+def test_expense_totals():
+    user = BudgetBits("lone", "John", "Garan", 3500, {
+        "Food": {"2023-07-31": [{"amount": 150, "notes": "lunch"}]},
+        "Bills": {"2023-08-01": [{"amount": 300, "notes": "internet"}]},
+    }, 3050, 8)
+    user.date = "2023-08-16"
+    user.expense_entry("Food", 100, "dinner")
+
+    assert user.total_expenses() == 550
+    assert user.total_expenses(category="Food") == 250
+    assert user.total_expenses(month="2023-08") == 400
+    assert user.total_expenses(category="Food", month="2023-08") == 100
+    assert user.total_expenses(date="2023-07-31") == 150
+    assert user.category_totals("2023-08") == {"Bills": 300, "Food": 100}
+
+    # an invalid date changes nothing
+    balance = user.remaining_balance
+    for date in ("2023-08-99", 20230816):
+        with pytest.raises(ValueError):
+            user.expense_entry("Food", 100, "dinner", date)
+    assert (user.remaining_balance, len(user.store), user.total_expenses()) == (balance, 3, 550)
+
+
+def test_expense_pages():
+    user = BudgetBits("lone", "John", "Garan", 3500, {
+        "Food": {"2023-08-16": [{"amount": 150, "notes": "lunch"}]},
+        "Bills": {"2023-08-01": [{"amount": 300, "notes": "internet"}]},
+    }, 3050, 8)
+    user.date = "2023-08-05"
+    user.expense_entry("Food", 100, "dinner")
+
+    assert [row[1] for row in user.iter_expenses()] == ["2023-08-01", "2023-08-05", "2023-08-16"]
+    assert list(user.iter_expenses(category="Food", end="2023-08-10")) == [
+        ["Food", "2023-08-05", 100, "dinner"]]
+    assert len(list(user.expense_pages(page_size=2))) == 2
+    assert "internet" not in user.display_expenses(page_size=1, offset=1)
+
+
+def test_import_export_expenses(tmp_path, freeze_today):
+    freeze_today("2023-08-16")
+    source = tmp_path / "statement.csv"
+    source.write_text(
+        "category,date,amount,notes\n"
+        "Food,2023-08-16,150,lunch\n"
+        "Bills,2023-08-01,\"1,000\",internet\n"
+        ",2023-08-02,50,no category\n"
+        "Food,2023-13-01,50,bad date\n"
+        "Food,2023-08-03,-5,negative\n"
+    )
+    info = InformationManager(str(tmp_path / "data.json"))
+    user = BudgetBits("lone", "John", "Garan", 3500, {}, 3500, 8)
+    info.save_user("lone", user.to_dict())
+
+    errors = []
+    assert import_expenses(user, str(source), info, batch_size=2,
+                           on_error=lambda *error: errors.append(error)) == (2, 3)
+    assert [line for line, _ in errors] == [4, 5, 6]
+    assert info.load_user("lone")["_remaining_balance"] == user.remaining_balance == 2350
+
+    assert export_expenses(user, str(tmp_path / "expenses.jsonl")) == 2
+    copy = BudgetBits("lone", "John", "Garan", 3500, {}, 3500, 8)
+    assert import_expenses(copy, str(tmp_path / "expenses.jsonl")) == (2, 0)
+    assert copy.expenses == user.expenses
+
+    # json that is not an object, or a bad amount, is an invalid row like any other
+    source = tmp_path / "statement.jsonl"
+    source.write_text('[1, 2]\n5\n"x"\n{"category": "Food", "amount": "ten"}\n'
+                      '{"category": "Food", "amount": 20, "date": "2023-08-16"}\n')
+    errors.clear()
+    assert import_expenses(user, str(source), info, on_error=lambda *error: errors.append(error)) == (1, 4)
+    assert "not an object" in errors[0][1] and "valid integer for the amount" in errors[3][1]
+    assert info.load_user("lone")["_remaining_balance"] == 2330
+
+
+def test_cli(tmp_path, monkeypatch, capsys, freeze_today):
+    freeze_today("2023-08-16")
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "data").mkdir()
+
+    assert cli.main(["set-budget", "lone", "3,500", "--first", "john", "--last", "garan"]) == 0
+    assert cli.main(["add", "lone", "Food", "150", "--notes", "lunch", "--date", "2023-08-16"]) == 0
+    assert cli.main(["add", "lone", "Food", "-5"]) == 1
+    assert cli.main(["add", "robert", "Food", "150"]) == 1
+    assert cli.main(["show", "lone", "--category", "Food"]) == 0
+    assert "lunch" in capsys.readouterr().out
+
+    user = existing_user(open_storage().load_user("lone"))
+    assert user.first == "John"
+    assert user.remaining_balance == 3350
+
+    # an add keeps the saved search index up to date, so it is not rebuilt
+    assert cli.main(["search", "lone", "lunch"]) == 0
+    assert cli.main(["add", "lone", "Transport", "50", "--notes", "grab ride", "--date", "2023-08-16"]) == 0
+    monkeypatch.setattr(ExpenseIndex, "build", None)
+    assert cli.main(["search", "lone", "grab"]) == 0
+    assert "grab ride" in capsys.readouterr().out
+
+
+def test_password_hashing(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "data").mkdir()
+    (tmp_path / "data" / "accounts.json").write_text('{"lone": "plain password"}')
+    monkeypatch.setenv("BUDGETBITS_PASSWORD_ITERATIONS", "1000")
+    monkeypatch.setattr(Accounts, "_verified", {})
+
+    accounts = Accounts()
+    accounts.register_account("robert", "secret")
+    assert accounts.accounts.get("robert").startswith("pbkdf2_sha256$1000$")
+    assert accounts.login_account("robert", "secret")
+    assert not accounts.login_account("robert", "wrong")
+    with pytest.raises(ValueError):
+        accounts.register_account("robert", "another")
+
+    # the former accounts file is imported once, hashed, then deleted
+    assert not (tmp_path / "data" / "accounts.json").exists()
+    stored = accounts.accounts.get("lone")
+    assert stored.startswith("pbkdf2_sha256$1000$")
+    assert not any(b"plain password" in path.read_bytes() for path in (tmp_path / "data").iterdir())
+    (tmp_path / "data" / "accounts.json").write_text('{"lone": "changed"}')
+    assert Accounts().accounts.get("lone") == stored
+    assert not (tmp_path / "data" / "accounts.json").exists()
+    # a file another process imported meanwhile is already gone
+    accounts.accounts.import_legacy(str(tmp_path / "data" / "accounts.json"))
+    assert not (tmp_path / "data" / "accounts.json").exists()
+
+    # a password is rehashed on login when the work factor changed
+    assert accounts.login_account("lone", "plain password")
+    assert accounts.accounts.get("lone").startswith("pbkdf2_sha256$1000$")
+    monkeypatch.setenv("BUDGETBITS_PASSWORD_ITERATIONS", "2000")
+    monkeypatch.setattr(Accounts, "_verified", {})
+    assert Accounts().login_account("lone", "plain password")
+    assert accounts.accounts.get("lone").startswith("pbkdf2_sha256$2000$")
+    assert str(accounts) == "Current users: 2"
+
+
+def test_server(tmp_path, monkeypatch, freeze_today):
+    freeze_today("2023-08-16")
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "data").mkdir()
+    monkeypatch.setenv("BUDGETBITS_PASSWORD_ITERATIONS", "1000")
+    info = InformationManager("data/data.json")
+    info.save_user("lone", BudgetBits("lone", "John", "Garan", 3500, {}, 3500, 8).to_dict())
+    Accounts().register_account("lone", "secret")
+
+    async def scenario():
+        app = BudgetBitsServer(info)
+        server = await app.start("127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+
+        async def call(method, target, body=None, token=None):
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            content = json.dumps(body).encode() if body is not None else b""
+            head = f"{method} {target} HTTP/1.1\r\nConnection: close\r\nContent-Length: {len(content)}\r\n"
+            if token:
+                head += f"Authorization: Bearer {token}\r\n"
+            writer.write(head.encode() + b"\r\n" + content)
+            response = await reader.read()
+            writer.close()
+            head, _, body = response.partition(b"\r\n\r\n")
+            return int(head.split()[1]), json.loads(body)
+
+        assert (await call("POST", "/login", {"username": "lone", "password": "wrong"}))[0] == 401
+        _, login = await call("POST", "/login", {"username": "lone", "password": "secret"})
+        assert (await call("GET", "/summary"))[0] == 401
+        assert await call("POST", "/expenses", {"category": "Food", "amount": 150}, login["token"]) == (
+            201, {"remaining_balance": 3350})
+        # an invalid date is refused before the balance is touched
+        for date in ("2026-10-99", 20231016):
+            assert (await call("POST", "/expenses", {"category": "Food", "amount": 50, "date": date},
+                               login["token"]))[0] == 400
+        assert app.users["lone"].remaining_balance == 3350
+        status, listing = await call("GET", "/expenses?category=Food", token=login["token"])
+        assert listing["expenses"][0]["amount"] == 150
+
+        # a malformed request is a 400, never a 500 or a dropped connection
+        for target in ("/expenses?offset=x", "/expenses?limit=-1"):
+            assert (await call("GET", target, token=login["token"]))[0] == 400
+        assert (await call("POST", "/expenses", [1, 2], login["token"]))[0] == 400
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"POST /login HTTP/1.1\r\nContent-Length: abc\r\n\r\n")
+        assert (await reader.read()).startswith(b"HTTP/1.1 400")
+        writer.close()
+        status, summary = await call("GET", "/summary", token=login["token"])
+        assert summary["categories"] == {"Food": 150}
+
+        # a session ends with its logout, its expiry, or when too many are open
+        assert await call("POST", "/logout", token=login["token"]) == (200, {})
+        assert (await call("GET", "/summary", token=login["token"]))[0] == 401
+        assert "lone" not in app.users and app.sessions == {}
+        app.max_sessions = 1
+        tokens = [(await call("POST", "/login", {"username": "lone", "password": "secret"}))[1]["token"]
+                  for _ in range(2)]
+        assert [(await call("GET", "/summary", token=token))[0] for token in tokens] == [401, 200]
+        app.sessions[tokens[1]] = ("lone", time.monotonic())
+        assert (await call("GET", "/summary", token=tokens[1]))[0] == 401
+        assert app.sessions == {} and app.users == {}
+        await app.stop()
+
+    asyncio.run(scenario())
+    assert info.load_user("lone")["_remaining_balance"] == 3350
+
+
+def test_write_behind_manager(tmp_path):
+    inner = InformationManager(str(tmp_path / "data.json"))
+    info = WriteBehindManager(inner, interval=60, max_pending=3)
+    info.save_user("lone", {"_expenses": {}, "_remaining_balance": 3500})
+    info.save_expense("lone", "Food", "2023-08-16", {"amount": 150, "notes": "lunch"})
+
+    # nothing is written until the window closes
+    assert inner.retrieve() == {}
+    assert info.load_user("lone")["_remaining_balance"] == 3350
+
+    # a full window is written at once, and what is left on close
+    for _ in range(3):
+        info.save_expense("lone", "Food", "2023-08-16", {"amount": 10, "notes": "snack"})
+    info.save_user("robert", {"_expenses": {}, "_remaining_balance": 100})
+    info.close()
+    assert inner.retrieve()["lone"]["_remaining_balance"] == 3320
+    assert "robert" in inner.retrieve()
+
+    # a failed write stays pending, and the background thread goes on
+    info = WriteBehindManager(inner, interval=0.01)
+    save_expenses = inner.save_expenses
+    inner.save_expenses = lambda *args: (_ for _ in ()).throw(OSError("disk full"))
+    info.save_expense("lone", "Food", "2023-08-17", {"amount": 20, "notes": "lunch"})
+    info.flush()
+    info.save_expense("lone", "Food", "2023-08-18", {"amount": 30, "notes": "dinner"})
+    time.sleep(0.05)
+    assert info._thread.is_alive() and inner.retrieve()["lone"]["_remaining_balance"] == 3320
+
+    # the background thread writes them once the storage works again
+    inner.save_expenses = save_expenses
+    for _ in range(100):
+        if inner.retrieve()["lone"]["_remaining_balance"] == 3270:
+            break
+        time.sleep(0.01)
+    assert inner.retrieve()["lone"]["_remaining_balance"] == 3270
+    info.close()
+
+
+def test_codecs(tmp_path):
+    data = {"lone": {"_expenses": {"Food": {"2023-08-16": [{"amount": 150, "notes": "lunch"}]}}}}
+    for format in ("json", "json-compact", "json-compact+zlib", "orjson+gzip", "msgpack"):
+        file_name = str(tmp_path / format)
+        InformationManager(file_name, Codec(format)).save(data)
+
+        # the format is detected on read
+        assert InformationManager(file_name).retrieve() == data
+
+    assert Codec("json-compact").encode({"a": [1]}) == b'{"a":[1]}'
+    with pytest.raises(ValueError):
+        Codec("yaml")
+    with pytest.raises(ValueError):
+        Codec.decode(b"\x78\x9cnot zlib")
+
+    # an empty file is an empty store, an unreadable one is never overwritten
+    info = InformationManager(str(tmp_path / "empty.json"))
+    assert info.retrieve() == {}
+    file_name = tmp_path / "truncated.json"
+    file_name.write_text('{"ann": {"_expenses": {}}, "bob": {"_exp')
+    with pytest.raises(CorruptDataError):
+        InformationManager(str(file_name)).save_user("cid", {"_expenses": {}})
+    with pytest.raises(CorruptDataError):
+        InformationManager(str(file_name)).load_user("bob")
+    assert file_name.read_text() == '{"ann": {"_expenses": {}}, "bob": {"_exp'
+
+
+def test_query():
+    user = BudgetBits("lone", "John", "Garan", 10000, {
+        "Food": {"2023-03-05": [{"amount": 150, "notes": "Grab lunch"}],
+                 "2023-07-01": [{"amount": 80, "notes": "snack"}]},
+        "Transportation": {"2023-04-10": [{"amount": 200, "notes": "grab ride"}],
+                           "2023-02-01": [{"amount": 40, "notes": "jeep"}]},
+    }, 9530, 8)
+    user.date = "2023-06-30"
+    user.expense_entry("Bills", 1000, "internet")
+
+    assert [row[1] for row in user.query("2023-03-01", "2023-06-30")] == ["2023-03-05", "2023-04-10", "2023-06-30"]
+    assert [row[3] for row in user.query(notes="GRAB")] == ["Grab lunch", "grab ride"]
+    assert [row[2] for row in user.query(categories={"Food", "Bills"}, min_amount=100)] == [150, 1000]
+    assert list(user.query(categories=["Leisure"])) == []
+    assert list(user.query(start="2024-01-01")) == []
+
+
+def test_budget_periods(freeze_today):
+    user = BudgetBits("lone", "John", "Garan", 3500, {
+        "Food": {"2023-07-31": [{"amount": 150, "notes": "lunch"}],
+                 "2023-08-02": [{"amount": 200, "notes": "groceries"}]},
+    }, 3150, 7)
+    user.date = "2024-07-01"
+    user.last_updated = 7
+
+    # a month number of an older record is the latest such month, and
+    # the same month of another year is still a new period
+    assert user.last_updated == "2024-07"
+    user.last_updated = "2023-07"
+    user.monthly_budget_update(lambda: 4000)
+    assert user.last_updated == "2024-07"
+    assert (user.monthly_budget, user.remaining_balance) == (4000, 4000)
+
+    # expenses of other periods do not change the current balance
+    user.expense_entry("Food", 100, "dinner", "2023-08-05")
+    assert user.remaining_balance == 4000
+    assert user.period_history() == [
+        {"period": "2024-07", "budget": 4000, "spent": 0, "remaining": 4000},
+        {"period": "2023-07", "budget": 3500, "spent": 150, "remaining": 3350},
+    ]
+    assert user.period_summary("2023-08")["spent"] == 300
+    assert existing_user(user.to_dict()).periods == {"2023-07": 3500}
+
+    # a saved month number is the same period for the storage as for BudgetBits
+    freeze_today("2023-10-05")
+    record = dict(user.to_dict(), last_updated=9, _remaining_balance=3500)
+    apply_expense(record, "Food", "2023-10-02", {"amount": 100, "notes": "lunch"})
+    apply_expense(record, "Food", "2023-09-02", {"amount": 100, "notes": "lunch"})
+    assert record["_remaining_balance"] == 3400 and existing_user(record).last_updated == "2023-09"
+
+
+def test_analytics():
+    user = BudgetBits("lone", "John", "Garan", 3000, {
+        "Food": {"2023-07-20": [{"amount": 700, "notes": "groceries"}],
+                 "2023-08-01": [{"amount": 100, "notes": "lunch"}],
+                 "2023-08-03": [{"amount": 200, "notes": "dinner"}]},
+        "Bills": {"2023-08-02": [{"amount": 300, "notes": "internet"}]},
+    }, 2400, "2023-08")
+    user.date = "2023-08-10"
+
+    # numpy (when installed) and pure python give the same figures
+    for analytics in (Analytics(user), Analytics(user, use_numpy=False)):
+        assert analytics.monthly_trend() == [("2023-07", 700), ("2023-08", 600)]
+        assert analytics.category_shares("2023-08") == [("Food", 300, 0.5), ("Bills", 300, 0.5)]
+        assert analytics.category_shares()[0] == ("Food", 1000, 1000 / 1300)
+        assert analytics.moving_average(window=2, days=3, today="2023-08-03") == [
+            ("2023-08-01", 100, 50.0), ("2023-08-02", 300, 200.0), ("2023-08-03", 200, 250.0)]
+        forecast = analytics.forecast()
+        assert (forecast["spent"], forecast["forecast"], forecast["forecast_remaining"]) == (600, 1860, 1140)
+        assert "END OF MONTH FORECAST" in analytics.report()
+
+    # the figures are a copy, so the user can still record expenses
+    analytics = Analytics(user)
+    user.expense_entry("Food", 50, "snack", "2023-08-04")
+    assert (len(analytics), user.remaining_balance) == (4, 2350)
+
+
+def test_benchmark_suite(tmp_path):
+    data = generate(str(tmp_path), users=3, transactions=40, categories=7, months=14)
+    assert InformationManager(str(tmp_path / "data.json")).retrieve() == data
+    assert len(InformationManager(str(tmp_path / "accounts.json")).retrieve()) == 3
+    assert len({category for record in data.values() for category in record["_expenses"]}) == 7
+    assert data["user0"]["last_updated"] == "2024-02"
+
+    results = run_suite(users=2, transactions=30, rounds=2)
+    assert set(results["benchmarks"]) == {"retrieve", "save", "existing_user", "expense_entry",
+                                          "display_expenses", "display_information", "login"}
+    assert compare(results, results) == []
+    slower = json.loads(json.dumps(results))
+    slower["benchmarks"]["save"]["median"] *= 2
+    assert [regression[0] for regression in compare(slower, results)] == ["save"]
+
+    # the start of the app does not import what only some features use
+    assert eager_imports("project") == eager_imports("cli") == []
+
+
+def test_instrument(monkeypatch):
+    def operation(value):
+        return value * 2
+
+    # off, the functions are left as they are
+    monkeypatch.setattr(instrument, "ENABLED", False)
+    assert instrument.timed("operation")(operation) is operation
+
+    monkeypatch.setattr(instrument, "ENABLED", True)
+    monkeypatch.setattr(instrument, "_stats", {})
+    timed_operation = instrument.timed("operation")(operation)
+    assert [timed_operation(i) for i in range(3)] == [0, 2, 4]
+    instrument.record("operation", 0.003)
+
+    stat = instrument.stats()["operation"]
+    assert stat["count"] == 4 and stat["max"] >= 0.003
+    assert sum(stat["histogram"].values()) == 4
+    assert stat["p99"] == 4096 / 1_000_000
+    assert "operation" in instrument.summary()
+
+
+def test_rollover(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "data").mkdir()
+    info = open_storage("sharded")
+    expenses = {"Food": {"2023-08-02": [{"amount": 500, "notes": "groceries"}],
+                         "2023-09-01": [{"amount": 100, "notes": "lunch"}]}}
+    for username in ("ann", "bob", "cid"):
+        info.save_user(username, BudgetBits(username, "John", "Garan", 3000, expenses, 2500, "2023-08").to_dict())
+    info.save_user("dee", BudgetBits("dee", "John", "Garan", 2000, {}, 2000, "2023-09", {"2023-08": 1000}).to_dict())
+
+    # cid was done by an interrupted run
+    (tmp_path / "data" / "rollover-2023-09.checkpoint").write_text('"cid"\n')
+    assert rollover.run_rollover("2023-09", carry_over=True, storage="sharded", workers=2, shard_size=1) == {
+        "users": 4, "skipped": 1, "rolled": 2, "failed": 0}
+
+    ann = existing_user(info.load_user("ann"))
+    assert (ann.last_updated, ann.monthly_budget, ann.remaining_balance) == ("2023-09", 5500, 5400)
+    assert ann.periods == {"2023-08": 3000} and ann.total_expenses() == 600
+    assert info.load_user("cid")["last_updated"] == "2023-08"
+
+    with open(tmp_path / "data" / "statements-2023-09.jsonl") as file:
+        statements = {statement["username"]: statement for statement in map(json.loads, file)}
+    assert statements["ann"]["spent"] == 500 and statements["ann"]["categories"] == {"Food": 500}
+    assert statements["dee"]["rolled"] is False and statements["dee"]["remaining"] == 1000
+
+    # everything is done: a rerun does nothing, and a new budget replaces the current one
+    assert rollover.run_rollover("2023-09", storage="sharded", workers=1)["skipped"] == 4
+    assert rollover.main(["--period", "2023-10", "--budget", "4,000", "--storage", "sharded", "--workers", "1"]) == 0
+    assert existing_user(info.load_user("bob")).remaining_balance == 4000
+    assert rollover.main(["--period", "October"]) == 1
+
+
+def test_search(tmp_path, monkeypatch):
+    user = BudgetBits("lone", "John", "Garan", 9700, {
+        "Transportation": {"2023-04-10": [{"amount": 200, "notes": "Grab ride to uni"}]},
+        "Food": {"2023-03-05": [{"amount": 150, "notes": "GrabFood lunch"}]},
+    }, 9530, None)
+    user.search("grab")
+    user.expense_entry("Transportation", 90, "grab ride home", "2023-03-01")
+    user.expense_entry("Food", 80, "snack", "2023-04-01")
+
+    # kept up to date by expense_entry, and in date order
+    assert [row[3] for row in user.search("grab ri*")] == ["grab ride home", "Grab ride to uni"]
+    assert [row[3] for row in user.search("GRAB*")] == ["grab ride home", "GrabFood lunch", "Grab ride to uni"]
+    assert [row[2] for row in user.search("food")] == [150, 80]
+    assert user.search("grab snack") == [] and user.search("") == []
+
+    # a saved index applies to the reloaded user, and is rebuilt once stale
+    indexes = IndexStore(str(tmp_path / "index"))
+    indexes.save("lone", user.index, user.store)
+    reloaded = existing_user(user.to_dict())
+    reloaded.index = indexes.load("lone", reloaded.store)
+    assert reloaded.search("grab ri*") == user.search("grab ri*")
+    reloaded.expense_entry("Leisure", 300, "movie")
+    reloaded = existing_user(reloaded.to_dict())
+    reloaded.index = indexes.load("lone", reloaded.store)
+    assert [row[3] for row in reloaded.search("mov*")] == ["movie"]
+
+    # the entries logged since the index was saved are indexed when it is loaded
+    indexes.save("lone", reloaded.index, reloaded.store)
+    added = [reloaded.expense_entry("Food", 40, "grab snack", "2023-03-05"),
+             reloaded.expense_entry("Gifts", 500, "flowers", "2023-04-02")]
+    indexes.log("lone", [expense[:2] for expense in added])
+    monkeypatch.setattr(ExpenseIndex, "build", None)
+    for compact_every in (1000, 2):
+        again = existing_user(reloaded.to_dict())
+        again.index = IndexStore(str(tmp_path / "index"), compact_every=compact_every).load("lone", again.store)
+        assert again.search("grab*") == reloaded.search("grab*")
+        assert [row[3] for row in again.search("flowers")] == ["flowers"]
+    # the second load saved the index again, with the logged entries
+    assert not os.path.exists(indexes.log_path("lone"))
+
+
+def test_recurring():
+    rule = RecurringRule("Bills", 100, "rent", "monthly", "2023-01-31")
+    assert [rule.next, (rule.advance(), rule.next)[1], (rule.advance(), rule.next)[1]] == [
+        "2023-01-31", "2023-02-28", "2023-03-31"]
+    weekdays = RecurringRule("Food", 10, "lunch", "cron * * 1-5", "2023-08-05")
+    assert weekdays.next == "2023-08-07"
+    assert RecurringRule("Food", 10, "", "0 9 1,15 * *", "2023-08-02").next == "2023-08-15"
+    with pytest.raises(ValueError):
+        RecurringRule("Food", 10, "", "cron 31 2 *", "2023-08-02")
+    with pytest.raises(ValueError):
+        RecurringRule("Food", 10, "", "yearly", "2023-08-02")
+
+    user = BudgetBits("lone", "John", "Garan", 3000, {}, 3000, "2023-08")
+    user.date = "2023-08-10"
+    user.add_recurring("Bills", 500, "rent", "monthly", "2023-07-15")
+    user.add_recurring("Food", 50, "coffee", "weekly", "2023-08-01", "2023-08-31")
+    # only the occurrences of this period are taken from the balance
+    assert user.total_expenses() == 600 and user.remaining_balance == 2900
+
+    # an idle user catches up in date order
+    user.date = "2023-12-31"
+    recorded = user.materialize_recurring()
+    assert [date for _, date, _ in recorded][:4] == ["2023-08-15", "2023-08-15", "2023-08-22", "2023-08-29"]
+    assert user.remaining_balance == 2900 - 500 - 150 and len(recorded) == 8
+    assert user.recurring[1].next is None
+
+    # the next period records what was left, and the rules are saved
+    user.roll_period("2023-09", 3000)
+    assert user.remaining_balance == 3000 - 500
+    reloaded = existing_user(user.to_dict())
+    assert [rule.next for rule in reloaded.recurring] == ["2024-01-15", None]
+    assert reloaded.materialize_recurring("2023-12-31") == []
+
+    # an occurrence over the budget stays due
+    user = BudgetBits("lone", "John", "Garan", 1000, {}, 1000, "2023-08")
+    user.date = "2023-08-03"
+    assert len(user.add_recurring("Bills", 400, "", "daily", "2023-08-01")) == 2
+    assert (user.remaining_balance, user.recurring[0].next) == (200, "2023-08-03")
+
+
+def test_json_stream(tmp_path):
+    file_name = str(tmp_path / "data.json")
+    data = {"ann": BudgetBits("ann", "John", "Garan", 3000, {
+                "Food": {"2023-08-02": [{"amount": 500, "notes": "{groceries]"}, {"amount": 3, "notes": ""}]}},
+                2497, "2023-08").to_dict(),
+            "bob": {"_expenses": {}, "_remaining_balance": 1000.25}}
+    InformationManager(file_name).save(data)
+
+    # One user is streamed out of the file, as json.load would read it
+    info = InformationManager(file_name)
+    assert info.load_user("bob") == data["bob"] and info.load_user("cid") is None
+    assert info.load_users(["ann", "cid"]) == {"ann": data["ann"]}
+    assert info.usernames() == ["ann", "bob"]
+
+    # Values split across chunks (a number, a string with brackets)
+    with open(file_name, 'r') as file:
+        stream = JsonStream(file, chunk_size=3)
+        assert {username: read_user(stream) for username in stream.iter_map()} == data
+
+    # Only the journal records of the loaded user are replayed
+    journal = JournalManager(file_name, compact_every=10)
+    journal.save_expense("ann", "Food", "2023-08-03", {"amount": 100, "notes": "lunch"})
+    journal.save_user("cid", {"_expenses": {}, "_remaining_balance": 0})
+    assert journal.load_user("ann")["_remaining_balance"] == 2397
+    assert journal.load_user("bob") == data["bob"]
+    assert sorted(journal.usernames()) == ["ann", "bob", "cid"]
+    journal.close()
+
+
+def test_budget_alerts(tmp_path, monkeypatch, capsys):
+    def unreachable(request, timeout):
+        raise OSError("Connection refused")
+
+    def broken(alert):
+        raise RuntimeError("broken sink")
+
+    monkeypatch.setattr("urllib.request.urlopen", unreachable)
+    user = BudgetBits("ann", "John", "Garan", 3000, {}, 3000, "2023-08",
+                      alerts={"thresholds": [50, 80, 100], "category_limits": {"Food": 800}, "pace": 5})
+    alerts = []
+    user.alerts.sinks = [broken, alerts.append, LogSink(str(tmp_path / "alerts.jsonl")),
+                         WebhookSink("http://budgetbits.invalid/alerts")]
+
+    # 50% of the Food limit, then both 80% and 100% of it with one entry
+    user.expense_entry("Food", 400, "groceries", "2023-08-01")
+    user.expense_entry("Food", 450, "dinner", "2023-08-02")
+    assert [(alert["kind"], alert["threshold"]) for alert in alerts] == [
+        ("category", 50), ("category", 80), ("category", 100)]
+
+    # 50% of the budget, over five times the daily pace (3000 / 31 a day)
+    alerts.clear()
+    user.expense_entry("Rent", 700, "", "2023-08-03")
+    assert [(alert["kind"], alert["threshold"]) for alert in alerts] == [("budget", 50), ("pace", 5)]
+    # an entry of another period, or under every threshold, raises nothing
+    alerts.clear()
+    user.expense_entry("Rent", 2000, "", "2023-07-31")
+    user.expense_entry("Misc", 10, "", "2023-08-04")
+    assert alerts == []
+
+    # the entry that would exceed the budget is refused, with an alert
+    with pytest.raises(ValueError):
+        user.expense_entry("Misc", 1500, "", "2023-08-04")
+    assert alerts[0]["kind"] == "refused" and alerts[0]["spent"] == 3060
+
+    with open(tmp_path / "alerts.jsonl") as file:
+        assert len(file.readlines()) == 6
+    # an unreachable webhook, or a failing sink, never fails an entry
+    err = capsys.readouterr().err
+    assert "Alert webhook" in err and "broken sink" in err
+
+    # the thresholds are saved with the user
+    assert existing_user(user.to_dict()).alerts.to_dict() == {
+        "thresholds": [50, 80, 100], "category_limits": {"Food": 800}, "pace": 5}
+
+
+def test_period_rollover_on_load(tmp_path, monkeypatch, capsys, freeze_today):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "data").mkdir()
+    freeze_today("2023-10-05")
+    info = open_storage()
+    expenses = {"Food": {"2023-09-10": [{"amount": 500, "notes": "groceries"}]}}
+    for username in ("lone", "bob"):
+        info.save_user(username, BudgetBits(username, "John", "Garan", 3500, expenses, 3000, "2023-09").to_dict())
+
+    # the batch mode starts the period of today (with the current budget) before anything else
+    assert cli.main(["add", "lone", "Food", "150", "--notes", "lunch"]) == 0
+    assert cli.main(["history", "lone"]) == 0
+    assert "2023-10" in capsys.readouterr().out
+    user = existing_user(info.load_user("lone"))
+    assert (user.last_updated, user.remaining_balance, user.periods) == ("2023-10", 3350, {"2023-09": 3500})
+
+    # a new budget set in a new month is the budget of the new period
+    assert cli.main(["set-budget", "bob", "4,000"]) == 0
+    user = existing_user(info.load_user("bob"))
+    assert (user.last_updated, user.monthly_budget, user.remaining_balance) == ("2023-10", 4000, 4000)
+    assert user.period_summary("2023-09") == {"period": "2023-09", "budget": 3500, "spent": 500, "remaining": 3000}
+
+    # recurring spending recorded ahead of a period can use up its whole budget
+    for username in ("dan", "eve"):
+        user = BudgetBits(username, "John", "Garan", 6000, {}, 6000, "2023-09")
+        user.date = "2023-09-01"
+        user.add_recurring("Bills", 5000, "rent", "monthly", "2023-09-01")
+        # the rent of October is recorded (at login) before the period is rolled
+        user.date = "2023-10-05"
+        user.materialize_recurring()
+        info.save_user(username, user.to_dict())
+    assert cli.main(["set-budget", "dan", "4,000"]) == 0
+    user = existing_user(info.load_user("dan"))
+    assert (user.last_updated, user.remaining_balance) == ("2023-10", -1000)
+    assert cli.main(["add", "dan", "Food", "10"]) == 1
+    assert cli.main(["history", "dan"]) == 0
+    user = existing_user(info.load_user("eve"))
+    user.materialize_recurring()
+    assert user.monthly_budget_update(lambda: 4000)["_remaining_balance"] == -1000
+
+    # a server session loaded on an earlier day catches up with the calendar,
+    # keeping what another process saved since
+    app = BudgetBitsServer(info)
+    info.save_user("cid", BudgetBits("cid", "John", "Garan", 3500, expenses, 3000, "2023-09").to_dict())
+    user = existing_user(info.load_user("cid"))
+    user.date = "2023-09-30"
+    app.users["cid"] = user
+    token = app.open_session("cid")
+    open_storage().save_expense("cid", "Food", "2023-09-30", {"amount": 100, "notes": "dinner"})
+    user = asyncio.run(app.session_user({"authorization": f"Bearer {token}"}))
+    assert (user.last_updated, user.period_summary("2023-09")["spent"]) == ("2023-10", 600)
+    app.info.close()
+    record = info.load_user("cid")
+    assert record["last_updated"] == "2023-10" and len(record["_expenses"]["Food"]) == 2
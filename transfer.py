@@ -0,0 +1,149 @@
+from project import parse_amount
+from itertools import islice
+from datetime import date
+import json
+import csv
+import os
+
+FIELDS = ["category", "date", "amount", "notes"]
+
+
+def file_format(path: str) -> str:
+    """Return the format ("csv" or "jsonl") of a file from its extension."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".csv":
+        return "csv"
+    elif extension in (".jsonl", ".ndjson"):
+        return "jsonl"
+    raise ValueError(f"Unsupported file '{path}'. Use a .csv or .jsonl file.")
+
+
+def read_rows(path: str):
+    """
+    Read the expense rows of a CSV or JSONL file, one at a time.
+
+    Args:
+        path (str): The path of the file.
+
+    Yields:
+        tuple: The (line number, row) of each expense, where row is a dict
+            with the category, date, amount and notes.
+    """
+    with open(path, 'r', newline='', encoding='utf-8') as file:
+        if file_format(path) == "csv":
+            # line 1 is the header
+            yield from enumerate(csv.DictReader(file), start=2)
+        else:
+            for line_number, line in enumerate(file, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    yield line_number, json.loads(line)
+                except json.JSONDecodeError as error:
+                    yield line_number, error
+
+
+def validate_row(row) -> tuple:
+    """
+    Validate an imported expense row.
+
+    Args:
+        row (dict): The category, date (ISO, optional), amount and notes (optional).
+
+    Returns:
+        tuple: The (category, amount, notes, date) of the expense.
+
+    Raises:
+        ValueError: If the row is not a valid expense.
+    """
+    if isinstance(row, Exception):
+        raise ValueError(f"Invalid row: {row}")
+    if not isinstance(row, dict):
+        raise ValueError(f"Invalid row: {json.dumps(row)} is not an object.")
+
+    category = str(row.get("category") or "").strip()
+    if not category:
+        raise ValueError("Category cannot be empty.")
+
+    amount = parse_amount(str(row.get("amount", "")))
+
+    expense_date = row.get("date")
+    if isinstance(expense_date, str):
+        expense_date = expense_date.strip() or None
+    if expense_date is not None:
+        # only YYYY-MM-DD (not a number, nor the other ISO forms fromisoformat takes)
+        try:
+            if not isinstance(expense_date, str) or date.fromisoformat(expense_date).isoformat() != expense_date:
+                raise ValueError
+        except ValueError:
+            raise ValueError(f"Invalid date '{expense_date}'. Use YYYY-MM-DD.")
+
+    return category, amount, str(row.get("notes") or ""), expense_date
+
+
+def import_expenses(user, path: str, info=None, batch_size: int = 1000, on_error=None) -> tuple:
+    """
+    Import the expenses of a CSV or JSONL file into a user's records.
+
+    The rows are read, validated and recorded one batch at a time, and each
+    batch is saved with a single write, so memory stays bounded whatever
+    the size of the file.
+
+    Args:
+        user (BudgetBits): The BudgetBits instance of the user.
+        path (str): The path of the file.
+        info (InformationManager, optional): The storage to save each batch to.
+        batch_size (int, optional): The number of rows of a batch. Defaults to 1000.
+        on_error (callable, optional): Called with (line number, message) for each invalid row.
+
+    Returns:
+        tuple: The number of (imported, failed) rows.
+    """
+    imported = failed = 0
+    # the rows of a file are seldom in date order: the date order of the
+    # expenses is sorted again once, when next queried
+    user.store.drop_order()
+    rows = read_rows(path)
+    while batch := list(islice(rows, batch_size)):
+        entries = []
+        for line_number, row in batch:
+            try:
+                category, amount, notes, expense_date = validate_row(row)
+                entries.append(user.expense_entry(category, amount, notes, expense_date))
+            except ValueError as message:
+                failed += 1
+                if on_error:
+                    on_error(line_number, str(message))
+
+        if entries and info is not None:
+            info.save_expenses(user.username, entries)
+        imported += len(entries)
+
+    return imported, failed
+
+
+def export_expenses(user, path: str, **filters) -> int:
+    """
+    Export a user's expenses, in date order, to a CSV or JSONL file.
+
+    Args:
+        user (BudgetBits): The BudgetBits instance of the user.
+        path (str): The path of the file.
+        **filters: The category, start and end of BudgetBits.iter_expenses.
+
+    Returns:
+        int: The number of exported rows.
+    """
+    exported = 0
+    with open(path, 'w', newline='', encoding='utf-8') as file:
+        if file_format(path) == "csv":
+            writer = csv.writer(file)
+            writer.writerow(FIELDS)
+            for row in user.iter_expenses(**filters):
+                writer.writerow(row)
+                exported += 1
+        else:
+            for row in user.iter_expenses(**filters):
+                file.write(json.dumps(dict(zip(FIELDS, row))) + "\n")
+                exported += 1
+    return exported